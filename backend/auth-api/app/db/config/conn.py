@@ -6,7 +6,16 @@ from utils.env_config import settings
 DATABASE_URL = settings.database_url
 
 #be able to talk to the database
-engine: AsyncEngine = create_async_engine(url=DATABASE_URL, echo=settings.debug, pool_pre_ping=True)
+engine: AsyncEngine = create_async_engine(
+    url=DATABASE_URL,
+    echo=settings.debug,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    connect_args={"prepared_statement_cache_size": settings.db_statement_cache_size}
+)
 
 # session factory
 async_session = async_sessionmaker(
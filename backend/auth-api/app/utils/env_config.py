@@ -15,6 +15,17 @@ class Settings(BaseSettings):
     db_port: str
     db_name: str
 
+    # connection pool, requests past pool_size + max_overflow wait up to pool_timeout seconds
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    # reopen connections older than this so idle ones dropped by the server aren't handed out
+    db_pool_recycle: int = 1800
+    # one round trip on every checkout to catch dead connections
+    db_pool_pre_ping: bool = True
+    # asyncpg prepared statements kept per connection, 0 disables the cache
+    db_statement_cache_size: int = 256
+
     # Database connection string
     @property
     def database_url(self) -> str:
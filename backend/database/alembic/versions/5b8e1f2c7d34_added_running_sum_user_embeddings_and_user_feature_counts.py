@@ -0,0 +1,98 @@
+"""added running sum user embeddings, rating_sum and user_feature_counts table for incremental user updates
+
+Revision ID: 5b8e1f2c7d34
+Revises: 368274c15ee4
+Create Date: 2026-10-18 21:10:42.318274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import pgvector.sqlalchemy
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e1f2c7d34'
+down_revision: Union[str, Sequence[str], None] = '368274c15ee4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_embeddings', sa.Column('embedding_sum', pgvector.sqlalchemy.vector.VECTOR(dim=512), nullable=True))
+    op.add_column('user_embeddings', sa.Column('embedding_count', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('user_rating_stats', sa.Column('rating_sum', sa.REAL(), server_default='0.0', nullable=True))
+    op.create_table('user_feature_counts',
+    sa.Column('user_id', sa.Text(), nullable=False),
+    sa.Column('feature_type', sa.Text(), nullable=False),
+    sa.Column('feature', sa.Text(), nullable=False),
+    sa.Column('count', sa.Integer(), server_default='0', nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user_login.user_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'feature_type', 'feature')
+    )
+    op.create_index('idx_user_feature_counts_top', 'user_feature_counts', ['user_id', 'feature_type', sa.text('count DESC')], unique=False)
+
+    # backfill the running sums from the existing ratings, users that have ratings but no
+    # user embedding yet get one so later deltas start from their full history
+    op.execute("""
+        INSERT INTO user_embeddings (user_id, embedding, embedding_sum, embedding_count, last_updated)
+        SELECT r.user_id, l2_normalize(SUM(e.embedding)), SUM(e.embedding), COUNT(*), NOW()
+        FROM user_watchlist r
+        JOIN movie_embedding_personalized_prod e ON r.movie_id = e.movie_id
+        WHERE r.user_rating > 0
+        GROUP BY r.user_id
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            embedding_sum = EXCLUDED.embedding_sum,
+            embedding_count = EXCLUDED.embedding_count
+    """)
+    op.execute("""
+        UPDATE user_rating_stats urs
+        SET
+            rating_sum = s.rating_sum,
+            rating_count = s.rating_count,
+            avg_rating = s.rating_sum / s.rating_count,
+            rating_count_log = LN(s.rating_count + 1)
+        FROM (
+            SELECT user_id, SUM(user_rating) AS rating_sum, COUNT(*) AS rating_count
+            FROM user_watchlist
+            WHERE user_rating > 0
+            GROUP BY user_id
+        ) s
+        WHERE urs.user_id = s.user_id
+    """)
+    op.execute("""
+        INSERT INTO user_feature_counts (user_id, feature_type, feature, count)
+        SELECT user_id, feature_type, feature, COUNT(*)
+        FROM (
+            SELECT uw.user_id, 'genre' AS feature_type, f.feature
+            FROM user_watchlist uw
+            JOIN movie_metadata m ON uw.movie_id = m.movie_id
+            CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(m.genres)) f(feature)
+            WHERE uw.user_rating > 0
+            UNION ALL
+            SELECT uw.user_id, 'actor', f.feature
+            FROM user_watchlist uw
+            JOIN movie_metadata m ON uw.movie_id = m.movie_id
+            CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(m.actors)) f(feature)
+            WHERE uw.user_rating > 0
+            UNION ALL
+            SELECT uw.user_id, 'director', f.feature
+            FROM user_watchlist uw
+            JOIN movie_metadata m ON uw.movie_id = m.movie_id
+            CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(m.director)) f(feature)
+            WHERE uw.user_rating > 0
+        ) features
+        GROUP BY user_id, feature_type, feature
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_user_feature_counts_top', table_name='user_feature_counts')
+    op.drop_table('user_feature_counts')
+    op.drop_column('user_rating_stats', 'rating_sum')
+    op.drop_column('user_embeddings', 'embedding_count')
+    op.drop_column('user_embeddings', 'embedding_sum')
@@ -0,0 +1,155 @@
+# Benchmark of loading movie embeddings into a staging table, the way the update movie tables
+# lambda does, at 10k and 64k rows (the large dataset) against a local Postgres + pgvector
+# (docker compose up db in backend/database)
+#
+# "insert per row" is the previous loader: one INSERT ... %s::vector per movie into a table
+# whose HNSW index is kept up to date on every insert. The COPY rows stream every row in one
+# statement, "index kept" into the indexed table and the others with the HNSW index dropped
+# and built once after the load, "binary copy + rebuild" is load_embeddings_to_staging and
+# build_staging_hnsw_index (a concurrent build, outside the load's transaction).
+#
+# The tables are created in a throwaway bench_embedding_loader schema with the same primary
+# key, foreign key and HNSW index (m=16, ef_construction=64) as the real staging tables, plus
+# an empty production table the concurrent build copies the index definition from
+#
+# run from the backend/database directory:
+#   uv run python benchmarks/embedding_loader_benchmark.py [--rows 10000,64000] [--skip-insert]
+import io
+import os
+import sys
+import time
+import numpy as np
+import polars as pl
+import psycopg2
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.load_embeddings_to_staging import build_staging_hnsw_index, get_hnsw_indexes, load_embeddings_to_staging  # noqa: E402
+from utils.pg_copy import copy_embeddings  # noqa: E402
+
+SCHEMA = "bench_embedding_loader"
+TABLE = f"{SCHEMA}.movie_embedding_staging"
+PROD_TABLE = f"{SCHEMA}.movie_embedding_prod"
+DIM = 512
+
+def connect():
+    return psycopg2.connect(
+        host=os.environ.get("DB_HOST", "localhost"),
+        port=os.environ.get("DB_PORT", "5432"),
+        dbname=os.environ.get("DB_NAME", "example_db"),
+        user=os.environ.get("DB_USERNAME", "postgres"),
+        password=os.environ.get("DB_PASSWORD", "password")
+    )
+
+def create_tables(cursor, movie_ids):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.movie_metadata (movie_id TEXT PRIMARY KEY)")
+    cursor.execute(f"""
+        CREATE TABLE {TABLE} (
+            movie_id TEXT PRIMARY KEY REFERENCES {SCHEMA}.movie_metadata (movie_id) ON DELETE CASCADE,
+            embedding vector({DIM}) NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        CREATE INDEX idx_bench_staging_hnsw ON {TABLE}
+        USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)
+    """)
+    cursor.execute(f"CREATE TABLE {PROD_TABLE} (LIKE {TABLE} INCLUDING INDEXES)")
+    cursor.copy_expert(
+        f"COPY {SCHEMA}.movie_metadata (movie_id) FROM STDIN",
+        io.BytesIO("".join(f"{movie_id}\n" for movie_id in movie_ids).encode())
+    )
+
+# previous loader, kept here to compare against
+def insert_per_row(cursor, metadata_df, embeddings):
+    cursor.execute(f"TRUNCATE TABLE {TABLE}")
+    for idx, row in enumerate(metadata_df.iter_rows(named=True)):
+        cursor.execute(f"""
+            INSERT INTO {TABLE} (movie_id, embedding)
+            VALUES (%s, %s::vector)
+        """, (str(row['tmdbId']), embeddings[idx].tolist()))
+
+def copy_index_kept(cursor, metadata_df, embeddings):
+    cursor.execute(f"TRUNCATE TABLE {TABLE}")
+    copy_embeddings(cursor, TABLE, [str(movie_id) for movie_id in metadata_df['tmdbId'].to_list()], embeddings)
+
+def text_copy_rebuild(cursor, metadata_df, embeddings):
+    cursor.execute("DROP INDEX IF EXISTS bench_embedding_loader.idx_bench_staging_hnsw")
+    cursor.execute(f"TRUNCATE TABLE {TABLE}")
+    copy_embeddings(cursor, TABLE, [str(movie_id) for movie_id in metadata_df['tmdbId'].to_list()], embeddings, binary=False, freeze=True)
+    cursor.execute("SET LOCAL maintenance_work_mem = '512MB'")
+    cursor.execute("SET LOCAL max_parallel_maintenance_workers = 2")
+    cursor.execute(f"""
+        CREATE INDEX idx_bench_staging_hnsw ON {TABLE}
+        USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)
+    """)
+
+def binary_copy_rebuild(cursor, metadata_df, embeddings):
+    load_embeddings_to_staging(cursor, metadata_df["tmdbId"].to_list(), embeddings, "movie_embedding_staging")
+    cursor.connection.commit()
+
+    cursor.connection.autocommit = True
+    build_staging_hnsw_index(cursor, "movie_embedding_staging", "movie_embedding_prod")
+    cursor.connection.autocommit = False
+
+METHODS = [
+    ("insert per row", insert_per_row),
+    ("binary copy, index kept", copy_index_kept),
+    ("text copy + rebuild", text_copy_rebuild),
+    ("binary copy + rebuild", binary_copy_rebuild),
+]
+
+def run(method, conn, metadata_df, embeddings):
+    cursor = conn.cursor()
+    # the loader looks the table up by name in pg_indexes, keep it in the benchmark schema
+    cursor.execute(f"SET search_path = {SCHEMA}, public")
+    start = time.perf_counter()
+    # without the loader's progress lines
+    with redirect_stdout(io.StringIO()):
+        method(cursor, metadata_df, embeddings)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+
+    cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+    count = cursor.fetchone()[0]
+    hnsw_indexes = len(get_hnsw_indexes(cursor, TABLE))
+    cursor.close()
+
+    return elapsed, count, hnsw_indexes
+
+def main():
+    row_counts = [int(rows) for rows in sys.argv[sys.argv.index("--rows") + 1].split(",")] if "--rows" in sys.argv else [10000, 64000]
+    skip_insert = "--skip-insert" in sys.argv
+
+    conn = connect()
+
+    print(f"{'rows':>6} | {'method':>24} | {'seconds':>8} | {'rows/s':>8} | loaded")
+    print("-" * 68)
+    for rows in row_counts:
+        rng = np.random.default_rng(rows)
+        embeddings = rng.normal(size=(rows, DIM)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        metadata_df = pl.DataFrame({"tmdbId": np.arange(1, rows + 1) * 7})
+
+        cursor = conn.cursor()
+        create_tables(cursor, metadata_df['tmdbId'].to_list())
+        conn.commit()
+        cursor.close()
+
+        for name, method in METHODS:
+            if skip_insert and method is insert_per_row:
+                continue
+
+            elapsed, count, hnsw_indexes = run(method, conn, metadata_df, embeddings)
+            print(f"{rows:>6} | {name:>24} | {elapsed:>8.2f} | {rows / elapsed:>8.0f} | {count} rows, {hnsw_indexes} hnsw index")
+
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    main()
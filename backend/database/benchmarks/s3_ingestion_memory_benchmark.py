@@ -0,0 +1,183 @@
+# Benchmark of the peak memory of the update movie tables lambda while it ingests each S3 file,
+# downloading the whole object into a BytesIO and parsing it (the previous handler) against
+# the streaming path (CSV spooled to disk and upserted in polars batches, .npy read off the
+# S3 body in row batches while it is copied), on a synthetic catalogue against a local
+# Postgres + pgvector (docker compose up db in backend/database)
+#
+# Each run is a fresh process, the number reported is how far its peak RSS (VmHWM, linux
+# only) grew over the RSS it had after the imports. The S3 files are served from a temp directory by LocalS3,
+# which hands out the same botocore StreamingBody a real get_object returns. The tables are
+# the throwaway bench_upsert ones of upsert_benchmark.py plus an embedding staging table
+# without the HNSW index, its build is the same for both paths and not part of ingestion.
+# Every run is rolled back
+#
+# run from the backend/database directory:
+#   uv run python benchmarks/s3_ingestion_memory_benchmark.py [--rows 64000]
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import polars as pl
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from update_movie_table_lambda_handler import load_embedding_movie_ids  # noqa: E402
+from upsert_benchmark import SCHEMA, catalogue, connect, create_tables  # noqa: E402
+from utils.load_embeddings_to_staging import load_embeddings_to_staging  # noqa: E402
+from utils.s3_stream import iter_csv_batches, open_npy_s3, spooled_s3_object  # noqa: E402
+from utils.upsert_movie_metadata_table import upsert_movie_metadata  # noqa: E402
+from utils.upsert_movie_rating_stats import upsert_movie_rating_stats  # noqa: E402
+
+DIM = 512
+BUCKET = "bench"
+METADATA_KEY = "movie_metadata/production/bench/movie_metadata.csv"
+RATINGS_KEY = "movie_ratings/production/bench/movie_rating_stats.csv"
+EMBEDDINGS_KEY = "movie_embeddings/cold_start/production/bench/movie_embeddings_coldstart.npy"
+
+# get_object and download_fileobj of an S3 client, over files in a directory
+class LocalS3:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_object(self, Bucket, Key):
+        path = os.path.join(self.directory, Key)
+        if not os.path.exists(path):
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject")
+
+        return {"Body": StreamingBody(open(path, "rb"), os.path.getsize(path))}
+
+    def download_fileobj(self, bucket, key, fileobj):
+        with open(os.path.join(self.directory, key), "rb") as file:
+            shutil.copyfileobj(file, fileobj)
+
+# previous handler, kept here to compare against
+def download_from_s3(s3_client, bucket, key):
+    buffer = io.BytesIO()
+    s3_client.download_fileobj(bucket, key, buffer)
+    buffer.seek(0)
+    return buffer
+
+def metadata_download(cursor, s3_client):
+    upsert_movie_metadata(cursor, pl.read_csv(download_from_s3(s3_client, BUCKET, METADATA_KEY)))
+
+def metadata_stream(cursor, s3_client):
+    with spooled_s3_object(s3_client, BUCKET, METADATA_KEY) as path:
+        upsert_movie_metadata(cursor, iter_csv_batches(path))
+
+def ratings_download(cursor, s3_client):
+    upsert_movie_rating_stats(cursor, pl.read_csv(download_from_s3(s3_client, BUCKET, RATINGS_KEY)))
+
+def ratings_stream(cursor, s3_client):
+    with spooled_s3_object(s3_client, BUCKET, RATINGS_KEY) as path:
+        upsert_movie_rating_stats(cursor, iter_csv_batches(path))
+
+def embeddings_download(cursor, s3_client):
+    embeddings = np.load(download_from_s3(s3_client, BUCKET, EMBEDDINGS_KEY))
+    metadata_df = pl.read_csv(download_from_s3(s3_client, BUCKET, METADATA_KEY))
+    load_embeddings_to_staging(cursor, metadata_df["tmdbId"].to_list(), embeddings, "movie_embedding_staging")
+
+def embeddings_stream(cursor, s3_client):
+    movie_ids = load_embedding_movie_ids(s3_client, BUCKET, EMBEDDINGS_KEY, "bench")
+    load_embeddings_to_staging(cursor, movie_ids, open_npy_s3(s3_client, BUCKET, EMBEDDINGS_KEY), "movie_embedding_staging")
+
+METHODS = {
+    "metadata csv, download": metadata_download,
+    "metadata csv, stream": metadata_stream,
+    "ratings csv, download": ratings_download,
+    "ratings csv, stream": ratings_stream,
+    "embeddings npy, download": embeddings_download,
+    "embeddings npy, stream": embeddings_stream,
+}
+
+# VmRSS / VmHWM (peak) of this process in MB
+def rss_mb(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(f"{field}:"):
+                return int(line.split()[1]) / 1024
+
+# One method in this process, prints "<peak rss growth MB> <seconds>"
+def run_child(name, directory):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(f"SET search_path = {SCHEMA}, public")
+    # a child starts with the peak of the process that forked it, reset it to the current RSS
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    baseline = rss_mb("VmRSS")
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        METHODS[name](cursor, LocalS3(directory))
+    elapsed = time.perf_counter() - start
+
+    conn.rollback()
+    conn.close()
+    print(f"{rss_mb('VmHWM') - baseline:.1f} {elapsed:.2f}")
+
+def write_files(directory, rows):
+    rng = np.random.default_rng(rows)
+    metadata_df, rating_stats_df = catalogue(rows, rng)
+    embeddings = rng.normal(size=(rows, DIM)).astype(np.float32)
+
+    for key in (METADATA_KEY, RATINGS_KEY, EMBEDDINGS_KEY):
+        os.makedirs(os.path.join(directory, os.path.dirname(key)), exist_ok=True)
+    metadata_df.write_csv(os.path.join(directory, METADATA_KEY))
+    rating_stats_df.write_csv(os.path.join(directory, RATINGS_KEY))
+    np.save(os.path.join(directory, EMBEDDINGS_KEY), embeddings)
+    with open(os.path.join(directory, os.path.dirname(EMBEDDINGS_KEY), "movie_ids.txt"), "w") as file:
+        file.write("\n".join(str(movie_id) for movie_id in metadata_df["tmdbId"].to_list()))
+
+    return metadata_df
+
+def main():
+    if "--child" in sys.argv:
+        run_child(sys.argv[sys.argv.index("--child") + 1], sys.argv[sys.argv.index("--child") + 2])
+        return
+
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 64000
+
+    with tempfile.TemporaryDirectory() as directory:
+        metadata_df = write_files(directory, rows)
+
+        # metadata the embeddings reference, committed so every run sees it
+        conn = connect()
+        cursor = conn.cursor()
+        create_tables(cursor)
+        cursor.execute(f"""
+            CREATE TABLE movie_embedding_staging (
+                movie_id TEXT PRIMARY KEY REFERENCES movie_metadata (movie_id) ON DELETE CASCADE,
+                embedding vector({DIM}) NOT NULL
+            )
+        """)
+        with redirect_stdout(io.StringIO()):
+            upsert_movie_metadata(cursor, metadata_df)
+        conn.commit()
+
+        print(f"{rows} rows, files: " + ", ".join(
+            f"{os.path.basename(key)} {os.path.getsize(os.path.join(directory, key)) / 2**20:.0f}MB"
+            for key in (METADATA_KEY, RATINGS_KEY, EMBEDDINGS_KEY)
+        ))
+        print(f"{'method':>26} | {'peak rss +MB':>12} | {'seconds':>8}")
+        print("-" * 54)
+        for name in METHODS:
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", name, directory],
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            print(f"{name:>26} | {float(output[0]):>12.1f} | {float(output[1]):>8.2f}")
+
+        cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Benchmark of how the staging <-> production embedding table swap disrupts recommendation
+# queries, against a local Postgres + pgvector (docker compose up db in backend/database)
+#
+# Reader threads run the cosine ANN query the API serves from the production table in a loop
+# while the tables are swapped. Just before the swap a long running read transaction on the
+# production table starts (an analytics query, a slow request) and holds its lock for
+# --hold seconds. "rename in transaction" is the previous swap: the renames queue behind the
+# long read for its ACCESS EXCLUSIVE lock and every query arriving after them queues behind
+# the renames. "lock_timeout + retry" is swap_tables with a 200ms lock_timeout
+#
+# The tables are created in a throwaway bench_table_swap schema with the same primary key,
+# foreign key and HNSW index (m=16, ef_construction=64) as the real ones
+#
+# run from the backend/database directory:
+#   uv run python benchmarks/table_swap_benchmark.py [--rows 10000] [--hold 3]
+import io
+import os
+import sys
+import threading
+import time
+import numpy as np
+import psycopg2
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.pg_copy import copy_embeddings  # noqa: E402
+from utils.swap_tables import swap_tables  # noqa: E402
+
+SCHEMA = "bench_table_swap"
+STAGING_TABLE = "movie_embedding_staging"
+PROD_TABLE = "movie_embedding_prod"
+DIM = 512
+READERS = 4
+
+def connect():
+    conn = psycopg2.connect(
+        host=os.environ.get("DB_HOST", "localhost"),
+        port=os.environ.get("DB_PORT", "5432"),
+        dbname=os.environ.get("DB_NAME", "example_db"),
+        user=os.environ.get("DB_USERNAME", "postgres"),
+        password=os.environ.get("DB_PASSWORD", "password")
+    )
+    with conn.cursor() as cursor:
+        cursor.execute(f"SET search_path = {SCHEMA}, public")
+    conn.commit()
+
+    return conn
+
+def create_tables(conn, rows):
+    rng = np.random.default_rng(rows)
+    movie_ids = [str(movie_id) for movie_id in range(1, rows + 1)]
+
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path = {SCHEMA}, public")
+    cursor.execute("CREATE TABLE movie_metadata (movie_id TEXT PRIMARY KEY)")
+    cursor.copy_expert("COPY movie_metadata (movie_id) FROM STDIN", io.BytesIO("".join(f"{movie_id}\n" for movie_id in movie_ids).encode()))
+
+    for table in (PROD_TABLE, STAGING_TABLE):
+        embeddings = rng.normal(size=(rows, DIM)).astype(np.float32)
+        cursor.execute(f"""
+            CREATE TABLE {table} (
+                movie_id TEXT PRIMARY KEY REFERENCES movie_metadata (movie_id) ON DELETE CASCADE,
+                embedding vector({DIM}) NOT NULL
+            )
+        """)
+        copy_embeddings(cursor, table, movie_ids, embeddings)
+        cursor.execute(f"""
+            CREATE INDEX idx_{table}_hnsw ON {table}
+            USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)
+        """)
+        cursor.execute(f"ANALYZE {table}")
+    conn.commit()
+    cursor.close()
+
+# previous swap, kept here to compare against
+def rename_in_transaction(cursor):
+    temp_table = f"{PROD_TABLE}_temp"
+    cursor.execute(f"ALTER TABLE {PROD_TABLE} RENAME TO {temp_table}")
+    cursor.execute(f"ALTER TABLE {STAGING_TABLE} RENAME TO {PROD_TABLE}")
+    cursor.execute(f"ALTER TABLE {temp_table} RENAME TO {STAGING_TABLE}")
+    cursor.connection.commit()
+
+def lock_timeout_retry(cursor):
+    swap_tables(cursor, STAGING_TABLE, PROD_TABLE, lock_timeout="200ms", retries=20, retry_delay_seconds=0.1)
+
+METHODS = [
+    ("rename in transaction", rename_in_transaction),
+    ("lock_timeout + retry", lock_timeout_retry),
+]
+
+# ANN queries on the production table until stop is set, appends each latency in seconds
+def read_loop(stop, latencies):
+    conn = connect()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    query_vector = "[" + ",".join(["0.1"] * DIM) + "]"
+
+    while not stop.is_set():
+        start = time.perf_counter()
+        cursor.execute(
+            f"SELECT movie_id FROM {PROD_TABLE} ORDER BY embedding <=> %s::vector LIMIT 20",
+            (query_vector,)
+        )
+        cursor.fetchall()
+        latencies.append(time.perf_counter() - start)
+
+    conn.close()
+
+def hold_lock(seconds, started):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT movie_id FROM {PROD_TABLE} LIMIT 1")
+    started.set()
+    time.sleep(seconds)
+    conn.commit()
+    conn.close()
+
+def run(method, hold_seconds):
+    stop = threading.Event()
+    latencies = [[] for _ in range(READERS)]
+    readers = [threading.Thread(target=read_loop, args=(stop, reader_latencies)) for reader_latencies in latencies]
+    for reader in readers:
+        reader.start()
+    # steady state before the swap
+    time.sleep(1)
+    for reader_latencies in latencies:
+        reader_latencies.clear()
+
+    started = threading.Event()
+    holder = threading.Thread(target=hold_lock, args=(hold_seconds, started))
+    holder.start()
+    started.wait()
+
+    conn = connect()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        method(conn.cursor())
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    holder.join()
+    # queries after the swap, on the swapped in table
+    time.sleep(1)
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    all_latencies = np.array([latency for reader_latencies in latencies for latency in reader_latencies]) * 1000
+    return elapsed, all_latencies
+
+def main():
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 10000
+    hold_seconds = float(sys.argv[sys.argv.index("--hold") + 1]) if "--hold" in sys.argv else 3.0
+
+    conn = connect()
+    create_tables(conn, rows)
+
+    print(f"{rows} rows, a read transaction holds {PROD_TABLE} for {hold_seconds:.1f}s, {READERS} readers")
+    print(f"{'method':>22} | {'swap s':>6} | {'queries':>7} | {'p50 ms':>7} | {'p99 ms':>7} | {'max ms':>7} | >100ms")
+    print("-" * 82)
+    for name, method in METHODS:
+        elapsed, latencies = run(method, hold_seconds)
+        print(
+            f"{name:>22} | {elapsed:>6.2f} | {len(latencies):>7} | {np.percentile(latencies, 50):>7.1f} | "
+            f"{np.percentile(latencies, 99):>7.1f} | {latencies.max():>7.1f} | {int((latencies > 100).sum())}"
+        )
+
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# Benchmark of the movie_metadata and movie_rating_stats upserts of the update movie tables
+# lambda, per row upserts (the previous implementation) against the COPY + one INSERT ... SELECT
+# path, on a synthetic catalogue against a local Postgres (docker compose up db in
+# backend/database). Each path loads the catalogue into empty tables ("initial") and then
+# applies a refresh of the same catalogue where 5% of the movies changed ("refresh")
+#
+# The tables are created in a throwaway bench_upsert schema with the same columns, keys and
+# genres GIN index as the real ones, search_path points the upserts at them
+#
+# run from the backend/database directory:
+#   uv run python benchmarks/upsert_benchmark.py [--rows 64000]
+import io
+import os
+import sys
+import time
+import numpy as np
+import polars as pl
+import psycopg2
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.upsert_movie_metadata_table import upsert_movie_metadata  # noqa: E402
+from utils.upsert_movie_rating_stats import upsert_movie_rating_stats  # noqa: E402
+
+SCHEMA = "bench_upsert"
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Drama", "Fantasy", "Horror", "Romance", "Thriller"]
+
+def connect():
+    return psycopg2.connect(
+        host=os.environ.get("DB_HOST", "localhost"),
+        port=os.environ.get("DB_PORT", "5432"),
+        dbname=os.environ.get("DB_NAME", "example_db"),
+        user=os.environ.get("DB_USERNAME", "postgres"),
+        password=os.environ.get("DB_PASSWORD", "password")
+    )
+
+def create_tables(cursor):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path = {SCHEMA}, public")
+    cursor.execute("""
+        CREATE TABLE movie_metadata (
+            movie_id TEXT PRIMARY KEY,
+            movie_name TEXT NOT NULL,
+            genres TEXT[] NOT NULL,
+            release_date INTEGER NOT NULL,
+            summary TEXT NOT NULL,
+            actors TEXT[] NOT NULL,
+            director TEXT[] NOT NULL,
+            language TEXT,
+            poster_path TEXT DEFAULT ''
+        )
+    """)
+    cursor.execute("CREATE INDEX idx_bench_movie_metadata_genres ON movie_metadata USING gin (genres)")
+    cursor.execute("""
+        CREATE TABLE movie_rating_stats (
+            movie_id TEXT PRIMARY KEY REFERENCES movie_metadata (movie_id) ON DELETE CASCADE,
+            avg_rating REAL DEFAULT 0.0,
+            rating_count INTEGER DEFAULT 0,
+            rating_count_log REAL DEFAULT 0.0,
+            tmdb_avg_rating REAL DEFAULT 0.0,
+            tmdb_vote_log REAL DEFAULT 0.0,
+            tmdb_popularity REAL DEFAULT 0.0,
+            last_updated TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+def catalogue(rows, rng):
+    genres = rng.integers(0, len(GENRES), size=(rows, 3))
+    metadata_df = pl.DataFrame({
+        "tmdbId": np.arange(1, rows + 1),
+        "title": [f"Movie {i}" for i in range(rows)],
+        "genres_normalized": ["|".join(GENRES[g] for g in row) for row in genres],
+        "year": rng.integers(1920, 2025, size=rows),
+        "overview": [f"Overview of movie {i}, " + "a long plot summary " * 10 for i in range(rows)],
+        "cast_normalized": [f"Actor {i}|Actor {i + 1}|Actor {i + 2}|Actor {i + 3}|Actor {i + 4}" for i in range(rows)],
+        "director": [f"Director {i % 5000}" for i in range(rows)],
+        "original_language": ["en"] * rows,
+        "poster_path": [f"/poster{i}.jpg" for i in range(rows)],
+    })
+    rating_stats_df = pl.DataFrame({
+        "movie_id": np.arange(1, rows + 1),
+        "vote_average": np.round(rng.uniform(1, 10, size=rows), 1),
+        "vote_count": np.round(rng.uniform(0, 10, size=rows), 3),
+        "popularity": np.round(rng.uniform(0, 100, size=rows), 3),
+    })
+
+    return metadata_df, rating_stats_df
+
+# 5% of the movies get a new overview and new tmdb stats
+def refreshed(metadata_df, rating_stats_df, rng):
+    changed = pl.Series(rng.random(len(metadata_df)) < 0.05)
+
+    return (
+        metadata_df.with_columns(pl.when(changed).then(pl.col("overview") + " (updated)").otherwise(pl.col("overview")).alias("overview")),
+        rating_stats_df.with_columns(pl.when(changed).then(pl.col("popularity") + 1).otherwise(pl.col("popularity")).alias("popularity")),
+    )
+
+# previous implementation, kept here to compare against
+def upsert_per_row(cursor, metadata_df, rating_stats_df):
+    for row in metadata_df.iter_rows(named=True):
+        cursor.execute("""
+            INSERT INTO movie_metadata (
+                movie_id, movie_name, genres, release_date, summary, actors, director, language, poster_path
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (movie_id) DO UPDATE SET
+                movie_name = EXCLUDED.movie_name,
+                genres = EXCLUDED.genres,
+                release_date = EXCLUDED.release_date,
+                summary = EXCLUDED.summary,
+                actors = EXCLUDED.actors,
+                director = EXCLUDED.director,
+                language = EXCLUDED.language,
+                poster_path = EXCLUDED.poster_path
+        """, (
+            str(row['tmdbId']), row['title'], row['genres_normalized'].split("|"), int(row['year']), row['overview'],
+            row['cast_normalized'].split("|"), row['director'].split("|"), row.get('original_language'), row.get('poster_path', '')
+        ))
+
+    for row in rating_stats_df.iter_rows(named=True):
+        cursor.execute("""
+            INSERT INTO movie_rating_stats (
+                movie_id, tmdb_avg_rating, tmdb_vote_log, tmdb_popularity
+            )
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (movie_id) DO UPDATE SET
+                tmdb_avg_rating = EXCLUDED.tmdb_avg_rating,
+                tmdb_vote_log = EXCLUDED.tmdb_vote_log,
+                tmdb_popularity = EXCLUDED.tmdb_popularity,
+                last_updated = NOW()
+        """, (str(row['movie_id']), float(row['vote_average']), float(row['vote_count']), float(row['popularity'])))
+
+def upsert_bulk(cursor, metadata_df, rating_stats_df):
+    upsert_movie_metadata(cursor, metadata_df)
+    upsert_movie_rating_stats(cursor, rating_stats_df)
+
+def run(conn, method, metadata_df, rating_stats_df):
+    cursor = conn.cursor()
+    cursor.execute(f"SET search_path = {SCHEMA}, public")
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        method(cursor, metadata_df, rating_stats_df)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+
+    # rows updated in the benchmark tables so far, the initial load only inserts (pg 15+)
+    cursor.execute("SELECT pg_stat_force_next_flush()")
+    cursor.execute(f"SELECT COALESCE(SUM(n_tup_upd), 0) FROM pg_stat_user_tables WHERE schemaname = '{SCHEMA}'")
+    updated = cursor.fetchone()[0]
+    cursor.close()
+
+    return elapsed, updated
+
+def main():
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 64000
+    rng = np.random.default_rng(0)
+    metadata_df, rating_stats_df = catalogue(rows, rng)
+    refreshed_metadata_df, refreshed_rating_stats_df = refreshed(metadata_df, rating_stats_df, rng)
+
+    conn = connect()
+    print(f"{rows} movies, refresh changes 5% of them\n")
+    print(f"{'method':>14} | {'initial s':>9} | {'refresh s':>9} | rows rewritten by refresh")
+    print("-" * 64)
+    for name, method in [("upsert per row", upsert_per_row), ("copy + merge", upsert_bulk)]:
+        cursor = conn.cursor()
+        create_tables(cursor)
+        conn.commit()
+        cursor.close()
+
+        initial, _ = run(conn, method, metadata_df, rating_stats_df)
+        refresh, updated = run(conn, method, refreshed_metadata_df, refreshed_rating_stats_df)
+        print(f"{name:>14} | {initial:>9.2f} | {refresh:>9.2f} | {updated}")
+
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, REAL, TIMESTAMP, ForeignKey, DateTime, Text, Index, Boolean
+from sqlalchemy import Column, Integer, REAL, TIMESTAMP, ForeignKey, DateTime, Text, Index, Boolean, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import ARRAY as PG_ARRAY
 from pgvector.sqlalchemy import Vector
@@ -79,9 +79,24 @@ class UserRatingStats(Base):
     top_3_genres = Column(PG_ARRAY(Text), server_default='{}')
     top_50_actors = Column(PG_ARRAY(Text), server_default='{}')
     top_10_directors = Column(PG_ARRAY(Text), server_default='{}')
+    rating_sum = Column(REAL, server_default='0.0')
     last_updated = Column(TIMESTAMP, server_default='NOW()')
     is_stale = Column(Boolean, server_default="false")
 
+# per user count of positively rated movies for each genre/actor/director, the top_* arrays
+# in user_rating_stats are kept current from these counters
+class UserFeatureCounts(Base):
+    __tablename__ = 'user_feature_counts'
+
+    user_id = Column(Text, ForeignKey('user_login.user_id', ondelete='CASCADE'), primary_key=True)
+    feature_type = Column(Text, primary_key=True)
+    feature = Column(Text, primary_key=True)
+    count = Column(Integer, server_default='0')
+
+    __table_args__ = (
+        Index('idx_user_feature_counts_top', 'user_id', 'feature_type', text('count DESC')),
+    )
+
 class MovieEmbeddingColdstartProd(Base):
     __tablename__ = 'movie_embedding_coldstart_prod'
     
@@ -139,6 +154,10 @@ class UserEmbeddings(Base):
     
     user_id = Column(Text, ForeignKey('user_login.user_id', ondelete='CASCADE'), primary_key=True)
     embedding = Column(Vector(512), nullable=False)
+    # running sum and count of the positively rated movie embeddings, embedding is the
+    # normalized sum so ratings can be applied as add/subtract deltas
+    embedding_sum = Column(Vector(512), nullable=True)
+    embedding_count = Column(Integer, server_default='0')
     last_updated = Column(TIMESTAMP, server_default='NOW()')
     
     __table_args__ = (
@@ -1,36 +1,36 @@
+import os
 import json
 import boto3
 import psycopg2
-import numpy as np
 import polars as pl
-from io import BytesIO
+from botocore.exceptions import ClientError
 from utils.upsert_movie_metadata_table import upsert_movie_metadata
 from utils.upsert_movie_rating_stats import upsert_movie_rating_stats
-from utils.load_embeddings_to_staging import load_embeddings_to_staging
+from utils.load_embeddings_to_staging import build_staging_hnsw_index, load_embeddings_to_staging
 from utils.swap_tables import swap_tables
 from utils.get_aws_rds_credentials import get_db_credentials
+from utils.s3_stream import iter_csv_batches, open_npy_s3, spooled_s3_object
 
-# Download file from S3 to memory
-def download_from_s3(s3_client, bucket, key):
+# Rows per polars batch read from the CSVs, the upserts COPY one batch at a time
+CSV_BATCH_ROWS = int(os.environ.get("CSV_BATCH_ROWS", "10000"))
+
+# tmdbIds of the embedding rows in row order, from the movie_ids.txt the training job uploads
+# next to the .npy. Embeddings saved before it existed fall back to the tmdbId column of the
+# metadata CSV of the same version
+def load_embedding_movie_ids(s3_client, bucket, key, version):
+    movie_ids_key = f"{key.rsplit('/', 1)[0]}/movie_ids.txt"
     try:
-        buffer = BytesIO()
-        s3_client.download_fileobj(bucket, key, buffer)
-        buffer.seek(0)
-        print(f"Downloaded s3://{bucket}/{key}")
-        return buffer
-    except Exception as e:
-        raise Exception(f"failed to download s3://{bucket}/{key}: {e}")
-    
-# Load CSV from S3 into Polars Dataframe
-def load_csv_from_s3(s3_client, bucket, key):
-    buffer = download_from_s3(s3_client, bucket, key)
-    df = pl.read_csv(buffer)
-    return df
-
-def load_npy_from_s3(s3_client, bucket, key):
-    buffer = download_from_s3(s3_client, bucket, key)
-    embeddings = np.load(buffer)
-    return embeddings
+        with spooled_s3_object(s3_client, bucket, movie_ids_key) as path:
+            with open(path) as file:
+                return file.read().split()
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchKey':
+            raise
+
+    metadata_key = f"movie_metadata/production/{version}/movie_metadata.csv"
+    print(f"No {movie_ids_key}, reading movie ids from {metadata_key}")
+    with spooled_s3_object(s3_client, bucket, metadata_key) as path:
+        return pl.scan_csv(path, schema_overrides={'tmdbId': pl.Utf8}).select('tmdbId').collect()['tmdbId'].to_list()
 
 def parse_s3_event(event):
     s3_record = event['Records'][0]['s3']
@@ -93,28 +93,25 @@ def handler(event, context):
 
         print(f"DEBUG: file_type={file_type}, bucket={bucket}, key={key}")
 
+        # Lock wait and swap duration of an embeddings table swap
+        swap_stats = None
+
         # Process based on file type
         if file_type == 'metadata':
-            print("Downloading metadata CSV from S3...")
-            metadata_df = load_csv_from_s3(s3_client, bucket, key)
-            print("Downloaded metadata CSV from S3!")
-            print("Updating movie metadata...")
-            upsert_movie_metadata(cursor, metadata_df)
+            print("Streaming metadata CSV from S3...")
+            with spooled_s3_object(s3_client, bucket, key) as path:
+                print("Updating movie metadata...")
+                upsert_movie_metadata(cursor, iter_csv_batches(path, CSV_BATCH_ROWS))
             print("Updated movie metadata!")
 
         elif file_type == 'ratings':
-            print("Downloading ratings CSV from S3...")
-            rating_stats_df = load_csv_from_s3(s3_client, bucket, key)
-            print("Downloaded ratings CSV from S3!")
-            print("Updating movie ratings...")
-            upsert_movie_rating_stats(cursor, rating_stats_df)
+            print("Streaming ratings CSV from S3...")
+            with spooled_s3_object(s3_client, bucket, key) as path:
+                print("Updating movie ratings...")
+                upsert_movie_rating_stats(cursor, iter_csv_batches(path, CSV_BATCH_ROWS))
             print("Updated movie ratings!")
 
         elif file_type == 'embeddings':
-            print("Downloading embeddings npy from S3...")
-            embeddings = load_npy_from_s3(s3_client, bucket, key)
-            print("Downloaded embeddings npy from S3!")
-
             if model_type == 'cold_start':
                 staging_table = "movie_embedding_coldstart_staging"
                 prod_table = "movie_embedding_coldstart_prod"
@@ -122,19 +119,40 @@ def handler(event, context):
                 staging_table = "movie_embedding_personalized_staging"
                 prod_table = "movie_embedding_personalized_prod"
 
-            metadata_key = f"movie_metadata/production/{version}/movie_metadata.csv"
-            # Download metadata to get movie_ids in correct order
-            print("Downloading metadata CSV from S3...")
-            metadata_df = load_csv_from_s3(s3_client, bucket, metadata_key)
-            print("Downloaded metadata CSV from S3!")
+            movie_ids = load_embedding_movie_ids(s3_client, bucket, key, version)
+
+            # The .npy is read off the S3 body in row batches while it is copied
+            print("Streaming embeddings npy from S3...")
+            embeddings = open_npy_s3(s3_client, bucket, key)
 
             print("loading embeddings to staging...")
-            load_embeddings_to_staging(cursor, metadata_df , embeddings, staging_table)
+            load_embeddings_to_staging(cursor, movie_ids, embeddings, staging_table)
+            conn.commit()
             print("loaded embeddings to staging!")
+
+            # The index is built concurrently, outside a transaction
+            print("building staging index...")
+            conn.autocommit = True
+            build_staging_hnsw_index(
+                cursor,
+                staging_table,
+                prod_table,
+                maintenance_work_mem=os.environ.get("HNSW_MAINTENANCE_WORK_MEM", "512MB"),
+                max_parallel_workers=int(os.environ.get("HNSW_MAX_PARALLEL_WORKERS", "2"))
+            )
+            conn.autocommit = False
+            print("built staging index!")
+
             print("swapping tables...")
-            swap_tables(cursor, staging_table, prod_table)
+            swap_stats = swap_tables(
+                cursor,
+                staging_table,
+                prod_table,
+                lock_timeout=os.environ.get("SWAP_LOCK_TIMEOUT", "2s"),
+                retries=int(os.environ.get("SWAP_LOCK_RETRIES", "5"))
+            )
             print("swapped tabled!")
-        
+
         conn.commit()
 
         cursor.close()
@@ -145,7 +163,8 @@ def handler(event, context):
             'body': json.dumps({
                 'message': f'{file_type} updated successfully',
                 'version': version,
-                'model_type': model_type
+                'model_type': model_type,
+                'swap': swap_stats
             })
         } 
 
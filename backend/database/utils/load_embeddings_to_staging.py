@@ -1,29 +1,102 @@
+import time
+from utils.pg_copy import copy_embeddings
 
-# Load embeddings into staging table
-def load_embeddings_to_staging(cursor, metadata_df, embeddings, staging_table):
+# HNSW indexes on the table as (schema qualified name, CREATE INDEX statement). The staging
+# table is the previous production table after every swap, so its index names alternate and
+# are looked up instead of hard coded
+def get_hnsw_indexes(cursor, table):
+    cursor.execute("""
+        SELECT format('%%I.%%I', n.nspname, c.relname), pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = %s::regclass
+        AND am.amname = 'hnsw'
+    """, (table,))
+
+    return cursor.fetchall()
+
+# Load embeddings into staging table. embeddings is a matrix or an NpyStream read off S3,
+# movie_ids has one id per embedding row in the same order. The table is left without its
+# HNSW index, commit and then build it with build_staging_hnsw_index
+def load_embeddings_to_staging(cursor, movie_ids, embeddings, staging_table):
     print(f"Loading {len(embeddings)} embeddings into {staging_table}...")
 
     # Validate data consistency
-    if len(metadata_df) != len(embeddings):
+    if len(movie_ids) != len(embeddings):
         raise ValueError(
-            f"Data mismatch: {len(metadata_df)} movies in metadata "
+            f"Data mismatch: {len(movie_ids)} movie ids "
             f"but {len(embeddings)} embeddings"
         )
 
+    # Drop the HNSW index while loading, inserting into it costs a graph search per row. This
+    # also drops an invalid index left behind by a concurrent build that failed
+    hnsw_indexes = get_hnsw_indexes(cursor, staging_table)
+    for index_name, _ in hnsw_indexes:
+        cursor.execute(f"DROP INDEX {index_name}")
+    print(f"✓ Dropped {len(hnsw_indexes)} HNSW index(es) on {staging_table}")
+
     # Truncate staging table
     cursor.execute(f"TRUNCATE TABLE {staging_table}")
     print(f"✓ Truncated {staging_table}")
 
-    # Insert embeddings
-    for idx, row in enumerate(metadata_df.iter_rows(named=True)):
-        embedding_list = embeddings[idx].tolist()
+    # Stream every embedding in one binary COPY, truncated in this transaction so the rows
+    # can be written frozen
+    movie_ids = [str(movie_id) for movie_id in movie_ids]
+    copy_embeddings(cursor, staging_table, movie_ids, embeddings, freeze=True)
+    print(f"✓ Copied {len(movie_ids)} embeddings into {staging_table}")
+
+    print(f"Loaded embeddings into {staging_table}")
+
+# Load the table's heap and HNSW index into shared buffers, so the first searches after the
+# swap don't read the graph from disk page by page. Skipped when pg_prewarm isn't installed
+def prewarm_table(cursor, table):
+    cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'")
+    if cursor.fetchone() is None:
+        print(f"pg_prewarm not installed, skipping pre-warm of {table}")
+        return
+
+    relations = [table] + [index_name for index_name, _ in get_hnsw_indexes(cursor, table)]
+    for relation in relations:
+        cursor.execute("SELECT pg_prewarm(%s::regclass)", (relation,))
+        print(f"✓ Pre-warmed {relation} ({cursor.fetchone()[0]} blocks)")
+
+# Build the staging table's HNSW index with the same method, operator class and parameters as
+# the production one, then ANALYZE and pre-warm it. Needs an autocommit connection, CREATE
+# INDEX CONCURRENTLY can't run in a transaction block.
+#
+# Concurrently takes a SHARE UPDATE EXCLUSIVE lock instead of SHARE, so the build never blocks
+# anything touching the table (queries still running on it from before the last swap, a
+# vacuum). The build is much faster when the graph fits in maintenance_work_mem (~2x the
+# vectors) and uses parallel workers on pgvector >= 0.6
+def build_staging_hnsw_index(cursor, staging_table, prod_table, maintenance_work_mem="512MB", max_parallel_workers=2):
+    prod_indexes = get_hnsw_indexes(cursor, prod_table)
+    if not prod_indexes:
+        raise ValueError(f"{prod_table} has no HNSW index to build {staging_table}'s from")
+    prod_index_name, prod_index_definition = prod_indexes[0]
+
+    # Index names follow their table (swap_tables renames them), tables swapped before that
+    # kept their own index, so the production index may still have the staging name
+    index_name = f"idx_{staging_table}_hnsw"
+    if prod_index_name.split(".")[-1] == index_name:
+        index_name = f"idx_{prod_table}_hnsw"
+
+    # "CREATE INDEX name ON table USING hnsw (...) WITH (...)"
+    index_method = prod_index_definition[prod_index_definition.index(" USING "):]
+
+    cursor.execute("SET maintenance_work_mem = %s", (maintenance_work_mem,))
+    cursor.execute("SET max_parallel_maintenance_workers = %s", (max_parallel_workers,))
+    start = time.perf_counter()
+    try:
+        cursor.execute(f"CREATE INDEX CONCURRENTLY {index_name} ON {staging_table}{index_method}")
+    finally:
+        cursor.execute("RESET maintenance_work_mem")
+        cursor.execute("RESET max_parallel_maintenance_workers")
+    print(f"✓ Built {index_name} concurrently in {time.perf_counter() - start:.1f}s")
 
-        cursor.execute(f"""
-            INSERT INTO {staging_table} (movie_id, embedding)
-            VALUES (%s, %s::vector)
-        """, (
-            str(row['tmdbId']),
-            embedding_list
-        ))
+    # Planner statistics for the new rows, the swapped in table is planned with them right away
+    cursor.execute(f"ANALYZE {staging_table}")
+    print(f"✓ Analyzed {staging_table}")
 
-    print(f"Loaded embeddings into {staging_table}")
\ No newline at end of file
+    prewarm_table(cursor, staging_table)
@@ -0,0 +1,123 @@
+import io
+import struct
+import numpy as np
+import polars as pl
+
+# COPY ... FROM STDIN helpers, one statement streams every row instead of one INSERT per row.
+#
+# Embeddings go as binary COPY in pgvector's binary format (int16 dim, int16 unused, big
+# endian float4s), so nothing is formatted as text on our side or parsed back by postgres.
+# Rows are encoded lazily in chunks while psycopg2 reads the stream, so the whole COPY payload
+# is never held in memory next to the embeddings. Polars frames go as csv written by polars.
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# header flags and header extension length, both 0
+COPY_HEADER = COPY_SIGNATURE + struct.pack("!ii", 0, 0)
+COPY_TRAILER = struct.pack("!h", -1)
+
+# File like object over an iterator of byte chunks, what cursor.copy_expert reads from
+class ChunkStream(io.RawIOBase):
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+# Row batches of an embedding matrix, or of an NpyStream read off S3
+def embedding_batches(embeddings, rows=1024):
+    if hasattr(embeddings, "batches"):
+        return embeddings.batches(rows)
+
+    return (embeddings[start:start + rows] for start in range(0, len(embeddings), rows))
+
+# (movie ids, embeddings) pairs, the ids lined up with the rows of each embedding batch
+def with_movie_ids(movie_ids, batches):
+    offset = 0
+    for batch in batches:
+        yield movie_ids[offset:offset + len(batch)], batch
+        offset += len(batch)
+
+# Binary COPY rows of (text movie_id, vector embedding), one chunk per batch
+def binary_embedding_chunks(batches):
+    yield COPY_HEADER
+    for movie_ids, embeddings in batches:
+        embeddings = np.ascontiguousarray(embeddings, dtype=">f4")
+        # field length, dim and the unused int16 are the same for every row
+        vector_header = struct.pack("!ihh", 4 + 4 * embeddings.shape[1], embeddings.shape[1], 0)
+
+        parts = []
+        for movie_id, embedding in zip(movie_ids, embeddings):
+            movie_id = str(movie_id).encode()
+            # 2 fields per row
+            parts.append(struct.pack("!hi", 2, len(movie_id)))
+            parts.append(movie_id)
+            parts.append(vector_header)
+            parts.append(embedding.tobytes())
+        yield b"".join(parts)
+    yield COPY_TRAILER
+
+# Text COPY rows, "movie_id\t[0.1,0.2,...]\n", for vector types or extension versions that
+# can't take the binary format
+def text_embedding_chunks(batches):
+    for movie_ids, embeddings in batches:
+        lines = []
+        for movie_id, embedding in zip(movie_ids, np.asarray(embeddings, dtype=np.float32)):
+            vector = ",".join(map(repr, embedding.tolist()))
+            lines.append(f"{movie_id}\t[{vector}]\n")
+        yield "".join(lines).encode()
+
+# COPY the embeddings (a matrix or an NpyStream) into table (movie_id, embedding), binary
+# unless binary=False. With freeze=True the rows are written already frozen, only allowed when
+# the table was created or truncated earlier in the same transaction
+def copy_embeddings(cursor, table, movie_ids, embeddings, binary=True, freeze=False):
+    if len(movie_ids) != len(embeddings):
+        raise ValueError(f"{len(movie_ids)} movie ids but {len(embeddings)} embeddings")
+
+    options = ["FORMAT binary" if binary else "FORMAT text"]
+    if freeze:
+        options.append("FREEZE")
+
+    batches = with_movie_ids(movie_ids, embedding_batches(embeddings))
+    chunks = binary_embedding_chunks(batches) if binary else text_embedding_chunks(batches)
+    cursor.copy_expert(
+        f"COPY {table} (movie_id, embedding) FROM STDIN WITH ({', '.join(options)})",
+        ChunkStream(chunks),
+        size=1 << 20
+    )
+
+# Postgres array literal ({"a","b"}) of a list[str] expression, built column wise by polars.
+# Elements are always quoted so commas, braces and spaces in names survive, null lists stay null
+def pg_array_literal(expr):
+    quoted = pl.element().str.replace_all("\\", "\\\\", literal=True).str.replace_all('"', '\\"', literal=True)
+
+    return pl.concat_str([
+        pl.lit("{"),
+        expr.list.eval(pl.lit('"') + quoted + pl.lit('"')).list.join(","),
+        pl.lit("}"),
+    ])
+
+# COPY a polars frame into the table's columns of the same names, as csv written by polars.
+# List columns have to be turned into array literals with pg_array_literal first
+def copy_dataframe(cursor, table, df):
+    buffer = io.BytesIO()
+    df.write_csv(buffer)
+    buffer.seek(0)
+
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+        buffer,
+        size=1 << 20
+    )
@@ -0,0 +1,111 @@
+import io
+import os
+import tempfile
+import numpy as np
+import polars as pl
+from contextlib import contextmanager
+
+# Streaming reads of the S3 files the update movie tables lambda loads, so a file is never
+# held in memory as a whole next to the frame or array parsed from it.
+#
+# CSVs are spooled to the lambda's /tmp in chunks and read back in batches of rows. .npy
+# files are parsed straight off the S3 body: the header gives the shape and dtype, then the
+# rows are read in fixed size chunks.
+
+# 8MB reads, the same part size boto3 uses for its own transfers
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# Downloads the object to a temp file in chunks, yields the path and deletes the file after
+@contextmanager
+def spooled_s3_object(s3_client, bucket, key):
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(key))
+        with open(path, "wb") as file:
+            for chunk in body.iter_chunks(CHUNK_BYTES):
+                file.write(chunk)
+        print(f"Downloaded s3://{bucket}/{key}")
+
+        yield path
+
+# Polars frames of up to batch_size rows of the CSV. The file is cut into batches of whole
+# records and each one is parsed on its own with the header, so only one batch is in memory
+# (polars' own batched scan reads well ahead of the batch it returns). A line ending inside a
+# quoted field leaves an odd number of quotes so far, escaped quotes ("") come in pairs.
+# Every column is read as a string unless read_options say otherwise, types inferred per batch
+# could differ between batches (a batch without decimals, or with a column left empty), the
+# upload frames cast the columns they copy
+def iter_csv_batches(path, batch_size=10000, **read_options):
+    read_options = {"infer_schema": False, **read_options}
+
+    with open(path, "rb") as file:
+        header = file.readline()
+        lines = [header]
+        rows = 0
+        quotes = 0
+
+        for line in file:
+            lines.append(line)
+            quotes += line.count(b'"')
+            if quotes % 2:
+                continue
+
+            rows += 1
+            if rows == batch_size:
+                yield pl.read_csv(io.BytesIO(b"".join(lines)), **read_options)
+                lines = [header]
+                rows = 0
+
+        if rows:
+            yield pl.read_csv(io.BytesIO(b"".join(lines)), **read_options)
+
+# Reads exactly size bytes, a streaming body may return fewer per read
+def read_exactly(body, size):
+    parts = []
+    remaining = size
+    while remaining:
+        part = body.read(remaining)
+        if not part:
+            break
+        parts.append(part)
+        remaining -= len(part)
+
+    return b"".join(parts)
+
+# 2D .npy array read off a file like object (an S3 StreamingBody) in row batches
+class NpyStream:
+    def __init__(self, body):
+        self.body = body
+
+        version = np.lib.format.read_magic(body)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(body)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(body)
+
+        if len(shape) != 2 or fortran_order or dtype.hasobject:
+            raise ValueError(f"expected a 2D C ordered numeric array, got shape {shape} fortran_order={fortran_order} dtype={dtype}")
+
+        self.shape = shape
+        self.dtype = dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    # arrays of up to rows rows, in file order. Every row has to be read once, the stream
+    # can't be rewound
+    def batches(self, rows=1024):
+        row_bytes = self.shape[1] * self.dtype.itemsize
+
+        for start in range(0, self.shape[0], rows):
+            count = min(rows, self.shape[0] - start)
+            data = read_exactly(self.body, count * row_bytes)
+            if len(data) != count * row_bytes:
+                raise ValueError(f"npy stream ended after {start + len(data) // row_bytes} of {self.shape[0]} rows")
+
+            yield np.frombuffer(data, dtype=self.dtype).reshape(count, self.shape[1])
+
+def open_npy_s3(s3_client, bucket, key):
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    return NpyStream(body)
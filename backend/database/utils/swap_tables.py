@@ -1,12 +1,67 @@
-# Swap staging and production tables
-def swap_tables(cursor, staging_table, prod_table):
+import time
+from psycopg2.errors import LockNotAvailable
+from utils.load_embeddings_to_staging import get_hnsw_indexes
+
+# Rename each table's HNSW index (one per embedding table) to idx_<table>_hnsw, so names
+# follow the tables through the swap. Renamed through a temp name, the two names are swapped
+def rename_hnsw_indexes(cursor, tables):
+    renames = []
+    for table in tables:
+        index_name = f"idx_{table}_hnsw"
+        for current_name, _ in get_hnsw_indexes(cursor, table):
+            if current_name.split(".")[-1] != index_name:
+                renames.append((current_name, index_name))
+
+    for current_name, index_name in renames:
+        cursor.execute(f"ALTER INDEX {current_name} RENAME TO {index_name}_temp")
+    for _, index_name in renames:
+        cursor.execute(f"ALTER INDEX {index_name}_temp RENAME TO {index_name}")
+
+# Swap staging and production tables and commit, returns the attempts, the time spent waiting
+# for the locks and the time they were held.
+#
+# The renames need ACCESS EXCLUSIVE locks on both tables. A lock request waiting behind a long
+# running query on the production table blocks every query that arrives after it, so the locks
+# are taken with a short lock_timeout instead: on a timeout the transaction is rolled back,
+# which lets the queued queries through, and retried after a pause
+def swap_tables(cursor, staging_table, prod_table, lock_timeout="2s", retries=5, retry_delay_seconds=1.0):
     print(f"Swapping {staging_table} <-> {prod_table}...")
 
+    conn = cursor.connection
     temp_table = f"{prod_table}_temp"
+    lock_wait_seconds = 0.0
+
+    for attempt in range(1, retries + 1):
+        start = time.perf_counter()
+        try:
+            cursor.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+            cursor.execute(f"LOCK TABLE {prod_table}, {staging_table} IN ACCESS EXCLUSIVE MODE")
+        except LockNotAvailable:
+            conn.rollback()
+            lock_wait_seconds += time.perf_counter() - start
+            print(f"Locks on {prod_table} and {staging_table} not granted within {lock_timeout} (attempt {attempt} of {retries})")
+            if attempt == retries:
+                raise
+            time.sleep(retry_delay_seconds * attempt)
+            continue
+
+        locked = time.perf_counter()
+        lock_wait_seconds += locked - start
 
-    # Rename in transaction
-    cursor.execute(f"ALTER TABLE {prod_table} RENAME TO {temp_table}")
-    cursor.execute(f"ALTER TABLE {staging_table} RENAME TO {prod_table}")
-    cursor.execute(f"ALTER TABLE {temp_table} RENAME TO {staging_table}")
+        # Rename in transaction
+        cursor.execute(f"ALTER TABLE {prod_table} RENAME TO {temp_table}")
+        cursor.execute(f"ALTER TABLE {staging_table} RENAME TO {prod_table}")
+        cursor.execute(f"ALTER TABLE {temp_table} RENAME TO {staging_table}")
+        rename_hnsw_indexes(cursor, [prod_table, staging_table])
+        conn.commit()
 
-    print(f"Tables swapped successfully")
\ No newline at end of file
+        swap_stats = {
+            "attempts": attempt,
+            "lock_wait_ms": round(lock_wait_seconds * 1000, 1),
+            "swap_ms": round((time.perf_counter() - locked) * 1000, 1),
+        }
+        print(
+            f"Tables swapped successfully after {attempt} attempt(s), "
+            f"{swap_stats['lock_wait_ms']}ms waiting for locks, locks held {swap_stats['swap_ms']}ms"
+        )
+        return swap_stats
@@ -1,32 +1,85 @@
+import polars as pl
+from utils.pg_copy import copy_dataframe, pg_array_literal
 
-def upsert_movie_metadata(cursor, metadata_df):
-    print(f"Upserting {len(metadata_df)} movies into movie_metadata...")
+# "a|b|c" columns are split by polars, columns that already are lists are used as they are
+def split_pipe_column(df, column):
+    if isinstance(df.schema[column], pl.List):
+        return pl.col(column)
 
-    for row in metadata_df.iter_rows(named=True):
-        cursor.execute("""
-            INSERT INTO movie_metadata (
-                movie_id, movie_name, genres, release_date, summary, actors, director, language, poster_path
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (movie_id) DO UPDATE SET
-                movie_name = EXCLUDED.movie_name,
-                genres = EXCLUDED.genres,
-                release_date = EXCLUDED.release_date,
-                summary = EXCLUDED.summary,
-                actors = EXCLUDED.actors,
-                director = EXCLUDED.director,
-                language = EXCLUDED.language,
-                poster_path = EXCLUDED.poster_path
-        """, (
-            str(row['tmdbId']),
-            row['title'],
-            row['genres_normalized'].split("|") if isinstance(row['genres_normalized'], str) else row['genres_normalized'],
-            int(row['year']),
-            row['overview'],
-            row['cast_normalized'].split("|") if isinstance(row['cast_normalized'], str) else row['cast_normalized'],
-            row['director'].split("|") if isinstance(row['director'], str) else row['director'],
-            row.get('original_language'),
-            row.get('poster_path', '')
-        ))
+    return pl.col(column).str.split("|")
 
-    print("Movie metadata upserted")
\ No newline at end of file
+# movie_metadata columns of a metadata csv frame, arrays as postgres array literals
+def metadata_upload_frame(metadata_df):
+    return metadata_df.select(
+        pl.col('tmdbId').cast(pl.Utf8).alias('movie_id'),
+        pl.col('title').alias('movie_name'),
+        pg_array_literal(split_pipe_column(metadata_df, 'genres_normalized')).alias('genres'),
+        pl.col('year').cast(pl.Float64).cast(pl.Int64).alias('release_date'),
+        pl.col('overview').alias('summary'),
+        pg_array_literal(split_pipe_column(metadata_df, 'cast_normalized')).alias('actors'),
+        pg_array_literal(split_pipe_column(metadata_df, 'director')).alias('director'),
+        (pl.col('original_language') if 'original_language' in metadata_df.columns else pl.lit(None, pl.Utf8)).alias('language'),
+        (pl.col('poster_path') if 'poster_path' in metadata_df.columns else pl.lit('')).alias('poster_path'),
+    )
+
+# The metadata (a frame, or frames streamed from the csv in batches) is copied into a temp
+# table (temp tables aren't WAL logged) and merged into movie_metadata with one
+# INSERT ... SELECT. Rows whose columns are all unchanged are skipped by the IS DISTINCT FROM
+# guard instead of being rewritten, which also keeps them from bloating the table and the
+# genres GIN index on every catalogue refresh
+def upsert_movie_metadata(cursor, metadata_batches):
+    if isinstance(metadata_batches, pl.DataFrame):
+        metadata_batches = [metadata_batches]
+    print("Upserting movies into movie_metadata...")
+
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.movie_metadata_upload")
+    cursor.execute("""
+        CREATE TEMP TABLE movie_metadata_upload (
+            upload_order BIGSERIAL,
+            movie_id TEXT,
+            movie_name TEXT,
+            genres TEXT[],
+            release_date INTEGER,
+            summary TEXT,
+            actors TEXT[],
+            director TEXT[],
+            language TEXT,
+            poster_path TEXT
+        ) ON COMMIT DROP
+    """)
+    uploaded = 0
+    for metadata_df in metadata_batches:
+        copy_dataframe(cursor, "movie_metadata_upload", metadata_upload_frame(metadata_df))
+        uploaded += len(metadata_df)
+
+    # a movie listed twice would hit the same row twice in one INSERT, the last one in the
+    # file wins like it did with one upsert per row
+    cursor.execute("""
+        INSERT INTO movie_metadata (
+            movie_id, movie_name, genres, release_date, summary, actors, director, language, poster_path
+        )
+        SELECT DISTINCT ON (movie_id)
+            movie_id, movie_name, genres, release_date, summary, actors, director, language, poster_path
+        FROM movie_metadata_upload
+        ORDER BY movie_id, upload_order DESC
+        ON CONFLICT (movie_id) DO UPDATE SET
+            movie_name = EXCLUDED.movie_name,
+            genres = EXCLUDED.genres,
+            release_date = EXCLUDED.release_date,
+            summary = EXCLUDED.summary,
+            actors = EXCLUDED.actors,
+            director = EXCLUDED.director,
+            language = EXCLUDED.language,
+            poster_path = EXCLUDED.poster_path
+        WHERE (
+            movie_metadata.movie_name, movie_metadata.genres, movie_metadata.release_date,
+            movie_metadata.summary, movie_metadata.actors, movie_metadata.director,
+            movie_metadata.language, movie_metadata.poster_path
+        ) IS DISTINCT FROM (
+            EXCLUDED.movie_name, EXCLUDED.genres, EXCLUDED.release_date,
+            EXCLUDED.summary, EXCLUDED.actors, EXCLUDED.director,
+            EXCLUDED.language, EXCLUDED.poster_path
+        )
+    """)
+
+    print(f"Movie metadata upserted, {cursor.rowcount} of {uploaded} movies new or changed")
@@ -1,23 +1,57 @@
+import polars as pl
+from utils.pg_copy import copy_dataframe
 
-def upsert_movie_rating_stats(cursor, rating_stats_df):
-      print(f"Upserting {len(rating_stats_df)} rating stats into movie_rating_stats...")
+# movie_rating_stats columns of a rating stats csv frame
+def rating_stats_upload_frame(rating_stats_df):
+    return rating_stats_df.select(
+        pl.col('movie_id').cast(pl.Utf8),
+        pl.col('vote_average').cast(pl.Float64).alias('tmdb_avg_rating'),
+        pl.col('vote_count').cast(pl.Float64).alias('tmdb_vote_log'),
+        pl.col('popularity').cast(pl.Float64).alias('tmdb_popularity'),
+    )
 
-      for row in rating_stats_df.iter_rows(named=True):
-          cursor.execute("""
-              INSERT INTO movie_rating_stats (
-                  movie_id, tmdb_avg_rating, tmdb_vote_log, tmdb_popularity
-              )
-              VALUES (%s, %s, %s, %s)
-              ON CONFLICT (movie_id) DO UPDATE SET
-                  tmdb_avg_rating = EXCLUDED.tmdb_avg_rating,
-                  tmdb_vote_log = EXCLUDED.tmdb_vote_log,
-                  tmdb_popularity = EXCLUDED.tmdb_popularity,
-                  last_updated = NOW()
-          """, (
-              str(row['movie_id']),
-              float(row['vote_average']),
-              float(row['vote_count']),
-              float(row['popularity'])
-          ))
+# Same staged path as upsert_movie_metadata: COPY into a temp table, then one INSERT ... SELECT.
+# Unchanged tmdb stats are skipped, so last_updated only moves for movies whose stats changed
+def upsert_movie_rating_stats(cursor, rating_stats_batches):
+    if isinstance(rating_stats_batches, pl.DataFrame):
+        rating_stats_batches = [rating_stats_batches]
+    print("Upserting rating stats into movie_rating_stats...")
 
-      print("Movie rating stats upserted")
\ No newline at end of file
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.movie_rating_stats_upload")
+    # REAL like movie_rating_stats, so unchanged values compare equal after the cast
+    cursor.execute("""
+        CREATE TEMP TABLE movie_rating_stats_upload (
+            upload_order BIGSERIAL,
+            movie_id TEXT,
+            tmdb_avg_rating REAL,
+            tmdb_vote_log REAL,
+            tmdb_popularity REAL
+        ) ON COMMIT DROP
+    """)
+    uploaded = 0
+    for rating_stats_df in rating_stats_batches:
+        copy_dataframe(cursor, "movie_rating_stats_upload", rating_stats_upload_frame(rating_stats_df))
+        uploaded += len(rating_stats_df)
+
+    # the last row of a movie listed twice wins
+    cursor.execute("""
+        INSERT INTO movie_rating_stats (
+            movie_id, tmdb_avg_rating, tmdb_vote_log, tmdb_popularity
+        )
+        SELECT DISTINCT ON (movie_id)
+            movie_id, tmdb_avg_rating, tmdb_vote_log, tmdb_popularity
+        FROM movie_rating_stats_upload
+        ORDER BY movie_id, upload_order DESC
+        ON CONFLICT (movie_id) DO UPDATE SET
+            tmdb_avg_rating = EXCLUDED.tmdb_avg_rating,
+            tmdb_vote_log = EXCLUDED.tmdb_vote_log,
+            tmdb_popularity = EXCLUDED.tmdb_popularity,
+            last_updated = NOW()
+        WHERE (
+            movie_rating_stats.tmdb_avg_rating, movie_rating_stats.tmdb_vote_log, movie_rating_stats.tmdb_popularity
+        ) IS DISTINCT FROM (
+            EXCLUDED.tmdb_avg_rating, EXCLUDED.tmdb_vote_log, EXCLUDED.tmdb_popularity
+        )
+    """)
+
+    print(f"Movie rating stats upserted, {cursor.rowcount} of {uploaded} movies new or changed")
@@ -1,16 +1,69 @@
 # Code for connecting to the PostgreSQL Database
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 from typing import AsyncGenerator
 from utils.env_config import settings
+from db.config.pool import MeteredQueuePool
+from db.config.vector_codec import register_vector_codec
+from utils.timing import record_round_trip, record_stage
 
 DATABASE_URL = settings.database_url
 
-engine: AsyncEngine = create_async_engine(url=DATABASE_URL, echo=True, pool_pre_ping=True)
+# engine with the pool settings from the environment, the keyword arguments override them
+# (benchmarks/db_pool_load_benchmark.py compares configurations)
+def create_engine(**overrides) -> AsyncEngine:
+    options = {
+        "echo": settings.db_echo,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "statement_cache_size": settings.db_statement_cache_size,
+        **overrides,
+    }
+    statement_cache_size = options.pop("statement_cache_size")
+
+    new_engine = create_async_engine(
+        url=DATABASE_URL,
+        poolclass=MeteredQueuePool,
+        # sqlalchemy's asyncpg adapter prepares every statement and keeps them in its own
+        # per connection lru, asyncpg's cache is bypassed by it
+        connect_args={"prepared_statement_cache_size": statement_cache_size},
+        **options
+    )
+
+    # register the binary pgvector codec on every new connection so vector columns
+    # are returned and accepted as float32 numpy arrays
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.run_async(register_vector_codec)
+
+    # count every statement against the request's StageTimer, if one is running, and time
+    # it as the db.statement span. asyncpg has decoded the rows (and the vector columns) by
+    # the time after_cursor_execute runs, what a query helper's span spends beyond its
+    # statements is the pool wait and building the result dicts
+    @event.listens_for(new_engine.sync_engine, "before_cursor_execute")
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        record_round_trip()
+        if context is not None:
+            context._statement_start = time.perf_counter()
+
+    @event.listens_for(new_engine.sync_engine, "after_cursor_execute")
+    def on_executed(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_statement_start", None)
+        if start is not None:
+            record_stage("db.statement", (time.perf_counter() - start) * 1000)
+
+    return new_engine
+
+engine: AsyncEngine = create_engine()
 
 # session factor
 async_session = async_sessionmaker(
-    bind=engine, 
-    class_=AsyncSession, 
+    bind=engine,
+    class_=AsyncSession,
     expire_on_commit=False
 )
 
@@ -25,4 +78,4 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
             await session.rollback()
             raise
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
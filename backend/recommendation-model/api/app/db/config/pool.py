@@ -0,0 +1,73 @@
+# connection pool that records how long every checkout waited for a connection, the wait
+# includes opening a new (overflow) connection but not the pre ping that runs after it
+import time
+from collections import deque
+from typing import Any, Dict
+import numpy as np
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from utils.timing import record_stage
+
+class PoolMetrics:
+    def __init__(self, window: int = 1000) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        # the most recent waits for the percentiles
+        self.recent_waits_ms: deque = deque(maxlen=window)
+
+    def record(self, wait_ms: float) -> None:
+        self.checkouts += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        self.recent_waits_ms.append(wait_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        recent = np.fromiter(self.recent_waits_ms, dtype=np.float64) if self.recent_waits_ms else np.zeros(1)
+
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait_ms / max(self.checkouts, 1), 3),
+            "p50_wait_ms": round(float(np.percentile(recent, 50)), 3),
+            "p99_wait_ms": round(float(np.percentile(recent, 99)), 3),
+            "max_wait_ms": round(self.max_wait_ms, 3),
+        }
+
+# the checkouts run on the event loop (through sqlalchemy's greenlet bridge), so the metrics
+# are only ever touched by one thread
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    # sqlalchemy recreates the pool on engine.dispose(), the new one keeps counting
+    def recreate(self) -> "MeteredQueuePool":
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.metrics.record(wait_ms)
+        record_stage("pool_wait", wait_ms)
+
+        return connection
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "max_overflow": self._max_overflow,
+            "timeout_seconds": self._timeout,
+            **self.metrics.stats(),
+        }
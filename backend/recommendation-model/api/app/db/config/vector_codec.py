@@ -0,0 +1,30 @@
+# asyncpg codec for pgvector's vector type
+# vectors are sent in pgvector's binary format instead of the "[x,y,z,...]" text format, so a
+# 512 dim embedding is ~2 KB on the wire and decodes straight into a float32 numpy array
+import struct
+import numpy as np
+from numpy.typing import ArrayLike, NDArray
+
+# binary layout used by pgvector's vector_send/vector_recv:
+#   uint16 dim | uint16 unused | dim * float32, all big endian
+_HEADER = struct.Struct(">HH")
+
+def encode_vector(value: ArrayLike) -> bytes:
+    embedding = np.asarray(value, dtype=">f4").ravel()
+
+    return _HEADER.pack(embedding.shape[0], 0) + embedding.tobytes()
+
+def decode_vector(data: bytes) -> NDArray[np.float32]:
+    dim, _ = _HEADER.unpack_from(data)
+
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=_HEADER.size).astype(np.float32)
+
+# registers the codec on a raw asyncpg connection, called for every new pooled connection
+async def register_vector_codec(connection) -> None:
+    await connection.set_type_codec(
+        "vector",
+        schema="public",
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary",
+    )
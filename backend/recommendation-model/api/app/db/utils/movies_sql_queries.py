@@ -1,10 +1,13 @@
 from sqlalchemy import text
 from typing import List
 import numpy as np
+from numpy.typing import NDArray
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
+from utils.timing import traced
 
 # sql function that inserts movie metadata and does nothing if it already exists
+@traced("db.add_movie_metadata")
 async def add_movie_metadata(
     session,
     movie_id: str,
@@ -43,16 +46,9 @@ async def add_movie_metadata(
             }
         )
 
-        result = await session.execute(
-            text("SELECT * FROM movie_metadata WHERE movie_name=:movie_name"), 
-            {"movie_name": movie_name}
-        )
-        row = result.first()
-
-        print(row)
-
 # sql function to insert a embedding for a new movie, doesnt insert if exists
-async def add_new_movie_embedding(session, movie_id: str, movie_embedding: List[np.ndarray]):
+@traced("db.add_new_movie_embedding")
+async def add_new_movie_embedding(session, movie_id: str, movie_embedding: NDArray[np.float32]):
 
     query = text("""
         INSERT INTO movie_embedding_personalized_prod (movie_id, embedding)
@@ -64,37 +60,71 @@ async def add_new_movie_embedding(session, movie_id: str, movie_embedding: List[
         query,
         {
             "movie_id": str(movie_id),
-            "embedding": str(movie_embedding)
+            "embedding": movie_embedding
         }
     )
 
-# sql function to add the new movie rating into user watchlist table 
+# sql function to add the new movie rating into user watchlist table, also returns the
+# rating it replaced (None if the movie wasn't in the watchlist) so the user stats can be
+# updated with the difference.
+# the existing row is locked before it's read, so a concurrent rating of the same movie is
+# waited for and its rating is the one replaced. a new row is inserted only when there is
+# none, if a concurrent rating inserted it first the statement runs again to update it
+@traced("db.add_new_movie_rating")
 async def add_new_movie_rating(session, user_id: str, movie_id: str, rating: float):
     query = text("""
-        INSERT INTO user_watchlist (user_id, movie_id, user_rating, added_at, updated_at)
-        VALUES (:user_id, :movie_id, :user_rating, NOW(), NOW())
-        ON CONFLICT (user_id, movie_id)
-        DO UPDATE SET
-            user_rating = EXCLUDED.user_rating,
-            updated_at = NOW()
-        RETURNING added_at = updated_at AS is_new   
+        WITH previous AS (
+            SELECT user_id, movie_id, user_rating
+            FROM user_watchlist
+            WHERE user_id = :user_id
+            AND movie_id = :movie_id
+            FOR UPDATE
+        ),
+        updated AS (
+            UPDATE user_watchlist uw
+            SET
+                user_rating = :user_rating,
+                updated_at = NOW()
+            FROM previous p
+            WHERE uw.user_id = p.user_id
+            AND uw.movie_id = p.movie_id
+            RETURNING false AS is_new, p.user_rating AS previous_rating
+        ),
+        inserted AS (
+            INSERT INTO user_watchlist (user_id, movie_id, user_rating, added_at, updated_at)
+            SELECT :user_id, :movie_id, :user_rating, NOW(), NOW()
+            WHERE NOT EXISTS (SELECT 1 FROM previous)
+            ON CONFLICT (user_id, movie_id) DO NOTHING
+            RETURNING true AS is_new, NULL::real AS previous_rating
+        )
+        SELECT is_new, previous_rating FROM updated
+        UNION ALL
+        SELECT is_new, previous_rating FROM inserted
     """)    
 
     try:
-        result = await session.execute(
-            query,
-            {
-                "user_id": user_id,
-                "movie_id": movie_id,
-                "user_rating": rating
-            }
-        )
+        row = None
+        for _ in range(3):
+            result = await session.execute(
+                query,
+                {
+                    "user_id": user_id,
+                    "movie_id": movie_id,
+                    "user_rating": rating
+                }
+            )
+            row = result.first()
+            if row:
+                break
+
+        # the row kept being inserted and deleted under us, without the rating it replaced
+        # the user stats can't be updated
+        if not row:
+            raise HTTPException(status_code=409, detail="Rating changed concurrently, try again")
 
         # trigger db flush to catch errors early
         await session.flush()
-        row = result.first()
-        is_new_rating = row.is_new if row else None 
-        return is_new_rating
+        return row.is_new, row.previous_rating
     except IntegrityError as e:
         error_message = str(e)
         # Check if it's a foreign key violation
@@ -109,6 +139,7 @@ async def add_new_movie_rating(session, user_id: str, movie_id: str, rating: flo
             raise HTTPException(status_code=400, detail="Database integrity error")
 
 # update the movie rating stats table for most updated stats that reranker can use
+@traced("db.update_movie_rating_stats")
 async def update_movie_rating_stats(session, movie_id: str, tmdb_avg_rating: float, tmdb_vote_log: float, tmdb_popularity: float):
     query = text("""
         WITH movie_stats AS (
@@ -162,105 +193,73 @@ async def update_movie_rating_stats(session, movie_id: str, tmdb_avg_rating: flo
     if not result:
         raise HTTPException(status_code=500, detail="failed to update movie rating to latest stats")
 
-# fetches the movie_embeddings for the user
-async def get_movie_embeddings(session, user_id: str):
-    query = text("""
-        SELECT e.embedding
-        FROM user_watchlist r
-        JOIN movie_embedding_personalized_prod e ON r.movie_id = e.movie_id
-        WHERE r.user_id = :user_id
-        AND r.user_rating > 0
-        ORDER BY r.updated_at DESC
-    """)
-
-    result = await session.execute(query, {"user_id": user_id})
-    rows = result.fetchall()
-
-    return rows
-
+@traced("db.get_movie_embeddings_by_movie_ids")
 async def get_movie_embeddings_by_movie_ids(
     session, 
     movie_ids: List[str]
-) -> List[tuple[str, np.ndarray]]:
+) -> List[tuple[str, NDArray[np.float32]]]:
     query = text("""
         SELECT movie_id, embedding
         FROM movie_embedding_personalized_prod
-        WHERE movie_id = ANY(:movie_id)
-        ORDER BY array_position(:movie_ids::text[], movie_id)
+        WHERE movie_id = ANY(:movie_ids)
+        ORDER BY array_position(CAST(:movie_ids AS text[]), movie_id)
     """)
 
-    result = await session.execute(query, {"movie_id": movie_ids})
+    result = await session.execute(query, {"movie_ids": movie_ids})
     rows = result.fetchall()
 
     return rows
 
-# get movie metadata for all similar user ids found by most similar cosine sim
-# and wasnt watched/rated by the current user
-async def get_movies_metadata_by_movie_ids(
-    session, 
-    similar_user_ids: List[str],
-    exclude_movie_ids: List[str],
-    limit: int = 300
-):
+# get movie metadata for candidate movie_ids already picked by the in memory candidate
+# engine, keeps the order of movie_ids (most frequent first)
+@traced("db.get_candidate_movies_metadata")
+async def get_candidate_movies_metadata(session, movie_ids: List[str]):
+    if not movie_ids:
+        return []
+
     query = text("""
-        WITH candidate_movies AS (
-            SELECT movie_id, COUNT(*) as frequency
-            FROM user_watchlist
-            WHERE user_id = ANY(:similar_user_ids)
-            AND movie_id != ALL(:exclude_movie_ids)
-            AND user_rating > 0
-            GROUP BY movie_id
-            ORDER BY frequency DESC
-            LIMIT :limit
-        )
         SELECT 
             m.*,
             mrs.*,
-            emb.embedding as movie_embedding,
-            c.frequency
-        FROM candidate_movies c
-        JOIN movie_metadata m ON c.movie_id = m.movie_id
-        JOIN movie_rating_stats mrs on c.movie_id = mrs.movie_id
-        JOIN movie_embedding_personalized_prod emb ON c.movie_id = emb.movie_id
-        ORDER BY c.frequency DESC
+            emb.embedding as movie_embedding
+        FROM movie_metadata m
+        JOIN movie_rating_stats mrs on m.movie_id = mrs.movie_id
+        JOIN movie_embedding_personalized_prod emb ON m.movie_id = emb.movie_id
+        WHERE m.movie_id = ANY(:movie_ids)
+        ORDER BY array_position(CAST(:movie_ids AS text[]), m.movie_id)
     """)
 
-    result = await session.execute(
-        query, 
-        {
-            "similar_user_ids": similar_user_ids,
-            "exclude_movie_ids": exclude_movie_ids if exclude_movie_ids else [''],
-            "limit": limit
-        }
-    )
+    result = await session.execute(query, {"movie_ids": movie_ids})
 
     rows = result.fetchall()
-    recommendations = [
-        {
-            "movie_id": row.movie_id,
-            "movie_emb": row.movie_embedding,
-            "title": row.movie_name,
-            "genres": row.genres,
-            "release_date": row.release_date,
-            "summary": row.summary,
-            "actors": row.actors,
-            "directors": row.director,
-            "language": row.language,
-            "poster_path": row.poster_path,
-            "movie_rating_log": row.rating_count_log,
-            "movie_avg_rating": row.avg_rating,
-            "tmdb_vote_avg": row.tmdb_avg_rating,
-            "tmdb_vote_log": row.tmdb_vote_log,
-            "tmdb_popularity": row.tmdb_popularity
-        }
-        for row in rows
-    ]
+    recommendations = [candidate_movie_from_row(row) for row in rows]
 
     return recommendations
 
+# maps a candidate movie row to the dict the reranker consumes
+def candidate_movie_from_row(row):
+    return {
+        "movie_id": row.movie_id,
+        "movie_emb": row.movie_embedding,
+        "title": row.movie_name,
+        "genres": row.genres,
+        "release_date": row.release_date,
+        "summary": row.summary,
+        "actors": row.actors,
+        "directors": row.director,
+        "language": row.language,
+        "poster_path": row.poster_path,
+        "movie_rating_log": row.rating_count_log,
+        "movie_avg_rating": row.avg_rating,
+        "tmdb_vote_avg": row.tmdb_avg_rating,
+        "tmdb_vote_log": row.tmdb_vote_log,
+        "tmdb_popularity": row.tmdb_popularity
+    }
+
 # helper function for fetching cold start movies from db when users initially signs up,
 # we only have the user's top 3 selected genres as signal for recommendations
-async def get_cold_start_recommendations(session, user_id: str, user_embedding, top3_genre):
+@traced("db.get_cold_start_recommendations")
+async def get_cold_start_recommendations(session, user_id: str, user_embedding: NDArray[np.float32], top3_genre):
 
     # 80/20 split so that 80% of the movies returned initially match the user's
     # initial selected movies and 20% of movies arent so recommendations can recommend
@@ -334,33 +333,82 @@ async def get_cold_start_recommendations(session, user_id: str, user_embedding,
         query,
         {
             "user_id": user_id,
-            "user_embedding": str(user_embedding),
+            "user_embedding": user_embedding,
             "user_genres": top3_genre
         }
     )
 
     movies = result.fetchall()
 
-    recommendations = [
-        {
-            "movie_id": row.movie_id,
-            "title": row.movie_name,
-            "genres": row.genres,
-            "release_date": row.release_date,
-            "summary": row.summary,
-            "actors": row.actors,
-            "director": row.director,
-            "language": row.language,
-            "poster_path": row.poster_path,
-            "tmdb_avg_rating": row.tmdb_avg_rating,
-            "tmdb_vote_count": int(np.exp(row.tmdb_vote_log) - 1),
-            "tmdb_popularity": row.tmdb_popularity
-        }
-        for row in movies
-    ]
+    recommendations = [cold_start_movie_from_row(row) for row in movies]
 
     return recommendations
 
+# metadata of the cold start recommendations picked by the in memory cold start index, keeps
+# the order of movie_ids (closest genre matches first, then the random other genre movies)
+@traced("db.get_cold_start_movies_metadata")
+async def get_cold_start_movies_metadata(session, movie_ids: List[str]):
+    if not movie_ids:
+        return []
+
+    query = text("""
+        SELECT
+            m.movie_id,
+            m.movie_name,
+            m.genres,
+            m.release_date,
+            m.summary,
+            m.actors,
+            m.director,
+            m.language,
+            m.poster_path,
+            mrs.tmdb_avg_rating,
+            mrs.tmdb_vote_log,
+            mrs.tmdb_popularity
+        FROM movie_metadata m
+        JOIN movie_rating_stats mrs ON m.movie_id = mrs.movie_id
+        WHERE m.movie_id = ANY(:movie_ids)
+        ORDER BY array_position(CAST(:movie_ids AS text[]), m.movie_id)
+    """)
+
+    result = await session.execute(query, {"movie_ids": movie_ids})
+
+    return [cold_start_movie_from_row(row) for row in result.fetchall()]
+
+# every movie that can be a cold start recommendation with its genres and cold start
+# embedding (None when it can only be picked as a random other genre movie), used to build
+# the in memory cold start index
+@traced("db.get_all_cold_start_movies")
+async def get_all_cold_start_movies(session):
+    query = text("""
+        SELECT m.movie_id, m.genres, e.embedding
+        FROM movie_metadata m
+        JOIN movie_rating_stats mrs ON m.movie_id = mrs.movie_id
+        LEFT JOIN movie_embedding_coldstart_prod e ON m.movie_id = e.movie_id
+    """)
+
+    result = await session.execute(query)
+
+    return [(row.movie_id, row.genres, row.embedding) for row in result]
+
+# maps a cold start movie row to the dict returned to the frontend
+def cold_start_movie_from_row(row):
+    return {
+        "movie_id": row.movie_id,
+        "title": row.movie_name,
+        "genres": row.genres,
+        "release_date": row.release_date,
+        "summary": row.summary,
+        "actors": row.actors,
+        "director": row.director,
+        "language": row.language,
+        "poster_path": row.poster_path,
+        "tmdb_avg_rating": row.tmdb_avg_rating,
+        "tmdb_vote_count": int(np.exp(row.tmdb_vote_log) - 1),
+        "tmdb_popularity": row.tmdb_popularity
+    }
+
+@traced("db.check_if_movie_rated")
 async def check_if_movie_rated(session, user_id: str, movie_id: str):
     query = text("""
         SELECT user_rating
@@ -377,6 +425,7 @@ async def check_if_movie_rated(session, user_id: str, movie_id: str):
 
     return row
 
+@traced("db.get_movie_tmdb_stats")
 async def get_movie_tmdb_stats(session, movie_id: str):
     query = text("""
         SELECT tmdb_avg_rating, tmdb_vote_log, tmdb_popularity
@@ -0,0 +1,281 @@
+# consolidated queries for the recommendation route, each function is a single statement so a
+# personalized recommendation is 2 round trips (3 when the user embedding is stale) instead of
+# one round trip per lookup
+from sqlalchemy import text
+from fastapi import HTTPException
+from typing import List
+from db.utils.movies_sql_queries import candidate_movie_from_row
+from utils.timing import traced
+
+# fetch everything the route needs to decide which path to take for the user in one query:
+# the user's rated and dismissed movie ids (exclusion set), staleness, the reranker user
+# metadata and the genre embedding for cold start
+@traced("db.get_recommendation_context")
+async def get_recommendation_context(session, user_id: str):
+    query = text("""
+        WITH rated AS (
+            SELECT ARRAY_AGG(movie_id) AS movie_ids
+            FROM user_watchlist
+            WHERE user_id = :user_id
+            AND user_rating > 0
+        ),
+        not_seen AS (
+            SELECT ARRAY_AGG(movie_id) AS movie_ids
+            FROM user_not_seen_movie
+            WHERE user_id = :user_id
+            AND (dismissed_until IS NULL OR dismissed_until > NOW())
+        )
+        SELECT
+            COALESCE(r.movie_ids, ARRAY[]::TEXT[]) AS rated_movie_ids,
+            COALESCE(ns.movie_ids, ARRAY[]::TEXT[]) AS not_seen_movie_ids,
+            urs.is_stale,
+            urs.avg_rating,
+            urs.rating_count_log,
+            urs.top_3_genres,
+            urs.top_50_actors,
+            urs.top_10_directors,
+            ue.embedding AS user_embedding,
+            uge.genre_embedding
+        FROM rated r
+        CROSS JOIN not_seen ns
+        LEFT JOIN user_rating_stats urs ON urs.user_id = :user_id
+        LEFT JOIN user_embeddings ue ON ue.user_id = :user_id
+        LEFT JOIN user_genre_embeddings uge ON uge.user_id = :user_id
+    """)
+
+    result = await session.execute(query, {"user_id": user_id})
+    row = result.first()
+
+    return row
+
+# full rebuild of the user embedding (normalized sum of the rated movie embeddings), the
+# running sums, the genre/actor/director counters and the user rating stats from the whole
+# rating history, and marks the stats fresh, in a single statement. ratings normally keep
+# these current through apply_user_rating_delta, this is the fallback for users flagged
+# is_stale. returns the new user metadata for the reranker
+@traced("db.refresh_user_embedding_and_stats")
+async def refresh_user_embedding_and_stats(session, user_id: str):
+    query = text("""
+        WITH new_embedding AS (
+            SELECT
+                l2_normalize(SUM(e.embedding)) AS embedding,
+                SUM(e.embedding) AS embedding_sum,
+                COUNT(*) AS embedding_count
+            FROM user_watchlist r
+            JOIN movie_embedding_personalized_prod e ON r.movie_id = e.movie_id
+            WHERE r.user_id = :user_id
+            AND r.user_rating > 0
+        ),
+        upsert_embedding AS (
+            INSERT INTO user_embeddings (user_id, embedding, embedding_sum, embedding_count, last_updated)
+            SELECT :user_id, embedding, embedding_sum, embedding_count, NOW()
+            FROM new_embedding
+            WHERE embedding IS NOT NULL
+            ON CONFLICT (user_id)
+            DO UPDATE SET
+                embedding = EXCLUDED.embedding,
+                embedding_sum = EXCLUDED.embedding_sum,
+                embedding_count = EXCLUDED.embedding_count,
+                last_updated = NOW()
+        ),
+        user_movies AS (
+            SELECT
+                m.genres,
+                m.actors,
+                m.director
+            FROM user_watchlist uw
+            JOIN movie_metadata m on uw.movie_id = m.movie_id
+            WHERE uw.user_id = :user_id
+            AND user_rating > 0
+        ),
+        user_stats AS (
+            SELECT
+                COUNT(*) as count,
+                CAST(AVG(user_rating) AS REAL) as avg,
+                CAST(SUM(user_rating) AS REAL) as sum
+            FROM user_watchlist
+            WHERE user_id = :user_id
+            AND user_rating > 0
+        ),
+        feature_counts AS (
+            SELECT 'genre' AS feature_type, f.feature, COUNT(*) AS count
+            FROM user_movies um CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(um.genres)) f(feature)
+            GROUP BY f.feature
+            UNION ALL
+            SELECT 'actor', f.feature, COUNT(*)
+            FROM user_movies um CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(um.actors)) f(feature)
+            GROUP BY f.feature
+            UNION ALL
+            SELECT 'director', f.feature, COUNT(*)
+            FROM user_movies um CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(um.director)) f(feature)
+            GROUP BY f.feature
+        ),
+        upsert_feature_counts AS (
+            INSERT INTO user_feature_counts (user_id, feature_type, feature, count)
+            SELECT :user_id, feature_type, feature, count
+            FROM feature_counts
+            ON CONFLICT (user_id, feature_type, feature)
+            DO UPDATE SET count = EXCLUDED.count
+        ),
+        delete_feature_counts AS (
+            DELETE FROM user_feature_counts fc
+            WHERE fc.user_id = :user_id
+            AND NOT EXISTS (
+                SELECT 1
+                FROM feature_counts c
+                WHERE c.feature_type = fc.feature_type
+                AND c.feature = fc.feature
+            )
+        ),
+        top_genres AS (
+            SELECT feature AS genre
+            FROM feature_counts
+            WHERE feature_type = 'genre'
+            ORDER BY count DESC
+            LIMIT 3
+        ),
+        top_actors AS (
+            SELECT feature AS actor
+            FROM feature_counts
+            WHERE feature_type = 'actor'
+            ORDER BY count DESC
+            LIMIT 50
+        ),
+        top_directors AS (
+            SELECT feature AS director
+            FROM feature_counts
+            WHERE feature_type = 'director'
+            ORDER BY count DESC
+            LIMIT 10
+        ),
+        upsert_stats AS (
+            INSERT INTO user_rating_stats (
+                user_id,
+                avg_rating,
+                rating_count,
+                rating_count_log,
+                top_3_genres,
+                top_50_actors,
+                top_10_directors,
+                rating_sum,
+                is_stale,
+                last_updated
+            )
+            SELECT
+                :user_id,
+                COALESCE((SELECT avg FROM user_stats), 0.0),
+                COALESCE((SELECT count FROM user_stats), 0),
+                LN(COALESCE((SELECT count FROM user_stats), 0) + 1),
+                COALESCE((SELECT ARRAY_AGG(genre) FROM top_genres), ARRAY[]::TEXT[]),
+                COALESCE((SELECT ARRAY_AGG(actor) FROM top_actors), ARRAY[]::TEXT[]),
+                COALESCE((SELECT ARRAY_AGG(director) FROM top_directors), ARRAY[]::TEXT[]),
+                COALESCE((SELECT sum FROM user_stats), 0.0),
+                false,
+                NOW()
+            ON CONFLICT (user_id)
+            DO UPDATE SET
+                avg_rating = EXCLUDED.avg_rating,
+                rating_count = EXCLUDED.rating_count,
+                rating_count_log = EXCLUDED.rating_count_log,
+                top_3_genres = EXCLUDED.top_3_genres,
+                top_50_actors = EXCLUDED.top_50_actors,
+                top_10_directors = EXCLUDED.top_10_directors,
+                rating_sum = EXCLUDED.rating_sum,
+                is_stale = false,
+                last_updated = EXCLUDED.last_updated
+            RETURNING avg_rating, rating_count_log, top_3_genres, top_50_actors, top_10_directors
+        )
+        SELECT
+            ne.embedding AS user_embedding,
+            s.avg_rating,
+            s.rating_count_log,
+            s.top_3_genres,
+            s.top_50_actors,
+            s.top_10_directors
+        FROM upsert_stats s
+        CROSS JOIN new_embedding ne
+    """)
+
+    result = await session.execute(query, {"user_id": user_id})
+    row = result.first()
+
+    if not row or row.user_embedding is None:
+        raise HTTPException(status_code=500, detail="error regenerating user embedding")
+
+    return row
+
+# builds the reranker user metadata dict from a context or refresh row
+def user_metadata_from_row(row):
+    if row.user_embedding is None:
+        raise HTTPException(status_code=404, detail="User embedding not found")
+
+    return {
+        'embedding': row.user_embedding,
+        'avg_rating': row.avg_rating,
+        'rating_log': row.rating_count_log,
+        'top_3_genres': row.top_3_genres,
+        'top_50_actors': row.top_50_actors,
+        'top_10_directors': row.top_10_directors
+    }
+
+# find the k most similar users with the pgvector hnsw index and return the most frequently
+# positively rated movies among them that the user hasn't seen, with the movie metadata the
+# reranker needs, in one query
+@traced("db.get_collaborative_candidates")
+async def get_collaborative_candidates(
+    session,
+    user_id: str,
+    exclude_movie_ids: List[str],
+    similar_user_count: int = 50,
+    limit: int = 300
+):
+    query = text("""
+        WITH target_user AS (
+            SELECT embedding
+            FROM user_embeddings
+            WHERE user_id = :user_id
+        ),
+        similar_users AS (
+            SELECT ue.user_id
+            FROM user_embeddings ue
+            CROSS JOIN target_user tu
+            WHERE ue.user_id != :user_id
+            ORDER BY ue.embedding <=> tu.embedding
+            LIMIT :similar_user_count
+        ),
+        candidate_movies AS (
+            SELECT movie_id, COUNT(*) as frequency
+            FROM user_watchlist
+            WHERE user_id IN (SELECT user_id FROM similar_users)
+            AND movie_id != ALL(:exclude_movie_ids)
+            AND user_rating > 0
+            GROUP BY movie_id
+            ORDER BY frequency DESC
+            LIMIT :limit
+        )
+        SELECT
+            m.*,
+            mrs.*,
+            emb.embedding as movie_embedding,
+            c.frequency
+        FROM candidate_movies c
+        JOIN movie_metadata m ON c.movie_id = m.movie_id
+        JOIN movie_rating_stats mrs on c.movie_id = mrs.movie_id
+        JOIN movie_embedding_personalized_prod emb ON c.movie_id = emb.movie_id
+        ORDER BY c.frequency DESC
+    """)
+
+    result = await session.execute(
+        query,
+        {
+            "user_id": user_id,
+            "exclude_movie_ids": exclude_movie_ids if exclude_movie_ids else [''],
+            "similar_user_count": similar_user_count,
+            "limit": limit
+        }
+    )
+
+    rows = result.fetchall()
+    recommendations = [candidate_movie_from_row(row) for row in rows]
+
+    return recommendations
@@ -1,34 +1,14 @@
 from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
-from typing import List
+from typing import List, Optional
 import numpy as np
-
-async def get_user_genres(session, user_id: str):
-    query = text("""
-        SELECT e.user_id, r.top_3_genres, e.genre_embedding
-        FROM user_genre_embeddings e
-        JOIN user_rating_stats r ON e.user_id = r.user_id
-        WHERE e.user_id = :user_id
-    """)
-
-    result = await session.execute(
-        query,
-        {"user_id": str(user_id)}
-    )
-
-    genre_info = result.fetchone()
-
-    if not genre_info:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    top_3_genres = genre_info.top_3_genres
-    genre_embedding = genre_info.genre_embedding
-
-    return top_3_genres, genre_embedding
+from numpy.typing import NDArray
+from utils.timing import traced
 
 # create a new user embedding using the 3 genres selected during signup
-async def new_user_genre_embedding(session, user_id: str, genre_embedding: str, top3_genres: List[str]):
+@traced("db.new_user_genre_embedding")
+async def new_user_genre_embedding(session, user_id: str, genre_embedding: NDArray[np.float32], top3_genres: List[str]):
     query = text("""
         WITH insert1 AS (
             INSERT INTO user_genre_embeddings (user_id, genre_embedding, last_updated)
@@ -64,28 +44,9 @@ async def new_user_genre_embedding(session, user_id: str, genre_embedding: str,
         else:
             raise HTTPException(status_code=400, detail="Database integrity error")
 
-# regenerates the user embedding containing their rated movies by averaging
-# the movie embeddings
-async def regenerate_user_movie_embedding(session, user_id: str, user_emb: np.ndarray):
-    # insert/update user embedding
-    upsert_query = text("""
-        INSERT into user_embeddings (user_id, embedding, last_updated)
-        VALUES (:user_id, :embedding, NOW())
-        ON CONFLICT (user_id)
-        DO UPDATE SET
-            embedding = EXCLUDED.embedding,
-            last_updated = NOW()
-    """)
-
-    await session.execute(
-        upsert_query,
-        {
-            "user_id": user_id,
-            "embedding": str(user_emb.tolist())
-        }
-    )
-    
-# fetch the amount of users that have rated at least one movie in the database
+# fetch the amount of users that have rated at least one movie in the database,
+# read through the UserCountCache instead of per request
+@traced("db.get_user_with_ratings_count")
 async def get_user_with_ratings_count(session):
     query = text("""
         SELECT COUNT(DISTINCT user_id)
@@ -99,210 +60,189 @@ async def get_user_with_ratings_count(session):
 
     return num_users
 
-
-# find k-most similar users to current user embedding using pgvector hnsw index
-# and also their user embedding and rating metadata needed for the lightgbm reranker
-async def get_similar_users_and_user_metadata(session, user_id: str, similar_user_count: int = 50):
+# fetch every user embedding, used to build the in memory candidate engine
+@traced("db.get_all_user_embeddings")
+async def get_all_user_embeddings(session):
     query = text("""
-        WITH target_user AS (
-            SELECT
-                ue.user_id,
-                ue.embedding,
-                urs.avg_rating,
-                urs.rating_count_log,
-                urs.top_3_genres,
-                urs.top_50_actors,
-                urs.top_10_directors
-            FROM user_embeddings ue
-            JOIN user_rating_stats urs ON ue.user_id = urs.user_id
-            WHERE ue.user_id = :user_id
-        )
-        SELECT
-            ue.user_id,
-            1 - (ue.embedding <=> tu.embedding) AS similarity,
-            tu.embedding as user_embedding,
-            tu.avg_rating as user_avg_rating,
-            tu.rating_count_log as user_rating_log,
-            tu.top_3_genres,
-            tu.top_50_actors,
-            tu.top_10_directors
-        FROM user_embeddings ue
-        CROSS JOIN target_user tu
-        WHERE ue.user_id != :user_id
-        ORDER BY ue.embedding <=> tu.embedding
-        LIMIT :limit
+        SELECT user_id, embedding
+        FROM user_embeddings
     """)
 
-    result = await session.execute(
-        query,
-        {   
-            "user_id": user_id,
-            "limit": similar_user_count
-        }
-    )
-
+    result = await session.execute(query)
     rows = result.fetchall()
 
-    if not rows:
-        raise HTTPException(status_code=404, detail="User embedding not found")
-    
-    # extract all user metadata from first row
-    user_embedding = rows[0].user_embedding
-    user_avg_rating = rows[0].user_avg_rating
-    user_rating_log = rows[0].user_rating_log
-    top_3_genres = rows[0].top_3_genres
-    top_50_actors = rows[0].top_50_actors
-    top_10_directors = rows[0].top_10_directors
-
-    return {
-        'embedding': user_embedding,
-        'avg_rating': user_avg_rating,
-        'rating_log': user_rating_log,
-        'top_3_genres': top_3_genres,
-        'top_50_actors': top_50_actors,
-        'top_10_directors': top_10_directors
-    }, rows
+    return rows
 
-async def get_user_rated_movie_ids(session, user_id: str):
+# fetch every positive (user_id, movie_id) rating, used to build the in memory candidate engine
+@traced("db.get_all_positive_ratings")
+async def get_all_positive_ratings(session):
     query = text("""
-        SELECT movie_id
+        SELECT user_id, movie_id
         FROM user_watchlist
-        WHERE user_id = :user_id
-        AND user_rating > 0
+        WHERE user_rating > 0
     """)
 
-    result = await session.execute(query, {"user_id": user_id})
+    result = await session.execute(query)
     rows = result.fetchall()
 
     return rows
 
-async def update_user_ratings_stats(session, user_id: str):
-    query = text("""
-        WITH user_movies AS (
-            SELECT 
-                m.genres,
-                m.actors,
-                m.director
-            FROM user_watchlist uw
-            JOIN movie_metadata m on uw.movie_id = m.movie_id
-            WHERE uw.user_id = :user_id
-            AND user_rating > 0
-        ),
-        user_stats AS (
-            SELECT
-                COUNT(*) as count,
-                CAST(AVG(user_rating) AS REAL) as avg
-            FROM user_watchlist
-            WHERE user_id = :user_id
-            AND user_rating > 0
-        ),
-        top_genres AS (
-            SELECT genre
-            FROM (
-                SELECT UNNEST(genres) as genre
-                FROM user_movies
-            ) g
-            GROUP BY genre
-            ORDER BY COUNT(*) DESC
-            LIMIT 3
-        ),
-        top_actors AS (
-            SELECT actor
-            FROM (
-                SELECT UNNEST(actors) as actor
-                FROM user_movies
-            ) a
-            GROUP BY actor
-            ORDER BY COUNT(*) DESC
-            LIMIT 50
-        ),
-        top_directors AS (
-            SELECT director
-            FROM (
-                SELECT UNNEST(director) as director
-                FROM user_movies
-            ) d
-            GROUP BY director
-            ORDER BY COUNT(*) DESC
-            LIMIT 10
-        )
-        INSERT INTO user_rating_stats (
-            user_id,
-            avg_rating,
-            rating_count,
-            rating_count_log,
-            top_3_genres,
-            top_50_actors,
-            top_10_directors,
-            last_updated
-        )
-        SELECT
-            :user_id,
-            COALESCE((SELECT avg FROM user_stats), 0.0),
-            COALESCE((SELECT count FROM user_stats), 0),
-            LN(COALESCE((SELECT count FROM user_stats), 0) + 1),
-            COALESCE((SELECT ARRAY_AGG(genre) FROM top_genres), ARRAY[]::TEXT[]),
-            COALESCE((SELECT ARRAY_AGG(actor) FROM top_actors), ARRAY[]::TEXT[]),
-            COALESCE((SELECT ARRAY_AGG(director) FROM top_directors), ARRAY[]::TEXT[]),
-            NOW()
-        ON CONFLICT (user_id)
-        DO UPDATE SET
-            avg_rating = EXCLUDED.avg_rating,
-            rating_count = EXCLUDED.rating_count,
-            rating_count_log = EXCLUDED.rating_count_log,
-            top_3_genres = EXCLUDED.top_3_genres,
-            top_50_actors = EXCLUDED.top_50_actors,
-            top_10_directors = EXCLUDED.top_10_directors,
-            last_updated = EXCLUDED.last_updated
-        RETURNING *
-    """)
-
-    result = await session.execute(query, {"user_id": user_id})
-
-    if not result:
-        raise HTTPException(status_code=500, detail="error updating user rating stats")
-    
+# returns the rating of the deleted row (None if there was none), read from the row as it's
+# deleted so a concurrent re-rate can't make it stale
+@traced("db.delete_from_watchlist")
 async def delete_from_watchlist(session, user_id: str, movie_id: str):
     query = text("""
         DELETE FROM user_watchlist
         WHERE user_id = :user_id
         AND movie_id = :movie_id
+        RETURNING user_rating
     """)
 
-    await session.execute(query, {"user_id": user_id, "movie_id": movie_id})
+    result = await session.execute(query, {"user_id": user_id, "movie_id": movie_id})
 
     # Todo: handle delete failure
-
-async def check_user_rating_stats_stale(session, user_id: str):
+    return result.scalar()
+
+# applies one rating change to the user's running sum embedding, rating stats and
+# genre/actor/director counters instead of recomputing them from the whole rating history.
+# a movie counts towards the user only while its rating is positive, so the transition
+# from previous_rating to rating decides if the movie is added, removed or neither.
+# returns the new user embedding, or None when the embedding didn't change
+@traced("db.apply_user_rating_delta")
+async def apply_user_rating_delta(session, user_id: str, movie_id: str, previous_rating: Optional[float], rating: float):
+    was_positive = previous_rating is not None and previous_rating > 0
+    is_positive = rating > 0
+
+    sign = int(is_positive) - int(was_positive)
+    rating_delta = (rating if is_positive else 0.0) - (previous_rating if was_positive else 0.0)
+
+    if sign == 0 and rating_delta == 0:
+        return None
+
+    # top_* arrays are picked from the counters not touched by this rating (a bounded
+    # index scan per feature type) merged with the new counts of the ones that were, since
+    # the counter upsert isn't visible to the rest of the statement. top_3_genres keeps the
+    # genres picked at signup until the user has enough ratings for personalized recs
     query = text("""
-        SELECT is_stale
-        FROM user_rating_stats
-        WHERE user_id = :user_id
+        WITH movie AS (
+            SELECT m.genres, m.actors, m.director, e.embedding
+            FROM movie_metadata m
+            LEFT JOIN movie_embedding_personalized_prod e ON m.movie_id = e.movie_id
+            WHERE m.movie_id = :movie_id
+        ),
+        add_embedding AS (
+            INSERT INTO user_embeddings (user_id, embedding, embedding_sum, embedding_count, last_updated)
+            SELECT :user_id, l2_normalize(embedding), embedding, 1, NOW()
+            FROM movie
+            WHERE :sign > 0
+            AND embedding IS NOT NULL
+            ON CONFLICT (user_id)
+            DO UPDATE SET
+                embedding_sum = COALESCE(user_embeddings.embedding_sum + EXCLUDED.embedding_sum, EXCLUDED.embedding_sum),
+                embedding_count = user_embeddings.embedding_count + 1,
+                embedding = l2_normalize(COALESCE(user_embeddings.embedding_sum + EXCLUDED.embedding_sum, EXCLUDED.embedding_sum)),
+                last_updated = NOW()
+            RETURNING embedding
+        ),
+        subtract_embedding AS (
+            UPDATE user_embeddings ue
+            SET
+                embedding_sum = CASE WHEN ue.embedding_count > 1 THEN ue.embedding_sum - m.embedding END,
+                embedding_count = ue.embedding_count - 1,
+                embedding = CASE WHEN ue.embedding_count > 1 THEN l2_normalize(ue.embedding_sum - m.embedding) ELSE ue.embedding END,
+                last_updated = NOW()
+            FROM movie m
+            WHERE ue.user_id = :user_id
+            AND :sign < 0
+            AND m.embedding IS NOT NULL
+            AND ue.embedding_count > 0
+            RETURNING ue.embedding
+        ),
+        movie_features AS (
+            SELECT 'genre' AS feature_type, f.feature
+            FROM movie CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(movie.genres)) f(feature)
+            UNION ALL
+            SELECT 'actor', f.feature
+            FROM movie CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(movie.actors)) f(feature)
+            UNION ALL
+            SELECT 'director', f.feature
+            FROM movie CROSS JOIN LATERAL (SELECT DISTINCT UNNEST(movie.director)) f(feature)
+        ),
+        upsert_counts AS (
+            INSERT INTO user_feature_counts (user_id, feature_type, feature, count)
+            SELECT :user_id, feature_type, feature, :sign
+            FROM movie_features
+            WHERE :sign != 0
+            ON CONFLICT (user_id, feature_type, feature)
+            DO UPDATE SET count = user_feature_counts.count + EXCLUDED.count
+            RETURNING feature_type, feature, count
+        ),
+        top_features AS (
+            SELECT
+                t.feature_type,
+                ARRAY(
+                    SELECT c.feature
+                    FROM (
+                        SELECT u.feature, u.count
+                        FROM upsert_counts u
+                        WHERE u.feature_type = t.feature_type
+                        UNION ALL
+                        (
+                            SELECT fc.feature, fc.count
+                            FROM user_feature_counts fc
+                            WHERE fc.user_id = :user_id
+                            AND fc.feature_type = t.feature_type
+                            AND fc.feature NOT IN (
+                                SELECT u.feature FROM upsert_counts u WHERE u.feature_type = t.feature_type
+                            )
+                            ORDER BY fc.count DESC
+                            LIMIT t.k
+                        )
+                    ) c
+                    WHERE c.count > 0
+                    ORDER BY c.count DESC
+                    LIMIT t.k
+                ) AS features
+            FROM (VALUES ('genre', 3), ('actor', 50), ('director', 10)) AS t(feature_type, k)
+        ),
+        update_stats AS (
+            UPDATE user_rating_stats
+            SET
+                rating_count = rating_count + :sign,
+                rating_sum = rating_sum + :rating_delta,
+                avg_rating = CASE
+                    WHEN rating_count + :sign > 0 THEN (rating_sum + :rating_delta) / (rating_count + :sign)
+                    ELSE 0.0
+                END,
+                rating_count_log = LN(rating_count + :sign + 1),
+                top_3_genres = CASE
+                    WHEN rating_count + :sign >= 10 THEN (SELECT features FROM top_features WHERE feature_type = 'genre')
+                    ELSE top_3_genres
+                END,
+                top_50_actors = (SELECT features FROM top_features WHERE feature_type = 'actor'),
+                top_10_directors = (SELECT features FROM top_features WHERE feature_type = 'director'),
+                last_updated = NOW()
+            WHERE user_id = :user_id
+        )
+        SELECT embedding FROM add_embedding
+        UNION ALL
+        SELECT embedding FROM subtract_embedding
     """)
 
-    result = await session.execute(query, {"user_id": user_id})
+    result = await session.execute(
+        query,
+        {
+            "user_id": user_id,
+            "movie_id": movie_id,
+            "sign": sign,
+            "rating_delta": rating_delta
+        }
+    )
     row = result.first()
 
-    return row
-
-async def set_user_rating_stats_stale(session, user_id: str):
-    query = text("""
-        UPDATE user_rating_stats
-        SET is_stale = true
-        WHERE user_id = :user_id
-    """)
-
-    await session.execute(query, {"user_id": user_id})
-
-async def set_user_rating_stats_fresh(session, user_id: str):
-    query = text("""
-        UPDATE user_rating_stats
-        SET is_stale = false
-        WHERE user_id = :user_id
-    """)
-
-    await session.execute(query, {"user_id": user_id})
+    return row.embedding if row else None
 
+@traced("db.add_user_not_seen_movie")
 async def add_user_not_seen_movie(session, user_id: str, movie_id: str, timer: any):
     query = text("""
         INSERT INTO user_not_seen_movie (
@@ -324,20 +264,7 @@ async def add_user_not_seen_movie(session, user_id: str, movie_id: str, timer: a
         "dismissed_until": timer
     })
 
-#Get movie IDs that user has marked as not seen and are still within the dismissal period
-async def get_user_not_seen_movie_ids(session, user_id: str):
-    query = text("""
-        SELECT movie_id
-        FROM user_not_seen_movie
-        WHERE user_id = :user_id
-        AND (dismissed_until IS NULL OR dismissed_until > NOW())
-    """)
-
-    result = await session.execute(query, {"user_id": user_id})
-    rows = result.fetchall()
-
-    return rows
-
+@traced("db.get_user_watchlist")
 async def get_user_watchlist(session, user_id: str):
     query = text("""
         SELECT 
@@ -1,17 +1,21 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 from db.config.conn import engine
 from routes.recommendations import router as recommendation_router
 from routes.user import router as user_router
 from routes.movies import router as movie_router
-from model.utils.cold_start_user_tower import ColdStartUserTower
-from model.utils.movie_tower import MovieTower
-from model.utils.reranker_model import Reranker
+from routes.admin import router as admin_router
 from middleware.cors import add_cors
+from middleware.metrics import add_metrics
 from utils.env_config import settings
-from utils.download_model_files import download_recommendation_model_files
-from utils.load_model_files import load_sentence_transformer_model, load_recommendation_models
+from utils.startup import StartupState, load_models, load_models_in_background
+from utils.user_count_cache import UserCountCache, refresh_user_count
+from utils.inference_executor import InferenceExecutor
+from utils.recommendation_cache import create_recommendation_cache
+from utils.metrics import render, stats_gauges
 import logging
 
 # set up logging
@@ -25,52 +29,120 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting CineSense Recommendation API")
-    try:
-        download_recommendation_model_files()
-    except Exception as e:
-        logger.error(f"❌ Failed to download models from S3: {e}")
-        raise
+    app.state.startup = StartupState()
 
-    # Load models once on startup
-    logger.info("Loading ML models...")
+    # database only state first, the watchlist/rating stats routes only need these
+    app.state.candidate_engine = None
+    app.state.cold_start_index = None
+
+    # model calls run on this pool instead of the event loop
+    app.state.inference_executor = InferenceExecutor(settings.inference_max_workers, settings.inference_max_queue)
+
+    # per user recommendations, invalidated by the rating/watchlist/not seen routes
+    app.state.recommendation_cache = create_recommendation_cache()
 
-    (
-        user_tower_path, 
-        movie_tower_path, 
-        genre_mlb, 
-        reranker_model_path
-    ) = load_recommendation_models()
+    # cached cold start gate, counted and refreshed in the background so startup doesn't need
+    # the database, a request before the first count has finished counts on demand
+    app.state.user_count_cache = UserCountCache(settings.user_count_cache_ttl_seconds)
+    user_count_task = asyncio.create_task(refresh_user_count(app))
 
-    sentence_transformer_model = load_sentence_transformer_model()
-    app.state.cold_start_user_tower = ColdStartUserTower(user_tower_path, genre_mlb)
-    app.state.movie_tower = MovieTower(movie_tower_path, genre_mlb, sentence_transformer_model)
-    app.state.reranker_model = Reranker(reranker_model_path)
-    logger.info("Models loaded successfully")
+    # Load models once on startup, either before accepting traffic or in the background with
+    # the model routes returning 503 until /api/ready does
+    logger.info("Loading ML models...")
+    model_task = None
+    if settings.lazy_model_loading:
+        model_task = asyncio.create_task(load_models_in_background(app))
+    else:
+        try:
+            await load_models(app)
+        except Exception as e:
+            logger.error(f"❌ Failed to load models: {e}")
+            raise
 
     yield
 
     logger.info("Shutting down...")
+    if model_task:
+        model_task.cancel()
+    for task in app.state.startup.background_tasks:
+        task.cancel()
+    user_count_task.cancel()
+    app.state.inference_executor.shutdown()
+    if app.state.recommendation_cache:
+        await app.state.recommendation_cache.close()
     await engine.dispose()
     logger.info("Shutdown complete!!!")
 
 app = FastAPI(lifespan=lifespan)
 
-# middleware
+# middleware, metrics is added last so it is the outermost and times the whole request
 add_cors(app)
+add_metrics(app)
 
 logger.info("Registering routes")
 app.include_router(recommendation_router, prefix="/api")
 app.include_router(user_router, prefix="/api")
 app.include_router(movie_router, prefix="/api")
+app.include_router(admin_router, prefix="/api")
 logger.info("Routes registered Successfully!")
 
 @app.get("/api")
 async def base():
     return {"message": "welcome to user recommendations api"}
 
+# liveness, the process is up and serving (models may still be loading)
 @app.get("/api/health")
 async def health():
     return {"status": "healthy!"}
 
+# readiness, 503 until every model is loaded, also reports how long each startup phase took
+@app.get("/api/ready")
+async def ready():
+    startup = app.state.startup
+    if not startup.ready:
+        raise HTTPException(status_code=503, detail=startup.status())
+
+    return startup.status()
+
+# queue depth and wait times of the inference thread pool, the encode batch sizes and the
+# movie embedding cache hit rates
+@app.get("/api/inference/stats")
+async def inference_stats():
+    stats = {"executor": app.state.inference_executor.stats()}
+    models = getattr(app.state, "models", None)
+    if models:
+        stats["encode_batcher"] = models.encode_batcher.stats()
+        stats["movie_embedding_cache"] = models.movie_embedding_cache.stats()
+
+    return stats
+
+# hit rate and invalidations of the per user recommendation cache
+@app.get("/api/recommendations/cache/stats")
+async def recommendation_cache_stats():
+    cache = app.state.recommendation_cache
+    return cache.stats() if cache else {"backend": None}
+
+# connection pool usage and how long requests waited to check out a connection
+@app.get("/api/db/pool/stats")
+async def db_pool_stats():
+    return engine.pool.stats()
+
+# prometheus scrape endpoint: request and stage latency histograms plus the numeric stats of
+# the inference executor, caches and connection pool as gauges
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    gauges = [
+        *stats_gauges("inference_executor", app.state.inference_executor.stats()),
+        *stats_gauges("db_pool", engine.pool.stats()),
+    ]
+    if app.state.recommendation_cache:
+        gauges.extend(stats_gauges("recommendation_cache", app.state.recommendation_cache.stats()))
+    models = getattr(app.state, "models", None)
+    if models:
+        gauges.extend(stats_gauges("encode_batcher", models.encode_batcher.stats()))
+        gauges.extend(stats_gauges("movie_embedding_cache", models.movie_embedding_cache.stats()))
+
+    return PlainTextResponse(render(gauges), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -11,5 +11,6 @@ def add_cors(app):
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["*"],
+        # browsers ignore "*" on credentialed requests, so exposed headers are listed
+        expose_headers=["X-Next-Cursor"],
     )
\ No newline at end of file
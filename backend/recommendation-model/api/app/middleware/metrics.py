@@ -0,0 +1,47 @@
+import time
+from starlette.datastructures import MutableHeaders
+from utils.env_config import settings
+from utils.metrics import HTTP_REQUEST_SECONDS
+from utils.timing import request_trace
+
+# times every request into the cinesense_http_request_duration_seconds histogram by route
+# template (so /recommendations/get/{user_id} is one series, not one per user) and collects
+# the request's spans. plain asgi instead of BaseHTTPMiddleware, which would run the route in
+# another task and lose the trace context
+class MetricsMiddleware:
+    def __init__(self, app, server_timing_enabled: bool) -> None:
+        self.app = app
+        self.server_timing_enabled = server_timing_enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        server_timing = self.server_timing_enabled and any(name == b"x-server-timing" for name, _ in scope["headers"])
+
+        with request_trace() as trace:
+            async def send_with_metrics(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    if server_timing:
+                        headers = MutableHeaders(scope=message)
+                        headers.append("Server-Timing", trace.server_timing((time.perf_counter() - start) * 1000))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_metrics)
+            finally:
+                route = scope.get("route")
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - start,
+                    route.path if route else "unmatched",
+                    scope["method"],
+                    str(status)
+                )
+
+def add_metrics(app):
+    app.add_middleware(MetricsMiddleware, server_timing_enabled=settings.server_timing_enabled)
@@ -0,0 +1,206 @@
+import numpy as np
+from numpy.typing import NDArray
+from typing import Dict, List, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# In memory candidate generation - holds every user embedding as one normalized matrix and
+# a CSR user -> movie adjacency of positive ratings, so "top k similar users -> top n most
+# frequent unseen movies" can be answered without hitting the database
+class CandidateEngine:
+    def __init__(
+        self,
+        user_ids: List[str],
+        user_embeddings: NDArray[np.float32],
+        movie_ids: List[str],
+        indptr: NDArray[np.int64],
+        indices: NDArray[np.int64],
+        compact_threshold: int = 10_000
+    ) -> None:
+        self.user_ids = list(user_ids)
+        self.user_index: Dict[str, int] = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.user_embeddings = self._normalize(user_embeddings)
+
+        self.movie_ids = list(movie_ids)
+        self.movie_index: Dict[str, int] = {movie_id: i for i, movie_id in enumerate(self.movie_ids)}
+
+        # CSR adjacency, row i holds the movie indexes user i rated positively
+        self.indptr = indptr
+        self.indices = indices
+
+        # ratings that arrived after the CSR was built, applied on top of it at query time
+        # and folded back into the CSR once there are more than compact_threshold of them
+        self._added: Dict[int, Set[int]] = {}
+        self._removed: Dict[int, Set[int]] = {}
+        self._pending_updates = 0
+        self.compact_threshold = compact_threshold
+
+    # builds the engine from (user_id, embedding) rows and (user_id, movie_id) positive rating rows
+    @classmethod
+    def build(cls, user_embedding_rows, rating_rows) -> "CandidateEngine":
+        user_ids = [row[0] for row in user_embedding_rows]
+        if user_embedding_rows:
+            user_embeddings = np.stack([row[1] for row in user_embedding_rows]).astype(np.float32)
+        else:
+            user_embeddings = np.empty((0, 0), dtype=np.float32)
+
+        user_index = {user_id: i for i, user_id in enumerate(user_ids)}
+        movie_index: Dict[str, int] = {}
+        rows, cols = [], []
+
+        for user_id, movie_id in rating_rows:
+            # ratings of users without an embedding can never be a similar user
+            if user_id not in user_index:
+                continue
+            rows.append(user_index[user_id])
+            cols.append(movie_index.setdefault(movie_id, len(movie_index)))
+
+        indptr, indices = cls._to_csr(np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), len(user_ids))
+
+        engine = cls(user_ids, user_embeddings, list(movie_index), indptr, indices)
+        logger.info(f"Candidate engine built: {len(user_ids)} users, {len(movie_index)} movies, {len(indices)} ratings")
+
+        return engine
+
+    @staticmethod
+    def _to_csr(rows: NDArray[np.int64], cols: NDArray[np.int64], num_users: int) -> Tuple[NDArray[np.int64], NDArray[np.int64]]:
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(num_users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_users), out=indptr[1:])
+
+        return indptr, cols[order]
+
+    @staticmethod
+    def _normalize(embeddings: NDArray[np.float32]) -> NDArray[np.float32]:
+        if embeddings.size == 0:
+            return embeddings
+        norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+
+        return embeddings / np.maximum(norms, 1e-8)
+
+    def has_user(self, user_id: str) -> bool:
+        return user_id in self.user_index
+
+    # top k most similar users by cosine similarity, excluding the user themself
+    def similar_users(self, user_id: str, similar_user_count: int = 50) -> List[Tuple[str, float]]:
+        user_idx = self.user_index[user_id]
+        similarities = self.user_embeddings @ self.user_embeddings[user_idx]
+        similarities[user_idx] = -np.inf
+
+        k = min(similar_user_count, len(self.user_ids) - 1)
+        if k <= 0:
+            return []
+
+        top_idx = np.argpartition(-similarities, k - 1)[:k]
+        top_idx = top_idx[np.argsort(-similarities[top_idx], kind="stable")]
+
+        return [(self.user_ids[i], float(similarities[i])) for i in top_idx]
+
+    def _user_movies(self, user_idx: int) -> NDArray[np.int64]:
+        movies = self.indices[self.indptr[user_idx]:self.indptr[user_idx + 1]] if user_idx < len(self.indptr) - 1 else self.indices[:0]
+
+        removed = self._removed.get(user_idx)
+        if removed:
+            movies = movies[~np.isin(movies, list(removed))]
+
+        added = self._added.get(user_idx)
+        if added:
+            movies = np.concatenate([movies, np.fromiter(added, dtype=np.int64, count=len(added))])
+
+        return movies
+
+    # same result as the similar users + GROUP BY movie_id sql path: the most frequently
+    # positively rated movies among the similar users that the user hasn't seen
+    def candidate_movie_ids(
+        self,
+        user_id: str,
+        exclude_movie_ids: List[str],
+        similar_user_count: int = 50,
+        limit: int = 300
+    ) -> List[str]:
+        similar_users = self.similar_users(user_id, similar_user_count)
+        if not similar_users:
+            return []
+
+        neighbour_movies = np.concatenate([self._user_movies(self.user_index[uid]) for uid, _ in similar_users])
+        frequency = np.bincount(neighbour_movies, minlength=len(self.movie_ids))
+
+        excluded_idx = [self.movie_index[movie_id] for movie_id in exclude_movie_ids if movie_id in self.movie_index]
+        frequency[excluded_idx] = 0
+
+        candidates = np.flatnonzero(frequency)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-frequency[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-frequency[candidates], kind="stable")]
+
+        return [self.movie_ids[i] for i in candidates]
+
+    # incremental refresh when a user's embedding is regenerated
+    def update_user_embedding(self, user_id: str, embedding: NDArray[np.float32]) -> None:
+        embedding = self._normalize(np.asarray(embedding, dtype=np.float32))
+
+        if user_id in self.user_index:
+            self.user_embeddings[self.user_index[user_id]] = embedding
+            return
+
+        # new user, grow the matrix and give the user an empty adjacency row
+        self.user_index[user_id] = len(self.user_ids)
+        self.user_ids.append(user_id)
+        if self.user_embeddings.size == 0:
+            self.user_embeddings = embedding.reshape(1, -1)
+        else:
+            self.user_embeddings = np.vstack([self.user_embeddings, embedding])
+        self.indptr = np.append(self.indptr, self.indptr[-1])
+
+    # incremental refresh when a rating arrives, only positive ratings are part of the adjacency
+    def add_rating(self, user_id: str, movie_id: str) -> None:
+        user_idx = self.user_index.get(user_id)
+        if user_idx is None:
+            return
+
+        movie_idx = self.movie_index.setdefault(movie_id, len(self.movie_ids))
+        if movie_idx == len(self.movie_ids):
+            self.movie_ids.append(movie_id)
+
+        removed = self._removed.get(user_idx)
+        if removed and movie_idx in removed:
+            removed.discard(movie_idx)
+        elif movie_idx not in self._user_movies(user_idx):
+            self._added.setdefault(user_idx, set()).add(movie_idx)
+
+        self._track_update()
+
+    def remove_rating(self, user_id: str, movie_id: str) -> None:
+        user_idx = self.user_index.get(user_id)
+        movie_idx = self.movie_index.get(movie_id)
+        if user_idx is None or movie_idx is None:
+            return
+
+        added = self._added.get(user_idx)
+        if added and movie_idx in added:
+            added.discard(movie_idx)
+        else:
+            self._removed.setdefault(user_idx, set()).add(movie_idx)
+
+        self._track_update()
+
+    def _track_update(self) -> None:
+        self._pending_updates += 1
+        if self._pending_updates >= self.compact_threshold:
+            self.compact()
+
+    # folds the pending rating updates back into the CSR arrays
+    def compact(self) -> None:
+        rows, cols = [], []
+        for user_idx in range(len(self.user_ids)):
+            movies = self._user_movies(user_idx)
+            rows.append(np.full(len(movies), user_idx, dtype=np.int64))
+            cols.append(movies)
+
+        self._added.clear()
+        self._removed.clear()
+        self._pending_updates = 0
+
+        if rows:
+            self.indptr, self.indices = self._to_csr(np.concatenate(rows), np.concatenate(cols), len(self.user_ids))
@@ -0,0 +1,143 @@
+import itertools
+import numpy as np
+from numpy.typing import NDArray
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+GenreKey = Tuple[str, ...]
+
+# Precomputed cold start recommendations - the cold start user embedding only depends on the
+# 3 genres picked at signup, so the ranked genre matched movies for every genre triple are
+# computed once (cosine distance to the triple's embedding, same as the hnsw query) and a
+# request only has to skip the movies the user already rated or dismissed. the "other genres"
+# slice is read from a pre shuffled pool of every movie instead of sorting by RANDOM()
+class ColdStartIndex:
+    def __init__(
+        self,
+        movie_ids: List[str],
+        movie_genres: NDArray[np.bool_],
+        genres: List[str],
+        keys: List[GenreKey],
+        key_embeddings: NDArray[np.float32],
+        ranked: NDArray[np.int32],
+        random_pool: NDArray[np.int32]
+    ) -> None:
+        self.movie_ids = movie_ids
+        # [movies, genres] genre membership of every movie, only the genres the tower knows
+        self.movie_genres = movie_genres
+        self.genre_index: Dict[str, int] = {genre: i for i, genre in enumerate(genres)}
+
+        self.key_index: Dict[GenreKey, int] = {key: i for i, key in enumerate(keys)}
+        self.key_embeddings = key_embeddings
+        # [keys, candidates_per_key] movie indexes by distance, -1 padded when fewer movies match
+        self.ranked = ranked
+        self.random_pool = random_pool
+        self.rng = np.random.default_rng()
+
+    # canonical key of a genre selection, the order genres were picked in doesn't matter
+    @staticmethod
+    def genre_key(genres: Sequence[str]) -> GenreKey:
+        return tuple(sorted(set(genres)))
+
+    # builds the index from (movie_id, genres, coldstart embedding) rows, the embedding is None
+    # for movies that can only be picked for the random slice. keys are the genre triples and
+    # key_embeddings their cold start user embeddings (ColdStartUserTower.precomputed_embeddings)
+    @classmethod
+    def build(
+        cls,
+        movie_rows,
+        genres: List[str],
+        keys: List[GenreKey],
+        key_embeddings: NDArray[np.float32],
+        candidates_per_key: int = 100,
+        chunk_size: int = 64
+    ) -> "ColdStartIndex":
+        movie_ids = [row[0] for row in movie_rows]
+        genre_index = {genre: i for i, genre in enumerate(genres)}
+
+        movie_genres = np.zeros((len(movie_rows), len(genres)), dtype=np.bool_)
+        for i, row in enumerate(movie_rows):
+            for genre in row[1] or []:
+                if genre in genre_index:
+                    movie_genres[i, genre_index[genre]] = True
+
+        # only movies with a cold start embedding can be ranked
+        embedded = np.array([i for i, row in enumerate(movie_rows) if row[2] is not None], dtype=np.int32)
+        if len(embedded):
+            movie_embeddings = np.stack([movie_rows[i][2] for i in embedded]).astype(np.float32)
+            movie_embeddings /= np.maximum(np.linalg.norm(movie_embeddings, axis=1, keepdims=True), 1e-8)
+        else:
+            movie_embeddings = np.empty((0, 0), dtype=np.float32)
+
+        key_genres = np.array([[genre_index[genre] for genre in key] for key in keys], dtype=np.int64)
+
+        ranked = np.full((len(keys), candidates_per_key), -1, dtype=np.int32)
+        if len(embedded):
+            embedded_genres = movie_genres[embedded]
+
+            # one matmul per chunk of keys instead of one per key, cosine similarity to every
+            # embedded movie with the movies outside the key's genres masked out
+            for start in range(0, len(keys), chunk_size):
+                similarities = (key_embeddings[start:start + chunk_size] / np.maximum(
+                    np.linalg.norm(key_embeddings[start:start + chunk_size], axis=1, keepdims=True), 1e-8
+                )) @ movie_embeddings.T
+
+                for offset, similarity in enumerate(similarities):
+                    matches = embedded_genres[:, key_genres[start + offset]].any(axis=1)
+                    similarity[~matches] = -np.inf
+
+                    top = min(candidates_per_key, int(matches.sum()))
+                    if top == 0:
+                        continue
+                    best = np.argpartition(-similarity, top - 1)[:top]
+                    best = best[np.argsort(-similarity[best], kind="stable")]
+                    ranked[start + offset, :top] = embedded[best]
+
+        random_pool = np.random.default_rng().permutation(len(movie_rows)).astype(np.int32)
+
+        index = cls(movie_ids, movie_genres, genres, keys, key_embeddings, ranked, random_pool)
+        logger.info(f"Cold start index built: {len(keys)} genre triples, {len(embedded)} ranked movies, {len(movie_ids)} movies")
+
+        return index
+
+    # movie ids of the cold start recommendations: the closest genre matched movies then random
+    # movies outside the genres, skipping the excluded ids. returns None when the precomputed
+    # lists can't answer the same as the database query would, so the caller falls back to it
+    def recommendations(
+        self,
+        genres: Sequence[str],
+        genre_embedding: NDArray[np.float32],
+        excluded_movie_ids: Set[str],
+        matched_count: int = 8,
+        other_count: int = 2
+    ) -> Optional[List[str]]:
+        key = self.genre_key(genres)
+        if key not in self.key_index:
+            return None
+
+        # the stored embedding has to be the one the index was ranked for (a user whose top
+        # genres changed after signup, or an embedding from an older model)
+        key_idx = self.key_index[key]
+        if not np.allclose(genre_embedding, self.key_embeddings[key_idx], atol=1e-4):
+            return None
+
+        ranked = self.ranked[key_idx]
+        matched = [self.movie_ids[i] for i in ranked if i >= 0 and self.movie_ids[i] not in excluded_movie_ids][:matched_count]
+        # the user excluded so many of the closest movies that the list ran out
+        if len(matched) < matched_count and ranked[-1] >= 0:
+            return None
+
+        # walk the shuffled pool from a random point for movies outside the user's genres
+        key_genres = [self.genre_index[genre] for genre in key]
+        others = []
+        start = int(self.rng.integers(len(self.random_pool))) if len(self.random_pool) else 0
+        for i in itertools.chain(self.random_pool[start:], self.random_pool[:start]):
+            if len(others) == other_count:
+                break
+            if self.movie_genres[i, key_genres].any() or self.movie_ids[i] in excluded_movie_ids:
+                continue
+            others.append(self.movie_ids[i])
+
+        return matched + others
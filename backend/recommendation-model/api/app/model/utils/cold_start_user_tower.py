@@ -1,20 +1,26 @@
 
+import itertools
 import torch.nn.functional as f
 import torch
-from typing import List
+from typing import Dict, List, Sequence, Tuple
 from utils.env_config import settings
+from utils.timing import traced
 import numpy as np
+from numpy.typing import NDArray
+
+GenreKey = Tuple[str, ...]
 
 # User tower for cold start users - users who just signed up and only have selected 3 genres -
 # uses a mlb to encode the genres and create an embedding for the user to find recommendations
 class ColdStartUserTower:
-    def __init__(self, user_tower_path: str, genre_mlb, device: str ="cpu") -> None:
+    def __init__(self, user_tower_path: str, genre_mlb, device: str ="cpu", max_precomputed_genres: int = 3) -> None:
         self.device = device
 
         # settings loaded from config.py in middleware folder
         self.embedding_dim = settings.embedding_dim
         self.user_tower_path = user_tower_path
         self.genre_mlb = genre_mlb
+        self.known_genres = set(self.genre_mlb.classes_)
 
         num_genres = len(self.genre_mlb.classes_)
         self.projector = torch.nn.Linear(num_genres, self.embedding_dim, device=device)
@@ -25,18 +31,52 @@ class ColdStartUserTower:
         self.projector.load_state_dict({'weight': state_dict['projector.weight'], 'bias': state_dict['projector.bias']})
         self.projector.eval()
 
-    def embedding(self, genres: List[str]) -> str:
-        genre_onehot = self.genre_mlb.transform([genres])
-        genre_tensor = torch.tensor(genre_onehot, dtype=torch.float32, device=self.device)        
-        
+        self._precompute_embeddings(max_precomputed_genres)
+
+    # the embedding only depends on which genres were picked, so every selection of up to
+    # max_genres genres is embedded once here in one batched forward pass and signups are a
+    # table lookup. ~1k rows (2MB) for 3 out of 19 genres
+    def _precompute_embeddings(self, max_genres: int) -> None:
+        classes = sorted(self.known_genres)
+        keys: List[GenreKey] = [
+            key
+            for size in range(max_genres + 1)
+            for key in itertools.combinations(classes, size)
+        ]
+
+        self.genre_set_index: Dict[GenreKey, int] = {key: i for i, key in enumerate(keys)}
+        self.genre_set_embeddings = self._forward([list(key) for key in keys])
+        # rows are handed out without copying, keep callers from changing the table
+        self.genre_set_embeddings.flags.writeable = False
+
+    # canonical key of a genre selection: order and duplicates don't change the one hot input,
+    # and genres the mlb doesn't know are ignored by it
+    def genre_set_key(self, genres: Sequence[str]) -> GenreKey:
+        return tuple(sorted(set(genre for genre in genres if genre in self.known_genres)))
+
+    # keys and embeddings of every precomputed selection of exactly size genres
+    def precomputed_embeddings(self, size: int) -> Tuple[List[GenreKey], NDArray[np.float32]]:
+        keys = [key for key in self.genre_set_index if len(key) == size]
+
+        return keys, self.genre_set_embeddings[[self.genre_set_index[key] for key in keys]]
+
+    def _forward(self, genre_sets: List[List[str]]) -> NDArray[np.float32]:
+        genre_onehot = self.genre_mlb.transform(genre_sets)
+        genre_tensor = torch.tensor(genre_onehot, dtype=torch.float32, device=self.device)
+
         # generate embedding using trained model
         with torch.no_grad():
             user_emb = self.relu(self.projector(genre_tensor))
             user_emb = f.normalize(user_emb, p=2, dim=1)
 
-        user_emb = user_emb.cpu().numpy()[0]
+        return user_emb.cpu().numpy()
 
-        user_emb_list = str(user_emb.tolist())
+    @traced("model.cold_start_user_tower.embedding")
+    def embedding(self, genres: List[str]) -> NDArray[np.float32]:
+        key = self.genre_set_key(genres)
+        if key in self.genre_set_index:
+            return self.genre_set_embeddings[self.genre_set_index[key]]
 
-        return user_emb_list
+        # more genres than were precomputed
+        return self._forward([list(key)])[0]
     
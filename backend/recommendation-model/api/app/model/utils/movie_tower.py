@@ -1,11 +1,15 @@
+import hashlib
 import torch
 import torch.nn as nn
 import torch.nn.functional as f
 import numpy as np
+from numpy.typing import NDArray
 from sentence_transformers import SentenceTransformer
 from fastapi import HTTPException
-from typing import List
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 from utils.env_config import settings
+from utils.timing import span, traced
 
 # Dynamically generate new embeddings for unseen movies
 class MovieTower:
@@ -14,9 +18,12 @@ class MovieTower:
         movie_tower_path: str,
         genre_mlb,
         sentence_transformer_model: SentenceTransformer, 
-        device="cpu"
+        device="cpu",
+        backend: str = "eager",
+        head_path: Optional[str] = None
     ) -> None:
         self.device = device
+        self.backend = backend
         self.embedding_dim = settings.embedding_dim
         self.movie_tower_path = movie_tower_path
         self.genre_mlb = genre_mlb
@@ -29,11 +36,18 @@ class MovieTower:
         self._extract_feature_dims()
         self._linear_layers()
         self._load_trained_weights()
+        self._load_head(head_path)
 
     def _extract_feature_dims(self) -> None:
         """ Loads trained movie tower state dict """
         self.state_dict = torch.load(self.movie_tower_path, weights_only=True, map_location=self.device)
 
+        # version of the trained weights, part of the movie embedding cache key so a new model
+        # never serves embeddings of the old one. the sentence transformer isn't included, the
+        # tower is trained on its outputs so swapping it means a new tower file anyway
+        with open(self.movie_tower_path, "rb") as file:
+            self.model_version = hashlib.sha256(file.read()).hexdigest()[:16]
+
         # Extract shapes from saved weights
         self.title_in_features = self.state_dict['title_linear.weight'].shape[1]  # Should be 384
         self.genre_in_features = self.state_dict['genre_linear.weight'].shape[1]  # Number of genres
@@ -79,6 +93,56 @@ class MovieTower:
         self.metadata_sentence_linear.eval()
         self.projector.eval()
 
+    # the exported single graph version of the layers (training's export_movie_tower_head) for
+    # the torchscript and onnx backends, the eager layers stay loaded as the reference it is
+    # checked against so a head exported from a different training run is never served
+    def _load_head(self, head_path: Optional[str]) -> None:
+        if self.backend == "eager":
+            return
+        if not head_path or not Path(head_path).exists():
+            raise FileNotFoundError(f"movie tower head for the {self.backend} backend not found: {head_path}")
+
+        if self.backend == "torchscript":
+            self.head = torch.jit.optimize_for_inference(torch.jit.load(head_path, map_location=self.device))
+        elif self.backend == "onnx":
+            # optional dependency, only installed for this backend
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = torch.get_num_threads()
+            self.head = onnxruntime.InferenceSession(head_path, options, providers=["CPUExecutionProvider"])
+        else:
+            raise ValueError(f"unknown movie tower backend: {self.backend}")
+
+        rng = np.random.default_rng(0)
+        features = [
+            rng.random((4, in_features), dtype=np.float32)
+            for in_features in (self.title_in_features, self.genre_in_features, self.year_in_features, self.metadata_sentence_in_features)
+        ]
+        if not np.allclose(self._project(*features), self._project_eager(*features), atol=1e-5):
+            raise ValueError(f"movie tower head {head_path} doesn't match {self.movie_tower_path}")
+
+    # builds the "overview. Directed by ... Starring ..." sentence that is encoded
+    # for the movie's actors/director/overview features
+    def _metadata_sentence(self, actors: List[str], director: List[str], overview: str) -> str:
+        metadata_parts = []
+
+        if not overview:
+            raise HTTPException(status_code=500, detail="missing movie overview")
+        if not director:
+            raise HTTPException(status_code=500, detail="missing movie director")
+        if not actors:
+            raise HTTPException(status_code=500, detail="missing movie actors")
+        
+        # add movie overview
+        metadata_parts.append(overview)
+        # add movie director with identifying string
+        metadata_parts.append(f"Directed by {director}")
+        # add movie actors with identifying string
+        metadata_parts.append(f"Starring {actors}")
+
+        return ". ".join(metadata_parts).strip(". ")
+
     # generate embeddings for a new unseen movie using trained movie tower
     def generate_new_movie_embedding(
         self, 
@@ -88,40 +152,107 @@ class MovieTower:
         actors: List[str],
         director: List[str],
         overview: str
-    ) -> List[np.ndarray]:
+    ) -> NDArray[np.float32]:
+        return self.generate_movie_embeddings_batch([{
+            "title": title,
+            "genres": genres,
+            "year": year,
+            "actors": actors,
+            "director": director,
+            "overview": overview,
+        }])[0]
+
+    # title and metadata sentence of every movie, the two sentence transformer inputs
+    def movie_sentences(self, movies: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+        titles = [movie["title"] for movie in movies]
+        metadata_sentences = [
+            self._metadata_sentence(movie["actors"], movie["director"], movie["overview"])
+            for movie in movies
+        ]
+
+        return titles, metadata_sentences
+
+    # generate embeddings for many new movies at once, each movie is a dict with the same
+    # fields as generate_new_movie_embedding. all titles and all metadata sentences are
+    # encoded as one padded sentence transformer batch each and the linear layers run once
+    # on the whole batch, returns a [N, 512] matrix in the same order as movies
+    @traced("model.movie_tower.embed")
+    def generate_movie_embeddings_batch(
+        self,
+        movies: List[Dict[str, Any]],
+        encode_batch_size: int = 128
+    ) -> NDArray[np.float32]:
+        if not movies:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+
+        titles, metadata_sentences = self.movie_sentences(movies)
+
+        # Encode titles and actors/director/movie overview sentences with sentence transformer
+        with span("model.movie_tower.encode"):
+            title_features = self.sentence_transformer_encoder.encode(titles, batch_size=encode_batch_size, convert_to_numpy=True)
+            metadata_sentence_features = self.sentence_transformer_encoder.encode(metadata_sentences, batch_size=encode_batch_size, convert_to_numpy=True)
+
+        return self.project_movie_embeddings(movies, title_features, metadata_sentence_features)
+
+    # runs the movie tower layers on already encoded title and metadata sentence features,
+    # lets the sentence transformer encodes be batched across requests (EncodeBatcher)
+    @traced("model.movie_tower.project")
+    def project_movie_embeddings(
+        self,
+        movies: List[Dict[str, Any]],
+        title_features: NDArray[np.float32],
+        metadata_sentence_features: NDArray[np.float32]
+    ) -> NDArray[np.float32]:
+        # Encode genres with mlb
+        genre_features = self.genre_mlb.transform([movie["genres"] for movie in movies]).astype(np.float32)
+
+        # encode movie year with normalized year, normalizes it between [0, 1] in a float
+        year_features = np.array([[(movie["year"] - 1900) / 125.0] for movie in movies], dtype=np.float32)
+
+        return self._project(
+            np.asarray(title_features, dtype=np.float32),
+            genre_features,
+            year_features,
+            np.asarray(metadata_sentence_features, dtype=np.float32)
+        )
+
+    def _project(
+        self,
+        title_features: NDArray[np.float32],
+        genre_features: NDArray[np.float32],
+        year_features: NDArray[np.float32],
+        metadata_sentence_features: NDArray[np.float32]
+    ) -> NDArray[np.float32]:
+        if self.backend == "onnx":
+            return self.head.run(None, {
+                "title_features": title_features,
+                "genre_features": genre_features,
+                "year_features": year_features,
+                "metadata_sentence_features": metadata_sentence_features,
+            })[0]
+
+        if self.backend == "torchscript":
+            with torch.no_grad():
+                return self.head(
+                    torch.from_numpy(title_features).to(self.device),
+                    torch.from_numpy(genre_features).to(self.device),
+                    torch.from_numpy(year_features).to(self.device),
+                    torch.from_numpy(metadata_sentence_features).to(self.device)
+                ).cpu().numpy()
+
+        return self._project_eager(title_features, genre_features, year_features, metadata_sentence_features)
+
+    def _project_eager(
+        self,
+        title_features: NDArray[np.float32],
+        genre_features: NDArray[np.float32],
+        year_features: NDArray[np.float32],
+        metadata_sentence_features: NDArray[np.float32]
+    ) -> NDArray[np.float32]:
         with torch.no_grad():
-            # Encode title with sentence transformer
-            title_features = self.sentence_transformer_encoder.encode([title], convert_to_numpy=True)
             title_tensor = torch.tensor(title_features, dtype=torch.float32, device=self.device)
-
-            # Encode genres with mlb
-            genre_features = self.genre_mlb.transform([genres])
             genre_tensor = torch.tensor(genre_features, dtype=torch.float32, device=self.device)
-
-            # encode movie year with normalized year
-            year_normalized = (year - 1900) / 125.0 # normalizes it between [0, 1] in a float
-            year_tensor = torch.tensor([[year_normalized]], dtype=torch.float32, device=self.device)
-
-            # Encode actors/director/movie overview into one sentence embedding using sentence transformers
-            metadata_parts = []
-
-            if not overview:
-                raise HTTPException(status_code=500, detail="missing movie overview")
-            if not director:
-                raise HTTPException(status_code=500, detail="missing movie director")
-            if not actors:
-                raise HTTPException(status_code=500, detail="missing movie actors")
-            
-            # add movie overview
-            metadata_parts.append(overview)
-            # add movie director with identifying string
-            metadata_parts.append(f"Directed by {director}")
-            # add movie actors with identifying string
-            metadata_parts.append(f"Starring {actors}")
-
-            metadata_sentence = ". ".join(metadata_parts).strip(". ")
-
-            metadata_sentence_features = self.sentence_transformer_encoder.encode([metadata_sentence], convert_to_numpy=True)
+            year_tensor = torch.tensor(year_features, dtype=torch.float32, device=self.device)
             metadata_sentence_tensor = torch.tensor(metadata_sentence_features, dtype=torch.float32, device=self.device)
 
             # Pass through trained linear layers
@@ -136,9 +267,9 @@ class MovieTower:
             year_emb = f.normalize(year_emb, p=2, dim=1)
             metadata_sentence_emb = f.normalize(metadata_sentence_emb, p=2, dim=1)
 
-            # Concatenate and project to final embedding
+            # Concatenate and project to final embeddings
             combined_emb = torch.cat([title_emb, genre_emb, year_emb, metadata_sentence_emb], dim=1)
             final_emb = self.projector(combined_emb)
             final_emb = f.normalize(final_emb, p=2, dim=1)
 
-            return final_emb.cpu().numpy()[0].tolist()
+            return final_emb.cpu().numpy()
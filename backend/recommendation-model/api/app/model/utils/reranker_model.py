@@ -1,27 +1,101 @@
+import hashlib
 import lightgbm as lgb
 import numpy as np
-from typing import List, Any
+from pathlib import Path
+from typing import List, Any, Optional
 from numpy.typing import NDArray
+from model.utils.tree_predictor import CompiledTreePredictor
+from utils.env_config import settings
+from utils.timing import span, traced
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Reranker:
-    def __init__(self, reranker_model_path: str):
+    def __init__(
+        self,
+        reranker_model_path: str,
+        backend: str = "lightgbm",
+        num_threads: int = 0,
+        predict_disable_shape_check: bool = False
+    ):
         self.model = lgb.Booster(model_file=reranker_model_path)
-    
-    # Compute overlap count between user and movie feature lists
-    def _compute_feature_overlap(self, user_features: List[str], movie_features: List[str]) -> NDArray[np.float32]:
-        user_set = set(user_features) if user_features else set()
 
-        overlaps = [
-            len(user_set & set(movie_feature))
-            for movie_feature in movie_features
-        ]
-        
-        return np.array(overlaps, dtype=np.float32)
+        # version of the trained trees, part of the recommendation cache stamp
+        with open(reranker_model_path, "rb") as file:
+            self.model_version = hashlib.sha256(file.read()).hexdigest()[:16]
+
+        self.predict_kwargs = {}
+        if num_threads:
+            self.predict_kwargs["num_threads"] = num_threads
+        if predict_disable_shape_check:
+            self.predict_kwargs["predict_disable_shape_check"] = True
+
+        self.backend = "lightgbm"
+        self.compiled_predictor: Optional[CompiledTreePredictor] = None
+        if backend == "compiled":
+            try:
+                self.compiled_predictor = self._load_compiled_predictor()
+                self.backend = "compiled"
+            except Exception as e:
+                logger.warning(f"Compiled reranker predictor unavailable, using lightgbm: {e}")
+
+    # compiles the booster (or reuses the library compiled for the same model) and checks it
+    # scores like Booster.predict before it is used, missing values included
+    def _load_compiled_predictor(self) -> CompiledTreePredictor:
+        predictor = CompiledTreePredictor.from_booster(self.model, str(Path(settings.model_cache_dir) / "compiled"))
+
+        X = np.random.default_rng(0).normal(size=(256, self.model.num_feature())).astype(np.float32)
+        X[::7, ::3] = np.nan
+        X[::5, 1::4] = 0
+        if not np.allclose(predictor.predict(X), self.model.predict(X), rtol=1e-9, atol=1e-12):
+            raise ValueError("compiled predictor scores don't match the booster")
+
+        return predictor
+
+    def _predict(self, X: NDArray[np.float32]) -> NDArray[np.float64]:
+        if self.compiled_predictor is not None:
+            return self.compiled_predictor.predict(X)
+
+        return self.model.predict(X, **self.predict_kwargs)
+
+    # Compute overlap count between user and movie feature lists straight into a float32 column,
+    # set.intersection hashes the movie list without building a set per movie first
+    def _compute_feature_overlap(self, user_features: List[str], movie_features: List[List[str]]) -> NDArray[np.float32]:
+        user_set = set(user_features) if user_features else set()
 
+        return np.fromiter(
+            (len(user_set.intersection(movie_feature)) if movie_feature else 0 for movie_feature in movie_features),
+            dtype=np.float32,
+            count=len(movie_features)
+        )
 
-    def rerank_movies(self, user_metadata, candidate_movies: List[Any]):
+    # Stack every candidate embedding (already float32 arrays from the pgvector codec)
+    # into one [N, 512] matrix
+    def _candidate_embedding_matrix(self, candidate_movies: List[Any]) -> NDArray[np.float32]:
+        return np.stack([candidate['movie_emb'] for candidate in candidate_movies]).astype(np.float32, copy=False)
+
+    # Build the [N, 13] reranker feature matrix for all candidates at once, column order
+    # has to match the order the lightgbm model was trained on
+    def _build_feature_matrix(
+        self,
+        user_metadata,
+        candidate_movies: List[Any],
+        user_emb: NDArray[np.float32],
+        movie_embs: NDArray[np.float32]
+    ) -> NDArray[np.float32]:
+        num_movies = len(candidate_movies)
+
+        def candidate_column(key: str) -> NDArray[np.float32]:
+            return np.array([candidate[key] for candidate in candidate_movies], dtype=np.float32)
+
+        # compute collab_score (cosine similarity between user and movie embeddings) as one matmul
+        collab_score = (movie_embs @ user_emb) / (
+            np.linalg.norm(movie_embs, axis=1) * np.linalg.norm(user_emb) + 1e-8
+        )
 
-        features = []
+        recency_score = 1 - ((2025 - candidate_column('release_date')) / 50)
+        recency_user_avg = recency_score * np.float32(user_metadata['avg_rating'])
 
         genre_overlap = self._compute_feature_overlap(
             user_metadata['top_3_genres'],
@@ -38,55 +112,54 @@ class Reranker:
             [candidate['directors'] for candidate in candidate_movies]
         )
 
-        # Parse user embedding from pgvector string format "[x,y,z,...]" to numpy array
-        user_emb_str = user_metadata['embedding'].strip('[]')
-        user_emb = np.fromstring(user_emb_str, sep=',', dtype=np.float32)
-
-        for i, candidate in enumerate(candidate_movies):
-            # compute collab_score (cosine similarity between user and movie embeddings)
-            # Parse movie embedding from pgvector string format
-            movie_emb_str = candidate['movie_emb'].strip('[]')
-            movie_emb = np.fromstring(movie_emb_str, sep=',', dtype=np.float32)
-            collab_score = np.dot(user_emb, movie_emb) / (
-                np.linalg.norm(user_emb) * np.linalg.norm(movie_emb) + 1e-8
-            )
-
-            recency_score = (1 - ((2025 - candidate['release_date']) / 50))
-            recency_user_avg = recency_score * user_metadata['avg_rating']
-
-            feature_row = [
-                collab_score,
-                candidate['movie_rating_log'],
-                candidate['movie_avg_rating'],
-                candidate['tmdb_vote_avg'],
-                candidate['tmdb_vote_log'],
-                candidate['tmdb_popularity'],
-                recency_score,
-                recency_user_avg,
-                user_metadata['rating_log'],
-                user_metadata['avg_rating'],
-                genre_overlap[i],
-                actor_overlap[i],
-                director_overlap[i]
-            ]
-
-            features.append(feature_row)
-        
-        X = np.array(features, dtype=np.float32)
-
-        # Predict with LightGBM reranker model
-        scores = self.model.predict(X)
-
-        # rerank candidates by score
-        top_10_movies = sorted(zip(candidate_movies, scores), key=lambda x: x[1], reverse=True)[:10]  # type: ignore
+        X = np.empty((num_movies, 13), dtype=np.float32)
+        X[:, 0] = collab_score
+        X[:, 1] = candidate_column('movie_rating_log')
+        X[:, 2] = candidate_column('movie_avg_rating')
+        X[:, 3] = candidate_column('tmdb_vote_avg')
+        X[:, 4] = candidate_column('tmdb_vote_log')
+        X[:, 5] = candidate_column('tmdb_popularity')
+        X[:, 6] = recency_score
+        X[:, 7] = recency_user_avg
+        X[:, 8] = user_metadata['rating_log']
+        X[:, 9] = user_metadata['avg_rating']
+        X[:, 10] = genre_overlap
+        X[:, 11] = actor_overlap
+        X[:, 12] = director_overlap
+
+        return X
+
+    @traced("model.reranker.rerank")
+    def rerank_movies(self, user_metadata, candidate_movies: List[Any], top_k: Optional[int] = 10):
+        if not candidate_movies:
+            return []
+
+        user_emb = np.asarray(user_metadata['embedding'], dtype=np.float32)
+        movie_embs = self._candidate_embedding_matrix(candidate_movies)
+
+        with span("model.reranker.features"):
+            X = self._build_feature_matrix(user_metadata, candidate_movies, user_emb, movie_embs)
+
+        # Predict with the LightGBM reranker model (or its compiled trees)
+        with span("model.reranker.predict"):
+            scores = self._predict(X)
+
+        # select the top k with argpartition and only sort those k instead of every candidate
+        num_top = len(candidate_movies) if top_k is None else min(top_k, len(candidate_movies))
+        if num_top < len(candidate_movies):
+            top_idx = np.argpartition(-scores, num_top - 1)[:num_top]
+        else:
+            top_idx = np.arange(num_top)
+        top_idx = top_idx[np.argsort(-scores[top_idx], kind='stable')]
 
         # Remove movie embeddings from response and format results
         results = []
-        for movie, score in top_10_movies:
+        for i in top_idx:
+            movie = candidate_movies[i]
             movie_clean = {k: v for k, v in movie.items() if k not in ['movie_emb', 'tmdb_vote_log']}
-            movie_clean['score'] = float(score)
+            movie_clean['score'] = float(scores[i])
             # Transform tmdb_vote_log back to tmdb_vote_count for frontend
             movie_clean['tmdb_vote_count'] = int(np.exp(movie.get('tmdb_vote_log', 0)) - 1)
             results.append(movie_clean)
 
-        return results
\ No newline at end of file
+        return results
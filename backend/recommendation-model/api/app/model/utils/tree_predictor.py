@@ -0,0 +1,168 @@
+import os
+import ctypes
+import hashlib
+import subprocess
+import tempfile
+import numpy as np
+import lightgbm as lgb
+from pathlib import Path
+from numpy.typing import NDArray
+import logging
+
+logger = logging.getLogger(__name__)
+
+# lightgbm treats |x| <= kZeroThreshold as zero
+ZERO_THRESHOLD = 1e-35
+# objectives whose predict() output is the raw tree sum
+RAW_OBJECTIVES = {"lambdarank", "rank_xendcg", "regression", "regression_l1", "huber", "fair", "quantile", "mape"}
+
+# same split rules as lightgbm's NumericalDecision: NaN is read as 0 unless the split has a
+# NaN default side, "Zero" splits also send (near) zero values to the default side
+C_PRELUDE = """#include <math.h>
+
+static inline int go_none(float v, double t) { return (isnan(v) ? 0.0 : (double)v) <= t; }
+static inline int go_zero(float v, double t, int dl) { return (isnan(v) || fabs((double)v) <= %r) ? dl : (double)v <= t; }
+static inline int go_nan(float v, double t, int dl) { return isnan(v) ? dl : (double)v <= t; }
+""" % ZERO_THRESHOLD
+
+# Trained lightgbm booster compiled to native code (treelite style) for the small predict
+# calls of a request - every tree becomes a nested if/else C function and predict is one
+# single threaded loop over the rows. Booster.predict has a fixed per call cost (input checks,
+# openmp thread pool, the c api round trip) that dominates for a few hundred candidates
+class CompiledTreePredictor:
+    def __init__(self, library_path: str, num_features: int, num_trees: int, sigmoid: float = 0.0, average_output: bool = False) -> None:
+        self.library_path = library_path
+        self.num_features = num_features
+        self.num_trees = num_trees
+        self.sigmoid = sigmoid
+        self.average_output = average_output
+
+        self.library = ctypes.CDLL(library_path)
+        self.library.predict.argtypes = [ctypes.c_void_p, ctypes.c_long, ctypes.c_long, ctypes.c_void_p]
+        self.library.predict.restype = None
+
+    # generates the c source from the booster's model dump and compiles it into cache_dir,
+    # the shared library is named after the source hash so a restart with the same model
+    # reuses it. raises NotImplementedError for models the code generator can't reproduce
+    # exactly (categorical splits, multiclass, linear trees, other objectives) and
+    # RuntimeError when there is no working c compiler
+    @classmethod
+    def from_booster(cls, booster: lgb.Booster, cache_dir: str) -> "CompiledTreePredictor":
+        model = booster.dump_model()
+
+        if model.get("num_class", 1) != 1:
+            raise NotImplementedError("multiclass models aren't supported")
+        objective = model.get("objective", "").split(" ")
+        if objective[0] == "binary":
+            sigmoid = float(next(part.split(":")[1] for part in objective if part.startswith("sigmoid:")))
+        elif objective[0] in RAW_OBJECTIVES:
+            sigmoid = 0.0
+        else:
+            raise NotImplementedError(f"objective {objective[0]} isn't supported")
+
+        source = cls._generate_source(model["tree_info"])
+        library_path = Path(cache_dir) / f"tree_predictor_{hashlib.sha256(source.encode()).hexdigest()[:16]}.so"
+        if not library_path.exists():
+            cls._compile(source, library_path)
+
+        return cls(
+            str(library_path),
+            booster.num_feature(),
+            len(model["tree_info"]),
+            sigmoid,
+            bool(model.get("average_output", False))
+        )
+
+    @staticmethod
+    def _generate_source(trees) -> str:
+        def literal(value: float) -> str:
+            if np.isinf(value):
+                return "INFINITY" if value > 0 else "-INFINITY"
+            return repr(float(value))
+
+        def node_code(node: dict, indent: str) -> str:
+            if "split_index" not in node:
+                if "leaf_coeff" in node:
+                    raise NotImplementedError("linear trees aren't supported")
+                return f"{indent}return {literal(node['leaf_value'])};\n"
+            if node["decision_type"] != "<=":
+                raise NotImplementedError("categorical splits aren't supported")
+
+            value = f"x[{node['split_feature']}]"
+            threshold = literal(node["threshold"])
+            default_left = int(node["default_left"])
+            condition = {
+                "None": f"go_none({value}, {threshold})",
+                "Zero": f"go_zero({value}, {threshold}, {default_left})",
+                "NaN": f"go_nan({value}, {threshold}, {default_left})",
+            }[node["missing_type"]]
+
+            return (
+                f"{indent}if ({condition}) {{\n"
+                f"{node_code(node['left_child'], indent + '  ')}"
+                f"{indent}}} else {{\n"
+                f"{node_code(node['right_child'], indent + '  ')}"
+                f"{indent}}}\n"
+            )
+
+        parts = [C_PRELUDE]
+        for i, tree in enumerate(trees):
+            parts.append(f"\nstatic double tree_{i}(const float *x) {{\n{node_code(tree['tree_structure'], '  ')}}}\n")
+
+        # trees are summed in order like lightgbm so the raw scores match bit for bit
+        tree_sum = "".join(f"    sum += tree_{i}(x);\n" for i in range(len(trees)))
+        parts.append(
+            "\nvoid predict(const float *X, long rows, long cols, double *out) {\n"
+            "  for (long r = 0; r < rows; r++) {\n"
+            "    const float *x = X + r * cols;\n"
+            "    double sum = 0.0;\n"
+            f"{tree_sum}"
+            "    out[r] = sum;\n"
+            "  }\n"
+            "}\n"
+        )
+
+        return "".join(parts)
+
+    @staticmethod
+    def _compile(source: str, library_path: Path) -> None:
+        library_path.parent.mkdir(parents=True, exist_ok=True)
+        compiler = os.environ.get("CC", "cc")
+
+        with tempfile.TemporaryDirectory() as build_dir:
+            source_path = Path(build_dir) / "tree_predictor.c"
+            source_path.write_text(source)
+            build_path = Path(build_dir) / library_path.name
+
+            try:
+                subprocess.run(
+                    [compiler, "-O2", "-shared", "-fPIC", "-o", str(build_path), str(source_path), "-lm"],
+                    check=True,
+                    capture_output=True,
+                    text=True
+                )
+            except FileNotFoundError as e:
+                raise RuntimeError(f"no c compiler found ({compiler})") from e
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"compiling the tree predictor failed: {e.stderr}") from e
+
+            # another worker may be compiling the same model, the rename keeps the file whole
+            os.replace(build_path, library_path)
+
+        logger.info(f"Compiled tree predictor to {library_path}")
+
+    def predict(self, X: NDArray[np.float32]) -> NDArray[np.float64]:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.num_features:
+            raise ValueError(f"expected [rows, {self.num_features}] features, got {X.shape}")
+
+        scores = np.empty(len(X), dtype=np.float64)
+        # ctypes releases the GIL for the call
+        self.library.predict(X.ctypes.data, len(X), X.shape[1], scores.ctypes.data)
+
+        if self.average_output:
+            scores /= self.num_trees
+        if self.sigmoid:
+            scores = 1.0 / (1.0 + np.exp(-self.sigmoid * scores))
+
+        return scores
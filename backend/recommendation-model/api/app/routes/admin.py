@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from utils.dependencies import get_model_registry, require_admin_key
+from utils.model_registry import ModelRegistry
+from utils.profiler import ProfilerBusyError, profile
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_key)])
+
+# sync the model files from s3 and hot swap the models when any of them changed, force reloads
+# the local files even when nothing changed. requests already running finish on the old models
+@router.post("/models/reload")
+async def reload_models(
+    force: bool = False,
+    model_registry: ModelRegistry = Depends(get_model_registry)
+):
+    return await model_registry.reload(force)
+
+# the version currently serving traffic and the last reload
+@router.get("/models")
+async def get_models(model_registry: ModelRegistry = Depends(get_model_registry)):
+    return model_registry.stats()
+
+# samples every thread's stack for the given seconds while the api keeps serving and returns
+# the collapsed stacks (flamegraph.pl / speedscope input), e.g. under load:
+#   curl -H "X-Admin-Key: ..." "localhost:8000/api/admin/profile?seconds=10" > profile.txt
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_hot_paths(
+    seconds: float = Query(10.0, gt=0, le=60),
+    interval_ms: float = Query(5.0, ge=1, le=1000)
+):
+    try:
+        profiler = await profile(seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    stats = profiler.stats()
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"X-Profile-Samples": str(stats["samples"]), "X-Profile-Stacks": str(stats["stacks"])}
+    )
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from typing import List, Optional
 from model.utils.movie_tower import MovieTower
-from db.utils.user_sql_queries import set_user_rating_stats_stale
+from db.utils.user_sql_queries import apply_user_rating_delta
 from db.utils.movies_sql_queries import (
     add_new_movie_embedding, 
     add_new_movie_rating, 
@@ -11,13 +11,24 @@ from db.utils.movies_sql_queries import (
 from db.config.conn import get_session
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from utils.dependencies import get_movie_tower
+from utils.dependencies import (
+    get_movie_tower,
+    get_candidate_engine,
+    get_inference_executor,
+    get_encode_batcher,
+    get_movie_embedding_cache,
+    get_recommendation_cache,
+)
+from utils.inference_executor import InferenceExecutor
+from utils.encode_batcher import EncodeBatcher
+from utils.movie_embedding_cache import MovieEmbeddingCache
+from utils.recommendation_cache import RecommendationCache, invalidate_recommendations
+from model.utils.candidate_engine import CandidateEngine
 import numpy as np
 
 router = APIRouter(prefix="/movie", tags=["movie"])
 
-class RateMovieRequest(BaseModel):
-    user_id: str
+class RatedMovie(BaseModel):
     title: str
     genres: List[str]
     release_date: str
@@ -31,28 +42,141 @@ class RateMovieRequest(BaseModel):
     tmdb_vote_count: float
     tmdb_popularity: float
 
+class RateMovieRequest(RatedMovie):
+    user_id: str
+
+class BatchRatedMovie(RatedMovie):
+    imdb_id: str
+
+class RateMovieBatchRequest(BaseModel):
+    user_id: str
+    movies: List[BatchRatedMovie]
+
+# Convert release_date string to int year for model processing
+def _release_year(release: str) -> int:
+    try:
+        return int(release[:4]) if isinstance(release, str) else int(release)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid release_date format. Expected YYYY or full date string.")
+
+# movie tower input for a rated movie, release date needs to be just year YYYY
+def _movie_tower_input(movie: RatedMovie) -> dict:
+    return {
+        "title": movie.title,
+        "genres": movie.genres,
+        "year": _release_year(movie.release_date),
+        "actors": movie.actors,
+        "director": movie.director,
+        "overview": movie.summary,
+    }
+
+# embeddings for single movie rating requests, the titles and metadata sentences go through
+# the encode batcher so concurrent rating requests share one sentence transformer batch, the
+# movie tower layers on top are a few small matmuls and run inline
+async def _generate_movie_embeddings(movie_tower: MovieTower, encode_batcher: EncodeBatcher, tower_inputs: List[dict]):
+    titles, metadata_sentences = movie_tower.movie_sentences(tower_inputs)
+
+    features = await encode_batcher.encode(titles + metadata_sentences)
+
+    return movie_tower.project_movie_embeddings(tower_inputs, features[:len(titles)], features[len(titles):])
+
+# stores the movie, its embedding and the user's rating, and applies the rating to the
+# user's stats, returns if the rating is new or replaced an older one
+async def _save_rated_movie(
+    session: AsyncSession,
+    user_id: str,
+    imdb_id: str,
+    movie: RatedMovie,
+    movie_embedding,
+    candidate_engine: Optional[CandidateEngine]
+) -> bool:
+    tmdb_vote_log = np.log1p(movie.tmdb_vote_count)
+    release_year = _release_year(movie.release_date)
+
+    await add_movie_metadata(session, imdb_id, movie.title, movie.genres, release_year, movie.summary, movie.actors, movie.director, movie.language, movie.poster_path)
+
+    await add_new_movie_embedding(session, imdb_id, movie_embedding)
+
+    is_new_rating, previous_rating = await add_new_movie_rating(session, user_id, imdb_id, movie.rating)
+
+    await update_movie_rating_stats(session, imdb_id, movie.tmdb_vote_avg, tmdb_vote_log, movie.tmdb_popularity)
+
+    # apply the rating as a delta to the user's running sum embedding and rating stats so
+    # the recommendations route never has to recalculate them from the rating history
+    user_embedding = await apply_user_rating_delta(session, user_id, imdb_id, previous_rating, movie.rating)
+
+    # keep the in memory candidate engine in sync with the new rating
+    if candidate_engine:
+        if user_embedding is not None:
+            candidate_engine.update_user_embedding(user_id, user_embedding)
+        if movie.rating > 0:
+            candidate_engine.add_rating(user_id, imdb_id)
+
+    return is_new_rating
+
+# rate many movies at once (watch history imports, tmdb backfills), every movie embedding
+# is generated in one movie tower batch instead of one tower call per movie. declared
+# before /rate/{imdb_id} so "batch" isn't matched as an imdb_id
+@router.post("/rate/batch")
+async def new_rated_movies_batch(
+    body: RateMovieBatchRequest,
+    movie_tower: MovieTower = Depends(get_movie_tower),
+    session: AsyncSession = Depends(get_session),
+    candidate_engine: Optional[CandidateEngine] = Depends(get_candidate_engine),
+    inference_executor: InferenceExecutor = Depends(get_inference_executor),
+    embedding_cache: MovieEmbeddingCache = Depends(get_movie_embedding_cache),
+    recommendation_cache: Optional[RecommendationCache] = Depends(get_recommendation_cache),
+):
+    user_id = body.user_id
+    movies = body.movies
+
+    if not user_id:
+        raise HTTPException(status_code=404, detail="No user_id provided")
+
+    if not movies:
+        raise HTTPException(status_code=404, detail="No movies provided")
+
+    if any(not movie.rating for movie in movies):
+        raise HTTPException(status_code=404, detail="No rating provided")
+
+    # only the movies that aren't cached or already stored are run through the movie tower
+    movie_embeddings = await embedding_cache.get_or_generate(
+        session,
+        [movie.imdb_id for movie in movies],
+        [_movie_tower_input(movie) for movie in movies],
+        lambda tower_inputs: inference_executor.run(movie_tower.generate_movie_embeddings_batch, tower_inputs)
+    )
+
+    results = []
+    for movie, movie_embedding in zip(movies, movie_embeddings):
+        is_new_rating = await _save_rated_movie(session, user_id, movie.imdb_id, movie, movie_embedding, candidate_engine)
+
+        results.append({
+            "message": "Rating added" if is_new_rating else "Rating updated",
+            "movie_id": movie.imdb_id,
+            "rating": movie.rating
+        })
+
+    await invalidate_recommendations(session, recommendation_cache, user_id)
+
+    return {
+        "user_id": user_id,
+        "results": results
+    }
+
 @router.post("/rate/{imdb_id}")
 async def new_rated_movie(
     imdb_id: str, 
     body: RateMovieRequest,
     movie_tower: MovieTower = Depends(get_movie_tower),
     session: AsyncSession = Depends(get_session),
+    candidate_engine: Optional[CandidateEngine] = Depends(get_candidate_engine),
+    encode_batcher: EncodeBatcher = Depends(get_encode_batcher),
+    embedding_cache: MovieEmbeddingCache = Depends(get_movie_embedding_cache),
+    recommendation_cache: Optional[RecommendationCache] = Depends(get_recommendation_cache),
 ):  
     user_id = body.user_id
-    title = body.title
-    genres = body.genres
-    release = body.release_date
-    summary = body.summary
-    actors = body.actors
-    director = body.director
-    language = body.language
-    poster_path = body.poster_path
     rating = body.rating
-    tmdb_vote_avg = body.tmdb_vote_avg
-    tmdb_vote_count = body.tmdb_vote_count
-    tmdb_popularity = body.tmdb_popularity
-
-    tmdb_vote_log = np.log1p(tmdb_vote_count)
 
     if not user_id:
         raise HTTPException(status_code=404, detail="No user_id provided")
@@ -60,28 +184,17 @@ async def new_rated_movie(
     if not rating:
         raise HTTPException(status_code=404, detail="No rating provided")
 
-    # Convert release_date string to int year for model processing
-    try:
-        release_year = int(release[:4]) if isinstance(release, str) else int(release)
-    except (ValueError, TypeError):
-        raise HTTPException(status_code=400, detail="Invalid release_date format. Expected YYYY or full date string.")
-
-    # release date needs to be just year YYYY
-    movie_embedding = movie_tower.generate_new_movie_embedding(title, genres, release_year, actors, director, summary)
-
-    await add_movie_metadata(session, imdb_id, title, genres, release_year, summary, actors, director, language, poster_path)
-
-    await add_new_movie_embedding(session, imdb_id, movie_embedding)
-
-    is_new_rating = await add_new_movie_rating(session, user_id, imdb_id, rating)
+    # repeat ratings of a movie reuse its cached or stored embedding instead of running the tower
+    movie_embedding, = await embedding_cache.get_or_generate(
+        session,
+        [imdb_id],
+        [_movie_tower_input(body)],
+        lambda tower_inputs: _generate_movie_embeddings(movie_tower, encode_batcher, tower_inputs)
+    )
 
-    await update_movie_rating_stats(session, imdb_id, tmdb_vote_avg, tmdb_vote_log, tmdb_popularity)
+    is_new_rating = await _save_rated_movie(session, user_id, imdb_id, body, movie_embedding, candidate_engine)
+    await invalidate_recommendations(session, recommendation_cache, user_id)
 
-    # set the user rating stats table is_stale to true so we don't have to recalculate
-    # the user embeddings each time a user rates a movie, we'll recalculate it in 
-    # the recommendations route
-    await set_user_rating_stats_stale(session, user_id)
-    
     return {
         "message": "Rating added" if is_new_rating else "Rating updated",
         "user_id": user_id,
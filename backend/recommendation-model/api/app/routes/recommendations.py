@@ -1,97 +1,160 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import Optional
 from db.config.conn import get_session
 from db.utils.movies_sql_queries import (
-    get_movies_metadata_by_movie_ids, 
+    get_candidate_movies_metadata,
     get_cold_start_recommendations,
-    get_movie_embeddings,
+    get_cold_start_movies_metadata,
 )
-from db.utils.user_sql_queries import (
-    get_user_genres,
-    get_user_with_ratings_count,
-    get_similar_users_and_user_metadata,
-    get_user_rated_movie_ids,
-    check_user_rating_stats_stale,
-    update_user_ratings_stats,
-    set_user_rating_stats_fresh,
-    regenerate_user_movie_embedding,
-    get_user_not_seen_movie_ids
+from db.utils.recommendation_sql_queries import (
+    get_recommendation_context,
+    refresh_user_embedding_and_stats,
+    user_metadata_from_row,
+    get_collaborative_candidates,
 )
 from model.utils.reranker_model import Reranker
+from model.utils.candidate_engine import CandidateEngine
+from model.utils.cold_start_index import ColdStartIndex
 from sqlalchemy.ext.asyncio import AsyncSession
-from utils.dependencies import get_reranking_model
-import numpy as np
+from utils.dependencies import (
+    get_reranking_model,
+    get_candidate_engine,
+    get_cold_start_index,
+    get_user_count_cache,
+    get_inference_executor,
+    get_recommendation_cache,
+    get_recommendation_version,
+)
+from utils.inference_executor import InferenceExecutor
+from utils.env_config import settings
+from utils.recommendation_cache import RecommendationCache, RecommendationFeed
+from utils.timing import StageTimer
+from utils.user_count_cache import UserCountCache
 
 router = APIRouter(prefix="/recommendations")
 
+# one page of the user's recommendation feed, the feed (every reranked candidate up to
+# recommendation_feed_size) is computed on the first page and the next pages are read from the
+# recommendation cache. the X-Next-Cursor response header is the cursor of the next page and is
+# left out on the last one
 @router.get("/get/{user_id}")
 async def get_recommendations(
     user_id: str, 
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(10, ge=1, le=100),
     session: AsyncSession = Depends(get_session), 
-    rerank_model: Reranker = Depends(get_reranking_model)
+    rerank_model: Reranker = Depends(get_reranking_model),
+    candidate_engine: Optional[CandidateEngine] = Depends(get_candidate_engine),
+    cold_start_index: Optional[ColdStartIndex] = Depends(get_cold_start_index),
+    user_count_cache: UserCountCache = Depends(get_user_count_cache),
+    inference_executor: InferenceExecutor = Depends(get_inference_executor),
+    recommendation_cache: Optional[RecommendationCache] = Depends(get_recommendation_cache),
+    recommendation_version: str = Depends(get_recommendation_version)
 ):
-    num_users = await get_user_with_ratings_count(session)
-
-    # fallback to cold start recommendations if not enough users
-    if num_users < 50:
-        top3_genre, genre_embedding = await get_user_genres(session, user_id)
-        recommendations = await get_cold_start_recommendations(session, user_id, genre_embedding, top3_genre)
-        print("less than 50 users: cold start recos")
-        return recommendations
-    
-    rated_movie_ids = await get_user_rated_movie_ids(session, user_id)
-
-    # # fallback to cold start recommendations if less than 10 rated movies
-    if len(rated_movie_ids) < 10:
-        top3_genre, genre_embedding = await get_user_genres(session, user_id)
-        recommendations = await get_cold_start_recommendations(session, user_id, genre_embedding, top3_genre)
-        print("less than 50 users: cold start recos")
+    # the cursor is the position in the feed the next page starts at
+    try:
+        position = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if position < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    timer = StageTimer(f"recommendations user={user_id}")
+    try:
+        # nothing about the user changed since the cached feed was computed
+        feed = None
+        generation = None
+        if recommendation_cache:
+            with timer.stage("cache"):
+                feed, generation = await recommendation_cache.get(user_id, recommendation_version)
+
+        if feed is None:
+            recommendations = await _get_recommendations(user_id, session, rerank_model, candidate_engine, cold_start_index, user_count_cache, inference_executor, timer)
+
+            if recommendation_cache:
+                await recommendation_cache.put(user_id, recommendation_version, generation, recommendations)
+            feed = RecommendationFeed(recommendations)
+
+        page, next_cursor = feed.page(position, limit)
+
+        # the response is built here instead of by fastapi so encoding the page is timed
+        with timer.stage("serialize"):
+            headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+            return JSONResponse(jsonable_encoder(page), headers=headers)
+    finally:
+        timer.finish()
+
+async def _get_recommendations(
+    user_id: str,
+    session: AsyncSession,
+    rerank_model: Reranker,
+    candidate_engine: Optional[CandidateEngine],
+    cold_start_index: Optional[ColdStartIndex],
+    user_count_cache: UserCountCache,
+    inference_executor: InferenceExecutor,
+    timer: StageTimer
+):
+    # amount of users with ratings from the in process cache
+    num_users = await user_count_cache.get()
+
+    # exclusion sets, staleness and user metadata in one round trip
+    with timer.stage("context"):
+        context = await get_recommendation_context(session, user_id)
+
+    # fallback to cold start recommendations if not enough users or less than 10 rated movies
+    if num_users < 50 or len(context.rated_movie_ids) < 10:
+        if context.genre_embedding is None:
+            raise HTTPException(status_code=404, detail="User not found")
+
+        with timer.stage("cold_start"):
+            # precomputed ranking for the user's genre triple minus the rated and dismissed
+            # movies, the hnsw query is only used when the index can't answer
+            movie_ids = None
+            if cold_start_index:
+                excluded_movie_ids = set(context.rated_movie_ids) | set(context.not_seen_movie_ids)
+                movie_ids = cold_start_index.recommendations(context.top_3_genres or [], context.genre_embedding, excluded_movie_ids)
+
+            if movie_ids is not None:
+                recommendations = await get_cold_start_movies_metadata(session, movie_ids)
+            else:
+                recommendations = await get_cold_start_recommendations(session, user_id, context.genre_embedding, context.top_3_genres)
         return recommendations
     
-    # check if the user rating stats table is stale for the user, if so we need to 
-    # recalculate the user embeddings
-    row = await check_user_rating_stats_stale(session, user_id)
-
-    if row and row.is_stale:
-        movie_embeddings_rows = await get_movie_embeddings(session, user_id)
-
-        # parse pgvector string format to numpy arrays
-        movie_embeddings = []
-        for row in movie_embeddings_rows:
-            embedding_str = row[0].strip('[]')
-            embedding = np.fromstring(embedding_str, sep=',', dtype=np.float32)
-            movie_embeddings.append(embedding)
-
-        movie_embeddings = np.array(movie_embeddings, dtype=np.float32)
+    # if the user rating stats are stale the user embedding and stats are regenerated,
+    # which also returns the fresh user metadata
+    user_row = context
+    if context.is_stale:
+        with timer.stage("refresh_user"):
+            user_row = await refresh_user_embedding_and_stats(session, user_id)
 
-        # average and normalize
-        user_emb = movie_embeddings.mean(axis=0) # [512]
-        user_emb = user_emb / np.linalg.norm(user_emb)
+        if candidate_engine:
+            candidate_engine.update_user_embedding(user_id, user_row.user_embedding)
 
-        await regenerate_user_movie_embedding(session, user_id, user_emb)
-        await update_user_ratings_stats(session, user_id)
-
-        await set_user_rating_stats_fresh(session, user_id)
-
-    # get user metadata for current user and similar users userIds
-    user_metadata, similar_users = await get_similar_users_and_user_metadata(session, user_id, similar_user_count=50)
-
-    # get movie_ids user has rated
-    excluded_movies_ids = [row[0] for row in rated_movie_ids]
-
-    # get movie_ids user has marked as not seen (dismissed)
-    not_seen_movie_ids = await get_user_not_seen_movie_ids(session, user_id)
-    not_seen_ids = [row[0] for row in not_seen_movie_ids]
+    user_metadata = user_metadata_from_row(user_row)
 
     # combine rated and not seen movies for exclusion
-    excluded_movies_ids.extend(not_seen_ids)
-
-    # extract just the user_ids from similar_users rows
-    similar_user_ids = [row.user_id for row in similar_users]
-
-    # fetch our candidate movies from collaborative filtering, default 300 movies
-    candidate_movies = await get_movies_metadata_by_movie_ids(session, similar_user_ids, excluded_movies_ids)
-
-    # use lightgbm reranking model to reduce 300 candidate movies down to 10 best movies for the specific user
-    collaborative_recommendations = rerank_model.rerank_movies(user_metadata, candidate_movies)
-
-    return collaborative_recommendations
\ No newline at end of file
+    excluded_movies_ids = list(context.rated_movie_ids) + list(context.not_seen_movie_ids)
+
+    with timer.stage("candidates"):
+        if candidate_engine and candidate_engine.has_user(user_id):
+            # similar users and candidate movies from the in memory engine, only the
+            # metadata for the picked candidates is read from the database
+            candidate_movie_ids = candidate_engine.candidate_movie_ids(user_id, excluded_movies_ids, similar_user_count=50, limit=300)
+            candidate_movies = await get_candidate_movies_metadata(session, candidate_movie_ids)
+        else:
+            # similar users and their 300 most frequent candidate movies in one query
+            candidate_movies = await get_collaborative_candidates(session, user_id, excluded_movies_ids, similar_user_count=50, limit=300)
+
+    # use lightgbm reranking model to order the 300 candidate movies for the specific user, the
+    # best recommendation_feed_size of them make up the feed
+    with timer.stage("rerank"):
+        collaborative_recommendations = await inference_executor.run(
+            rerank_model.rerank_movies,
+            user_metadata,
+            candidate_movies,
+            settings.recommendation_feed_size
+        )
+
+    return collaborative_recommendations
@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
 from model.utils.cold_start_user_tower import ColdStartUserTower
+from model.utils.candidate_engine import CandidateEngine
 from db.utils.user_sql_queries import (
     new_user_genre_embedding, 
     get_user_watchlist,
     delete_from_watchlist,
-    set_user_rating_stats_stale,
+    apply_user_rating_delta,
     add_user_not_seen_movie
 )
 from db.utils.movies_sql_queries import (
@@ -16,7 +18,8 @@ from db.utils.movies_sql_queries import (
 )
 from db.config.conn import get_session
 from sqlalchemy.ext.asyncio import AsyncSession
-from utils.dependencies import get_cold_start_user_tower
+from utils.dependencies import get_cold_start_user_tower, get_candidate_engine, get_recommendation_cache
+from utils.recommendation_cache import RecommendationCache, invalidate_recommendations, dismiss_recommendation
 from schemas.user import (
     NewUserRequest, 
     AddToWatchlistRequest, 
@@ -35,12 +38,15 @@ async def new_user(
     userId: str,
     body: NewUserRequest,
     session: AsyncSession = Depends(get_session),
-    user_tower: ColdStartUserTower = Depends(get_cold_start_user_tower)
+    user_tower: ColdStartUserTower = Depends(get_cold_start_user_tower),
+    recommendation_cache: Optional[RecommendationCache] = Depends(get_recommendation_cache),
 ):
     genres = body.genres
+    # lookup in the tower's precomputed table of every genre selection, no model call
     user_embedding = user_tower.embedding(genres)
 
     await new_user_genre_embedding(session, userId, user_embedding, genres)
+    await invalidate_recommendations(session, recommendation_cache, userId)
 
     return {"message": f"successfully added genre embeddings for user: {userId}"}
 
@@ -63,6 +69,8 @@ async def add_to_watchlist(
     userId: str, 
     body: AddToWatchlistRequest,
     session: AsyncSession = Depends(get_session),
+    candidate_engine: Optional[CandidateEngine] = Depends(get_candidate_engine),
+    recommendation_cache: Optional[RecommendationCache] = Depends(get_recommendation_cache),
 ):  
     movie_id = body.movie_id
     title = body.title
@@ -85,7 +93,17 @@ async def add_to_watchlist(
         raise HTTPException(status_code=400, detail="Invalid release_date format. Expected YYYY or full date string.")
 
     await add_movie_metadata(session, movie_id, title, genres, release_year, summary, actors, director, language, poster_path)
-    await add_new_movie_rating(session, userId, movie_id, rating)
+    _, previous_rating = await add_new_movie_rating(session, userId, movie_id, rating)
+
+    user_embedding = await apply_user_rating_delta(session, userId, movie_id, previous_rating, rating)
+
+    if candidate_engine:
+        if user_embedding is not None:
+            candidate_engine.update_user_embedding(userId, user_embedding)
+        if rating > 0:
+            candidate_engine.add_rating(userId, movie_id)
+
+    await invalidate_recommendations(session, recommendation_cache, userId)
 
     return {"message": "successfully added movie to watchlist!"}
 
@@ -94,27 +112,37 @@ async def remove_from_watchlist(
     userId: str, 
     body: RemoveFromWatchlistRequest,
     session: AsyncSession = Depends(get_session),
+    candidate_engine: Optional[CandidateEngine] = Depends(get_candidate_engine),
+    recommendation_cache: Optional[RecommendationCache] = Depends(get_recommendation_cache),
 ):  
     movie_id = body.movie_id
 
     if not userId:
         raise HTTPException(status_code=404, detail="No user_id provided")
 
-    rating = await check_if_movie_rated(session, userId, movie_id)
-    was_rated = rating.user_rating > 0
+    await check_if_movie_rated(session, userId, movie_id)
 
     # get latest tmdb stats for that movie so we can also update the movie rating stats with the latest tmdb stats
     tmdb_avg_rating, tmdb_vote_log, tmdb_popularity = await get_movie_tmdb_stats(session, movie_id)
 
-    # delete first so if we recalculate the deleted movie wont be there
-    await delete_from_watchlist(session, userId, movie_id)
+    # delete first so if we recalculate the deleted movie wont be there, the rating it had
+    # is the one the delete removed in case it was re-rated since it was checked
+    deleted_rating = await delete_from_watchlist(session, userId, movie_id)
+    was_rated = deleted_rating is not None and deleted_rating > 0
     
     # recalculate stats if movie was rated
     if was_rated:
         await update_movie_rating_stats(session, movie_id, tmdb_avg_rating, tmdb_vote_log, tmdb_popularity)
 
-    # set the user rating stats to stale so we only need to recalculate user embeddings when showing recommendations
-    await set_user_rating_stats_stale(session, userId)
+    # subtract the removed rating from the user's running sum embedding and rating stats
+    user_embedding = await apply_user_rating_delta(session, userId, movie_id, deleted_rating, 0.0)
+
+    if candidate_engine and was_rated:
+        if user_embedding is not None:
+            candidate_engine.update_user_embedding(userId, user_embedding)
+        candidate_engine.remove_rating(userId, movie_id)
+
+    await invalidate_recommendations(session, recommendation_cache, userId)
 
     return {"message": "Successfully removed movie from watchlist!"}
 
@@ -123,6 +151,7 @@ async def not_seen_movie(
     user_id: str, 
     body: NotSeenMovieRequest,
     session: AsyncSession = Depends(get_session),
+    recommendation_cache: Optional[RecommendationCache] = Depends(get_recommendation_cache),
 ):  
     movie_id = body.movie_id
 
@@ -133,5 +162,7 @@ async def not_seen_movie(
     timer = datetime.now(timezone.utc) + timedelta(days=14)
     
     await add_user_not_seen_movie(session, user_id, movie_id, timer)
+    # only hidden from the cached feed, the rest of the feed stays valid
+    await dismiss_recommendation(session, recommendation_cache, user_id, movie_id)
 
     return {"message": "successfully marked movie as not seen!"}
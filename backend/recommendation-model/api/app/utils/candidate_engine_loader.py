@@ -0,0 +1,29 @@
+# helper functions for building and refreshing the in memory candidate engine
+import asyncio
+from fastapi import FastAPI
+from db.config.conn import async_session
+from db.utils.user_sql_queries import get_all_user_embeddings, get_all_positive_ratings
+from model.utils.candidate_engine import CandidateEngine
+from utils.env_config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# build the candidate engine from the user_embeddings and user_watchlist tables
+async def load_candidate_engine() -> CandidateEngine:
+    async with async_session() as session:
+        user_embedding_rows = await get_all_user_embeddings(session)
+        rating_rows = await get_all_positive_ratings(session)
+
+    return CandidateEngine.build(user_embedding_rows, rating_rows)
+
+# periodically rebuild the engine so ratings handled by other api containers are picked up,
+# ratings handled by this container are already applied incrementally
+async def refresh_candidate_engine(app: FastAPI) -> None:
+    while True:
+        await asyncio.sleep(settings.candidate_engine_refresh_seconds)
+
+        try:
+            app.state.candidate_engine = await load_candidate_engine()
+        except Exception as e:
+            logger.error(f"Failed to refresh candidate engine, keeping previous one: {e}")
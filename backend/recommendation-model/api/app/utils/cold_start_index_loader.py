@@ -0,0 +1,44 @@
+# helper functions for building and refreshing the in memory cold start index
+import asyncio
+from fastapi import FastAPI
+from db.config.conn import async_session
+from db.utils.movies_sql_queries import get_all_cold_start_movies
+from model.utils.cold_start_index import ColdStartIndex
+from model.utils.cold_start_user_tower import ColdStartUserTower
+from utils.env_config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# build the cold start index from the movie tables and the cold start user tower
+async def load_cold_start_index(user_tower: ColdStartUserTower) -> ColdStartIndex:
+    async with async_session() as session:
+        movie_rows = await get_all_cold_start_movies(session)
+
+    # every genre triple's embedding comes from the tower's precomputed table
+    keys, key_embeddings = user_tower.precomputed_embeddings(3)
+
+    # ranking every genre triple is cpu bound, keep it off the event loop
+    return await asyncio.to_thread(
+        ColdStartIndex.build,
+        movie_rows,
+        list(user_tower.genre_mlb.classes_),
+        keys,
+        key_embeddings,
+        settings.cold_start_candidates_per_genres
+    )
+
+# periodically rebuild the index so movies loaded into the catalogue are picked up and the
+# random pool is reshuffled
+async def refresh_cold_start_index(app: FastAPI) -> None:
+    while True:
+        await asyncio.sleep(settings.cold_start_index_refresh_seconds)
+
+        try:
+            user_tower = app.state.models.cold_start_user_tower
+            cold_start_index = await load_cold_start_index(user_tower)
+            # a model reload swapped in a new user tower (and its own index) during the build
+            if app.state.models.cold_start_user_tower is user_tower:
+                app.state.cold_start_index = cold_start_index
+        except Exception as e:
+            logger.error(f"Failed to refresh cold start index, keeping previous one: {e}")
@@ -1,15 +1,85 @@
-from fastapi import Request
+import hmac
+from fastapi import Header, HTTPException, Request
+from typing import Optional
 from model.utils.cold_start_user_tower import ColdStartUserTower
 from model.utils.movie_tower import MovieTower
 from model.utils.reranker_model import Reranker
+from model.utils.candidate_engine import CandidateEngine
+from model.utils.cold_start_index import ColdStartIndex
+from utils.user_count_cache import UserCountCache
+from utils.inference_executor import InferenceExecutor
+from utils.encode_batcher import EncodeBatcher
+from utils.movie_embedding_cache import MovieEmbeddingCache
+from utils.model_registry import ModelRegistry, ModelSet
+from utils.recommendation_cache import RecommendationCache
+from utils.env_config import settings
+
+# the models of a request are pinned on its first model dependency, a hot reload swapping
+# app.state.models mid request doesn't mix two versions. missing until startup loaded them
+def _models(request: Request) -> ModelSet:
+    models = getattr(request.state, "models", None)
+    if models is None:
+        models = getattr(request.app.state, "models", None)
+        if models is None:
+            raise HTTPException(status_code=503, detail="Models are still loading, try again later")
+        request.state.models = models
+
+    return models
 
 # Dependency to get the pre-loaded cold start usertower
 def get_cold_start_user_tower(request: Request) -> ColdStartUserTower:
-    return request.app.state.cold_start_user_tower
+    return _models(request).cold_start_user_tower
 
 # Dependency to get the pre-loaded movie tower
 def get_movie_tower(request: Request) -> MovieTower:
-    return request.app.state.movie_tower
+    return _models(request).movie_tower
 
 def get_reranking_model(request: Request) -> Reranker:
-    return request.app.state.reranker_model
\ No newline at end of file
+    return _models(request).reranker_model
+
+# Dependency to get the stamp of the models the request's recommendations are computed with
+def get_recommendation_version(request: Request) -> str:
+    return _models(request).recommendation_version
+
+# Dependency to get the per user recommendation cache, None when it is disabled
+def get_recommendation_cache(request: Request) -> Optional[RecommendationCache]:
+    return getattr(request.app.state, "recommendation_cache", None)
+
+# Dependency to get the in memory candidate engine, None when it is disabled
+def get_candidate_engine(request: Request) -> Optional[CandidateEngine]:
+    return getattr(request.app.state, "candidate_engine", None)
+
+# Dependency to get the precomputed cold start recommendations, None when disabled or not built
+def get_cold_start_index(request: Request) -> Optional[ColdStartIndex]:
+    return getattr(request.app.state, "cold_start_index", None)
+
+# Dependency to get the cached count of users with ratings
+def get_user_count_cache(request: Request) -> UserCountCache:
+    return request.app.state.user_count_cache
+
+# Dependency to get the thread pool the model calls run on
+def get_inference_executor(request: Request) -> InferenceExecutor:
+    return request.app.state.inference_executor
+
+# Dependency to get the micro batcher for sentence transformer encodes
+def get_encode_batcher(request: Request) -> EncodeBatcher:
+    return _models(request).encode_batcher
+
+# Dependency to get the cache of rated movie embeddings
+def get_movie_embedding_cache(request: Request) -> MovieEmbeddingCache:
+    return _models(request).movie_embedding_cache
+
+# Dependency to get the model registry for hot reloads
+def get_model_registry(request: Request) -> ModelRegistry:
+    registry = getattr(request.app.state, "model_registry", None)
+    if registry is None:
+        raise HTTPException(status_code=503, detail="Models are still loading, try again later")
+
+    return registry
+
+# admin routes need the configured key, they don't exist while no key is configured
+def require_admin_key(x_admin_key: Optional[str] = Header(None)) -> None:
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, settings.admin_api_key):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
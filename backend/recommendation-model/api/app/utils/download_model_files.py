@@ -1,11 +1,29 @@
 # helper functions for downloading model files from AWS s3
+#
+# the files are cached on disk per model version (settings.model_cache_path) together with a
+# manifest.json of the s3 etag, sha256 and size of every file. on a restart each cached file is
+# checked with a conditional HEAD (If-None-Match: <etag>), unchanged files are only re-hashed
+# instead of downloaded again. large files are downloaded as parallel ranged GETs into a
+# .partial file, verified against the size and sha256 checksum from the HEAD and then swapped
+# in with os.replace so a crash mid download never leaves a truncated model behind
+import base64
+import hashlib
+import json
+import os
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Optional
 from utils.env_config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+MANIFEST_NAME = "manifest.json"
+MB = 1024 * 1024
+
 # uses IAM role in prod, otherwise uses credentials
 def get_s3_client():
     if settings.use_iam_role:
@@ -20,19 +38,21 @@ def get_s3_client():
             aws_secret_access_key=settings.aws_secret_access_key
         )
 
-# download all recommendation model files from S3 to local directory
-def download_recommendation_model_files():
+# download all recommendation model files from S3 to the local model cache, returns whether
+# each file was "cached" or "downloaded"
+def download_recommendation_model_files(s3_client=None) -> Dict[str, str]:
     if not settings.production or not settings.s3_bucket_name:
         logger.info("Not in production mode or no S3 bucket name")
-        return
+        return {}
 
-    logger.info(f"Downloading model files from S3 Bucket: {settings.s3_bucket_name}")
+    logger.info(f"Syncing model files from S3 Bucket: {settings.s3_bucket_name}")
 
-    s3_client = get_s3_client()
+    s3_client = s3_client or get_s3_client()
 
-    # create local directory for models
-    local_model_dir = Path("/tmp/models")
+    # create local directory for this model version
+    local_model_dir = settings.model_cache_path
     local_model_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(local_model_dir)
 
     model_files = [
         settings.user_tower_model_name,
@@ -40,21 +60,142 @@ def download_recommendation_model_files():
         settings.reranker_model_name,
         settings.genre_mlb_name
     ]
+    if settings.movie_tower_head_name:
+        model_files.append(settings.movie_tower_head_name)
+
+    transfer_config = TransferConfig(
+        multipart_threshold=settings.model_download_multipart_threshold_mb * MB,
+        multipart_chunksize=settings.model_download_multipart_chunksize_mb * MB,
+        max_concurrency=settings.model_download_max_concurrency
+    )
+
+    # the files are independent, sync them all at once instead of one after another
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=len(model_files)) as pool:
+            futures = {
+                pool.submit(
+                    sync_model_file,
+                    s3_client,
+                    model_file,
+                    local_model_dir / model_file,
+                    manifest.get(model_file),
+                    transfer_config
+                ): model_file
+                for model_file in model_files
+            }
+
+            for future in as_completed(futures):
+                model_file = futures[future]
+                try:
+                    manifest[model_file], results[model_file] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to download {model_file}: {e}")
+                    raise
+    finally:
+        # keep the entries of the files that did sync so the next start can skip them
+        save_manifest(local_model_dir, manifest)
+
+    downloaded = sum(1 for result in results.values() if result == "downloaded")
+    logger.info(f"All model files ready: {downloaded} downloaded, {len(results) - downloaded} unchanged")
 
-    for model_file in model_files:
-        s3_key = f"{settings.s3_model_prefix}{model_file}"
-        local_path = local_model_dir / model_file
+    return results
 
+# makes local_path match the s3 object, returns the manifest entry and "cached" or "downloaded"
+def sync_model_file(
+    s3_client,
+    model_file: str,
+    local_path: Path,
+    cached: Optional[dict],
+    transfer_config: Optional[TransferConfig] = None
+) -> tuple[dict, str]:
+    s3_key = f"{settings.s3_model_prefix}{model_file}"
+
+    head = None
+    if cached and local_path.exists():
         try:
-            logger.info(f"Downloading {s3_key} to {local_path}")
-            s3_client.download_file(
+            head = s3_client.head_object(
                 Bucket=settings.s3_bucket_name,
                 Key=s3_key,
-                Filename=str(local_path)
+                IfNoneMatch=cached["etag"],
+                ChecksumMode="ENABLED"
             )
-            logger.info(f"Downloaded {model_file}")
-        except Exception as e:
-            logger.error(f"Failed to download {model_file}: {e}")
-            raise
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("304", "NotModified"):
+                raise
+
+        # not modified in s3, reuse the local copy as long as it is still the file we downloaded
+        if head is None:
+            if local_path.stat().st_size == cached["size"] and file_sha256(local_path) == cached["sha256"]:
+                logger.info(f"{s3_key} unchanged (etag {cached['etag']}), using cached copy")
+                return cached, "cached"
+            logger.warning(f"Cached {local_path} doesn't match the manifest, downloading again")
+
+    if head is None:
+        head = s3_client.head_object(Bucket=settings.s3_bucket_name, Key=s3_key, ChecksumMode="ENABLED")
+
+    return download_model_file(s3_client, s3_key, local_path, head, transfer_config), "downloaded"
+
+# downloads the object version described by head next to local_path, verifies it and swaps it in
+def download_model_file(
+    s3_client,
+    s3_key: str,
+    local_path: Path,
+    head: dict,
+    transfer_config: Optional[TransferConfig] = None
+) -> dict:
+    partial_path = local_path.with_name(local_path.name + ".partial")
+
+    logger.info(f"Downloading {s3_key} ({head['ContentLength'] / MB:.1f} MB) to {local_path}")
+    try:
+        # on a versioned bucket every ranged GET reads the version from the HEAD, so a model
+        # uploaded mid download can't get stitched together with the old one
+        extra_args = {"VersionId": head["VersionId"]} if head.get("VersionId") else None
+        s3_client.download_file(
+            Bucket=settings.s3_bucket_name,
+            Key=s3_key,
+            Filename=str(partial_path),
+            ExtraArgs=extra_args,
+            Config=transfer_config
+        )
+
+        size = partial_path.stat().st_size
+        if size != head["ContentLength"]:
+            raise ValueError(f"{s3_key} is {size} bytes, expected {head['ContentLength']}")
+
+        sha256 = file_sha256(partial_path)
+        # only whole object checksums can be compared, multipart uploads store a checksum of
+        # the part checksums ("<checksum>-<parts>")
+        expected = head.get("ChecksumSHA256")
+        if expected and "-" not in expected and base64.b64decode(expected).hex() != sha256:
+            raise ValueError(f"{s3_key} sha256 {sha256} doesn't match the s3 checksum")
+
+        os.replace(partial_path, local_path)
+    finally:
+        partial_path.unlink(missing_ok=True)
+
+    logger.info(f"Downloaded {s3_key}")
+
+    return {"etag": head["ETag"], "sha256": sha256, "size": size}
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(MB), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def load_manifest(local_model_dir: Path) -> Dict[str, dict]:
+    try:
+        return json.loads((local_model_dir / MANIFEST_NAME).read_text())
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.warning(f"Unreadable model manifest in {local_model_dir}, downloading every file")
+        return {}
 
-    logger.info("All model files downloaded successfully")
+def save_manifest(local_model_dir: Path, manifest: Dict[str, dict]) -> None:
+    tmp_path = local_model_dir / (MANIFEST_NAME + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp_path, local_model_dir / MANIFEST_NAME)
@@ -0,0 +1,139 @@
+# coalesces sentence transformer encodes from concurrent requests into one batched encode.
+# requests are collected for up to max_wait_ms or until max_batch_size sentences are waiting,
+# then encoded together on the inference executor and the rows are handed back to each request.
+# one padded batch costs less CPU time than the same sentences encoded one request at a time
+import asyncio
+import math
+import time
+import numpy as np
+from collections import Counter
+from numpy.typing import NDArray
+from sentence_transformers import SentenceTransformer
+from typing import Any, Dict, List, Optional, Tuple
+from utils.inference_executor import InferenceExecutor
+from utils.timing import traced
+import logging
+
+logger = logging.getLogger(__name__)
+
+# largest padded chunk the sentence transformer runs at once, bigger chunks stop paying off on CPU
+ENCODE_CHUNK_SIZE = 16
+
+class EncodeBatcher:
+    def __init__(
+        self,
+        model: SentenceTransformer,
+        inference_executor: InferenceExecutor,
+        max_wait_ms: float,
+        max_batch_size: int
+    ) -> None:
+        self.model = model
+        self.inference_executor = inference_executor
+        self.max_wait_ms = max_wait_ms
+        self.max_batch_size = max_batch_size
+
+        # requests waiting for the next batch: (sentences, future, time enqueued)
+        self._pending: List[Tuple[List[str], asyncio.Future, float]] = []
+        self._pending_sentences = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks = set()
+
+        # metrics
+        self.batches = 0
+        self.requests = 0
+        self.sentences = 0
+        self.total_wait_ms = 0.0
+        self.batch_size_histogram = Counter()
+
+    # encodes the sentences as part of the next batch, returns one row per sentence. the span
+    # is the request's wait for its batch plus the batch encode
+    @traced("model.movie_tower.encode")
+    async def encode(self, sentences: List[str]) -> NDArray[np.float32]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        self._pending.append((sentences, future, time.perf_counter()))
+        self._pending_sentences += len(sentences)
+
+        if self._pending_sentences >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    # starts encoding everything pending, batches run concurrently on the executor so a slow
+    # batch doesn't hold back the next one
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch = self._pending
+        self._pending = []
+        self._pending_sentences = 0
+
+        if batch:
+            task = asyncio.create_task(self._encode_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _encode_batch(self, batch: List[Tuple[List[str], asyncio.Future, float]]) -> None:
+        sentences = [sentence for request_sentences, _, _ in batch for sentence in request_sentences]
+        flushed = time.perf_counter()
+
+        self.batches += 1
+        self.requests += len(batch)
+        self.sentences += len(sentences)
+        self.total_wait_ms += sum((flushed - enqueued) * 1000 for _, _, enqueued in batch)
+        self.batch_size_histogram[self._bucket(len(sentences))] += 1
+
+        try:
+            features = await self.inference_executor.run(
+                self.model.encode, sentences, batch_size=self._chunk_size(len(sentences)), convert_to_numpy=True
+            )
+        except Exception as e:
+            # every request in the batch fails the same way, e.g. a 503 from a full executor
+            logger.warning(f"Batched encode of {len(sentences)} sentences failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for request_sentences, future, _ in batch:
+            # the request may have been cancelled (client disconnected) while it waited
+            if not future.done():
+                future.set_result(features[offset:offset + len(request_sentences)])
+            offset += len(request_sentences)
+
+    # the sentence transformer sorts a batch by length and pads each chunk to its longest
+    # sentence, chunks of at most half the batch keep short titles out of the chunks of long
+    # overview sentences instead of padding them to overview length
+    @staticmethod
+    def _chunk_size(size: int) -> int:
+        return max(1, min(ENCODE_CHUNK_SIZE, math.ceil(size / 2)))
+
+    # power of two histogram buckets: 1, 2, 3-4, 5-8, ...
+    @staticmethod
+    def _bucket(size: int) -> str:
+        upper = 1
+        while upper < size:
+            upper *= 2
+        lower = upper // 2 + 1
+
+        return str(upper) if lower >= upper else f"{lower}-{upper}"
+
+    def stats(self) -> Dict[str, Any]:
+        batches = max(self.batches, 1)
+
+        return {
+            "max_wait_ms": self.max_wait_ms,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "requests": self.requests,
+            "sentences": self.sentences,
+            "avg_batch_size": round(self.sentences / batches, 2),
+            "avg_wait_ms": round(self.total_wait_ms / max(self.requests, 1), 3),
+            "batch_size_histogram": dict(sorted(self.batch_size_histogram.items(), key=lambda item: int(item[0].split("-")[-1]))),
+        }
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional, List
+from typing import Literal, Optional, List
 from pathlib import Path
 
 # Project root (api/ directory)
@@ -15,6 +15,24 @@ class Settings(BaseSettings):
     db_port: str
     db_name: str
 
+    # connection pool, requests past pool_size + max_overflow wait up to pool_timeout seconds
+    # for a connection (GET /api/db/pool/stats has the checkout wait times)
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    # reopen connections older than this so idle ones dropped by the server or a proxy
+    # aren't handed out, -1 never recycles
+    db_pool_recycle: int = 1800
+    # pre ping sends a round trip on every checkout to catch dead connections, turned off a
+    # dead connection fails its first statement and the pool is invalidated instead, which
+    # db_pool_recycle mostly avoids
+    db_pool_pre_ping: bool = True
+    # asyncpg prepared statements kept per connection, the queries are fixed text() strings
+    # so each is only parsed and planned once per connection. 0 disables the cache
+    db_statement_cache_size: int = 256
+    # logs every statement and its parameters (including whole embeddings), local debugging only
+    db_echo: bool = False
+
     # AWS access
     aws_region: Optional[str] = None
     aws_access_key: Optional[str] = None
@@ -28,6 +46,14 @@ class Settings(BaseSettings):
     # - models/development/v1/ - testing model files
     s3_model_prefix: str = "models/production/v1/"
 
+    # downloaded model files are kept per version under this directory with a manifest of the
+    # s3 etag + sha256 of every file, a restart only downloads the files that changed in s3
+    model_cache_dir: str = "/tmp/models"
+    # files above the threshold are downloaded as parallel ranged GETs
+    model_download_multipart_threshold_mb: int = 32
+    model_download_multipart_chunksize_mb: int = 16
+    model_download_max_concurrency: int = 8
+
     # local model paths (used during development)
     local_model_dir: str = "app/model/files_small"
     user_tower_model_name: str = "user_tower.pth"
@@ -37,35 +63,77 @@ class Settings(BaseSettings):
 
     hf_model_name: str = "intfloat/multilingual-e5-small"
 
+    # how the movie tower layers run: the eager nn.Linear layers, or the single inference graph
+    # exported by training (post_training/save_model_files.py) with torch.jit or onnx runtime
+    # (the onnx extra: uv sync --extra onnx)
+    movie_tower_backend: Literal["eager", "torchscript", "onnx"] = "eager"
+    movie_tower_head_torchscript_name: str = "movie_tower_head.pt"
+    movie_tower_head_onnx_name: str = "movie_tower_head.onnx"
+    # dynamic int8 quantization of the sentence transformer's linear layers, faster on cpu
+    # at a small cost in embedding accuracy (benchmarks/movie_tower_backend_benchmark.py)
+    sentence_transformer_int8: bool = False
+
+    # how the reranker scores candidates: lightgbm's Booster.predict, or the trees compiled to a
+    # native single threaded predictor (model/utils/tree_predictor.py, needs a c compiler)
+    reranker_backend: Literal["lightgbm", "compiled"] = "lightgbm"
+    # Booster.predict options, num_threads 0 keeps lightgbm's default (every core)
+    reranker_num_threads: int = 0
+    reranker_predict_disable_shape_check: bool = False
+
+    # poll s3 for changed model files and hot swap them in, 0 only reloads through the admin route
+    model_reload_poll_seconds: int = 0
+    # key the /api/admin routes expect in the X-Admin-Key header, the routes are off when unset
+    admin_api_key: Optional[str] = None
+
+    # load the models in the background after startup, the database only routes (watchlist,
+    # not seen) are served right away and the model routes return 503 until /api/ready is 200
+    lazy_model_loading: bool = False
+
     # Database connection string
     @property
     def database_url(self) -> str:
         return f"postgresql+asyncpg://{self.db_username}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
     
     # Model paths
+    @property
+    def model_cache_path(self) -> Path:
+        # one directory per s3 model version so switching s3_model_prefix back and forth
+        # doesn't throw away the files of the other version
+        return Path(self.model_cache_dir) / self.s3_model_prefix.strip("/")
+
+    def _model_path(self, model_name: str) -> str:
+        if self.production and self.s3_bucket_name:
+            return str(self.model_cache_path / model_name)
+        return str(PROJECT_ROOT / self.local_model_dir / model_name)
+
     @property
     def user_tower_model_path(self) -> str:
-        if self.production:
-            return f"/tmp/models/{self.user_tower_model_name}"
-        return str(PROJECT_ROOT / self.local_model_dir / self.user_tower_model_name)
+        return self._model_path(self.user_tower_model_name)
 
     @property
     def movie_tower_model_path(self) -> str:
-        if self.production and self.s3_bucket_name:
-            return f"/tmp/models/{self.movie_tower_model_name}"
-        return str(PROJECT_ROOT / self.local_model_dir / self.movie_tower_model_name)
+        return self._model_path(self.movie_tower_model_name)
+
+    # exported movie tower head of the configured backend, None for the eager layers
+    @property
+    def movie_tower_head_name(self) -> Optional[str]:
+        if self.movie_tower_backend == "torchscript":
+            return self.movie_tower_head_torchscript_name
+        if self.movie_tower_backend == "onnx":
+            return self.movie_tower_head_onnx_name
+        return None
+
+    @property
+    def movie_tower_head_path(self) -> Optional[str]:
+        return self._model_path(self.movie_tower_head_name) if self.movie_tower_head_name else None
 
     @property
     def reranker_model_path(self) -> str:
-        if self.production and self.s3_bucket_name:
-            return f"/tmp/models/{self.reranker_model_name}"
-        return str(PROJECT_ROOT / self.local_model_dir / self.reranker_model_name)
+        return self._model_path(self.reranker_model_name)
 
     @property
     def genre_mlb_path(self) -> str:
-        if self.production and self.s3_bucket_name:
-            return f"/tmp/models/{self.genre_mlb_name}"
-        return str(PROJECT_ROOT / self.local_model_dir / self.genre_mlb_name)
+        return self._model_path(self.genre_mlb_name)
     
     # API Settings
     log_level: str = "INFO"
@@ -74,6 +142,53 @@ class Settings(BaseSettings):
     # Model Settings
     embedding_dim: int = 512
 
+    # In memory candidate engine, answers similar users -> candidate movies without sql
+    # when enabled, the sql path is still used as the fallback
+    candidate_engine_enabled: bool = False
+    candidate_engine_refresh_seconds: int = 900
+
+    # precomputed cold start recommendations per genre triple, requests fall back to the
+    # hnsw query while it is disabled or building
+    cold_start_index_enabled: bool = True
+    cold_start_index_refresh_seconds: int = 3600
+    cold_start_candidates_per_genres: int = 100
+
+    # how stale the cached count of users with ratings (cold start gate) can get
+    user_count_cache_ttl_seconds: int = 60
+
+    # thread pool the model calls (movie tower, cold start user tower, reranker) run on so
+    # they don't block the event loop, requests past max_workers + max_queue get a 503
+    # 0 workers runs the model calls inline on the event loop
+    inference_max_workers: int = 2
+    inference_max_queue: int = 32
+
+    # sentence transformer encodes from concurrent rating requests are collected for up to
+    # max_wait_ms or max_size sentences and encoded as one batch
+    encode_batch_max_wait_ms: float = 5.0
+    encode_batch_max_size: int = 64
+
+    # in process LRU of rated movie embeddings (~2KB each) in front of the database lookup
+    movie_embedding_cache_size: int = 10000
+
+    # how many of the reranked candidates the paginated recommendation feed holds
+    recommendation_feed_size: int = 100
+
+    # per user cache of the recommendation feed, dropped when the user rates or removes a movie
+    # and filtered when they dismiss one. "memory" is per replica, with more than one replica use "redis" so
+    # the invalidations reach every replica (uv sync --extra redis)
+    recommendation_cache_backend: Literal["memory", "redis", "none"] = "memory"
+    # users whose feed is kept, a feed of 100 recommendations is ~100KB
+    recommendation_cache_size: int = 2000
+    # upper bound on how long catalogue and other users' changes take to show up
+    recommendation_cache_ttl_seconds: int = 300
+    redis_url: Optional[str] = None
+    redis_timeout_seconds: float = 0.25
+
+    # adds a Server-Timing header with the request's span durations (queries, model calls,
+    # serialization) to responses of requests sent with an X-Server-Timing header. the span
+    # names are internals, leave it off where the api is reachable by the public
+    server_timing_enabled: bool = False
+
     model_config = SettingsConfigDict(
         env_file=str(ENV_FILE),
         env_file_encoding="utf-8",
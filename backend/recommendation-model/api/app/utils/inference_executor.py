@@ -0,0 +1,93 @@
+# runs the cpu bound model calls (movie tower, cold start user tower, reranker) on a bounded
+# thread pool so they don't block the asyncio event loop. torch, tokenizers and lightgbm
+# release the GIL while computing so threads run in parallel, and unlike a process pool the
+# loaded models don't have to be pickled or loaded once per process
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from typing import Any, Callable, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int, max_queue: int) -> None:
+        # max_workers = 0 runs the model calls inline on the event loop (local debugging)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference") if max_workers > 0 else None
+
+        # in_flight is only touched on the event loop, running and wait times from the workers
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self.total_run_ms = 0.0
+
+    # calls whose work is queued behind the running ones
+    @property
+    def queue_depth(self) -> int:
+        return max(self.in_flight - self.running, 0)
+
+    # runs fn(*args, **kwargs) on the pool, rejects with 503 once max_workers calls are running
+    # and max_queue more are waiting so overload sheds requests instead of growing latency
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if self._pool is None:
+            return fn(*args, **kwargs)
+
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Inference queue full ({self.in_flight} in flight), rejecting request")
+            raise HTTPException(status_code=503, detail="Server is busy, try again later")
+
+        self.in_flight += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.running += 1
+                self.total_wait_ms += (started - submitted) * 1000
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.total_run_ms += (time.perf_counter() - started) * 1000
+
+        # the worker runs in a copy of the request's context so the model spans end up in
+        # the request's trace
+        context = contextvars.copy_context()
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, context.run, task)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        completed = max(self.completed, 1)
+
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_ms / completed, 3),
+            "avg_run_ms": round(self.total_run_ms / completed, 3),
+        }
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
@@ -1,4 +1,5 @@
 import joblib
+import torch
 from pathlib import Path
 from sentence_transformers import SentenceTransformer
 from utils.env_config import settings
@@ -24,6 +25,11 @@ def load_sentence_transformer_model() -> SentenceTransformer:
         logger.info(f"Loading dev model: {settings.hf_model_name}")
         model = SentenceTransformer(model_name)
 
+    # int8 weights for the linear layers, activations are quantized per batch at runtime
+    if settings.sentence_transformer_int8:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        logger.info("Sentence Transformer quantized to int8")
+
     logger.info("Sentence Transformer model loaded successfully")
     return model
 
@@ -0,0 +1,120 @@
+# minimal prometheus metrics (histograms and counters in the text exposition format) for
+# /api/metrics, the few metric types the api needs don't warrant the prometheus_client
+# dependency. observations come from the event loop and the inference threads so every
+# metric has its own lock
+import bisect
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# seconds, from a cached lookup (~100us) up to a slow cold request
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # label values -> (bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+
+        with self._lock:
+            series = [(labelvalues, list(counts), total, count) for labelvalues, (counts, total, count) in self._series.items()]
+
+        for labelvalues, counts, total, count in sorted(series):
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(upper) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}"
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def collect(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+# numeric values of the components' stats() dicts (inference executor, caches, connection
+# pool) as gauges, cinesense_<component>_<key>
+def stats_gauges(component: str, stats: Dict[str, Any]) -> Iterable[str]:
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+
+        name = f"cinesense_{component}_{key}"
+        yield f"# TYPE {name} gauge"
+        yield f"{name} {_number(value)}"
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "cinesense_http_request_duration_seconds",
+    "Time to handle a request, by route template, method and status code",
+    ("route", "method", "status")
+)
+STAGE_SECONDS = Histogram(
+    "cinesense_stage_duration_seconds",
+    "Time spent in a named stage of a request (queries, model calls, serialization)",
+    ("stage",)
+)
+STAGE_ERRORS = Counter(
+    "cinesense_stage_errors_total",
+    "Stages that raised",
+    ("stage",)
+)
+
+REGISTRY = [HTTP_REQUEST_SECONDS, STAGE_SECONDS, STAGE_ERRORS]
+
+def render(extra_lines: Iterable[str] = ()) -> str:
+    lines = [line for metric in REGISTRY for line in metric.collect()]
+    lines.extend(extra_lines)
+
+    return "\n".join(lines) + "\n"
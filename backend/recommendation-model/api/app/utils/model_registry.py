@@ -0,0 +1,209 @@
+# hot reloading of the recommendation models without restarting the container
+#
+# a new version is loaded into shadow instances of the movie tower, cold start user tower and
+# reranker next to the ones serving traffic, then swapped in by replacing the single ModelSet
+# reference on app.state. requests pin the ModelSet they started with (utils/dependencies.py)
+# so in flight requests finish on the old version and no request mixes two versions
+import asyncio
+import time
+from contextlib import contextmanager
+from fastapi import FastAPI, HTTPException
+from typing import Callable, ContextManager, Dict, Optional
+from model.utils.cold_start_user_tower import ColdStartUserTower
+from model.utils.movie_tower import MovieTower
+from model.utils.reranker_model import Reranker
+from utils.env_config import settings
+from utils.download_model_files import download_recommendation_model_files
+from utils.load_model_files import load_sentence_transformer_model, load_recommendation_models
+from utils.cold_start_index_loader import load_cold_start_index
+from utils.encode_batcher import EncodeBatcher
+from utils.movie_embedding_cache import MovieEmbeddingCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+Phase = Callable[[str], ContextManager]
+
+# one version of every model, only ever replaced as a whole
+class ModelSet:
+    def __init__(
+        self,
+        version: int,
+        movie_tower: MovieTower,
+        cold_start_user_tower: ColdStartUserTower,
+        reranker_model: Reranker,
+        encode_batcher: EncodeBatcher,
+        movie_embedding_cache: MovieEmbeddingCache
+    ) -> None:
+        self.version = version
+        self.movie_tower = movie_tower
+        self.cold_start_user_tower = cold_start_user_tower
+        self.reranker_model = reranker_model
+        self.encode_batcher = encode_batcher
+        self.movie_embedding_cache = movie_embedding_cache
+        self.loaded_at = time.time()
+
+    # the trained files behind a recommendation, cached recommendations of other models aren't
+    # served. file hashes rather than version (a per process counter) so replicas sharing the
+    # redis cache agree on it
+    @property
+    def recommendation_version(self) -> str:
+        return f"{self.movie_tower.model_version}-{self.reranker_model.model_version}"
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "movie_tower": self.movie_tower.model_version,
+            "reranker": self.reranker_model.model_version,
+            "reranker_backend": self.reranker_model.backend,
+            "loaded_at": self.loaded_at,
+        }
+
+# loads every model from the downloaded files, the models don't depend on each other (the movie
+# tower only on the sentence transformer) so they load in parallel threads. on a reload the
+# bundled sentence transformer and its encode batcher are reused from the current set
+async def load_model_set(app: FastAPI, version: int, phase: Phase, current: Optional[ModelSet] = None) -> ModelSet:
+    with phase("load_models"):
+        (
+            user_tower_path,
+            movie_tower_path,
+            genre_mlb,
+            reranker_model_path
+        ) = await asyncio.to_thread(load_recommendation_models)
+
+        def load_movie_tower():
+            if current:
+                sentence_transformer_model = current.movie_tower.sentence_transformer_encoder
+            else:
+                with phase("sentence_transformer"):
+                    sentence_transformer_model = load_sentence_transformer_model()
+            with phase("movie_tower"):
+                return MovieTower(
+                    movie_tower_path,
+                    genre_mlb,
+                    sentence_transformer_model,
+                    backend=settings.movie_tower_backend,
+                    head_path=settings.movie_tower_head_path
+                )
+
+        def load_cold_start_user_tower():
+            with phase("cold_start_user_tower"):
+                return ColdStartUserTower(user_tower_path, genre_mlb)
+
+        def load_reranker():
+            with phase("reranker"):
+                return Reranker(
+                    reranker_model_path,
+                    backend=settings.reranker_backend,
+                    num_threads=settings.reranker_num_threads,
+                    predict_disable_shape_check=settings.reranker_predict_disable_shape_check
+                )
+
+        movie_tower, cold_start_user_tower, reranker_model = await asyncio.gather(
+            asyncio.to_thread(load_movie_tower),
+            asyncio.to_thread(load_cold_start_user_tower),
+            asyncio.to_thread(load_reranker),
+        )
+
+    if current:
+        encode_batcher = current.encode_batcher
+    else:
+        encode_batcher = EncodeBatcher(
+            movie_tower.sentence_transformer_encoder,
+            app.state.inference_executor,
+            settings.encode_batch_max_wait_ms,
+            settings.encode_batch_max_size
+        )
+
+    # the cached embeddings are only valid for the movie tower they were generated with
+    if current and current.movie_embedding_cache.model_version == movie_tower.model_version:
+        movie_embedding_cache = current.movie_embedding_cache
+    else:
+        movie_embedding_cache = MovieEmbeddingCache(settings.movie_embedding_cache_size, movie_tower.model_version)
+
+    return ModelSet(version, movie_tower, cold_start_user_tower, reranker_model, encode_batcher, movie_embedding_cache)
+
+class ModelRegistry:
+    def __init__(self, app: FastAPI) -> None:
+        self.app = app
+        self.lock = asyncio.Lock()
+        self.reloads = 0
+        self.last_reload: Optional[dict] = None
+
+    @property
+    def current(self) -> Optional[ModelSet]:
+        return getattr(self.app.state, "models", None)
+
+    # loads the next version into shadow instances and swaps it in, returns what happened.
+    # without force nothing is swapped when no model file changed in s3
+    async def reload(self, force: bool = False) -> dict:
+        if self.lock.locked():
+            raise HTTPException(status_code=409, detail="A model reload is already running")
+
+        async with self.lock:
+            current = self.current
+            if current is None:
+                raise HTTPException(status_code=503, detail="Models are still loading, try again later")
+
+            phases: Dict[str, float] = {}
+            start = time.perf_counter()
+
+            # only the s3 sync, the loading is skipped when every file is unchanged
+            with timed(phases, "download"):
+                results = await asyncio.to_thread(download_recommendation_model_files)
+            changed = [model_file for model_file, result in results.items() if result == "downloaded"]
+            if not changed and not force:
+                return {"status": "unchanged", "models": current.info(), "phases": phases}
+
+            models = await load_model_set(self.app, current.version + 1, lambda name: timed(phases, name), current)
+
+            # the cold start index is ranked with the user tower's embeddings, so it is rebuilt
+            # with the shadow tower and swapped in together with it
+            cold_start_index = getattr(self.app.state, "cold_start_index", None)
+            if settings.cold_start_index_enabled:
+                with timed(phases, "cold_start_index"):
+                    try:
+                        cold_start_index = await load_cold_start_index(models.cold_start_user_tower)
+                    except Exception as e:
+                        logger.error(f"Failed to build cold start index for the new models, using the database query: {e}")
+                        cold_start_index = None
+
+            # swapped in the same event loop step, ColdStartIndex.recommendations() also checks
+            # the embedding so a request still on the old tower falls back to the database query
+            self.app.state.models = models
+            self.app.state.cold_start_index = cold_start_index
+
+            phases["total"] = round((time.perf_counter() - start) * 1000, 1)
+            self.reloads += 1
+            self.last_reload = {"changed": changed, "models": models.info(), "phases": phases}
+            logger.info(f"Swapped in models version {models.version} (changed: {changed or 'forced'}) in {phases['total']:.0f} ms")
+
+            return {"status": "reloaded", **self.last_reload}
+
+    def stats(self) -> dict:
+        current = self.current
+        return {
+            "models": current.info() if current else None,
+            "reloads": self.reloads,
+            "last_reload": self.last_reload,
+            "poll_seconds": settings.model_reload_poll_seconds,
+        }
+
+@contextmanager
+def timed(phases: Dict[str, float], name: str):
+    start = time.perf_counter()
+    yield
+    phases[name] = round((time.perf_counter() - start) * 1000, 1)
+
+# poll s3 for new model files and swap them in when they change
+async def refresh_models(app: FastAPI) -> None:
+    while True:
+        await asyncio.sleep(settings.model_reload_poll_seconds)
+
+        try:
+            await app.state.model_registry.reload()
+        except HTTPException as e:
+            logger.info(f"Skipping model poll: {e.detail}")
+        except Exception as e:
+            # the new files are already in the local cache, a forced reload retries loading them
+            logger.error(f"Failed to reload models, keeping version {app.state.models.version}: {e}")
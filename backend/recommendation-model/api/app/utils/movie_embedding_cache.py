@@ -0,0 +1,102 @@
+# cache in front of the movie tower for rated movies. embeddings are looked up in an in process
+# LRU keyed on the imdb_id, a hash of the movie tower inputs and the model version, then in
+# movie_embedding_personalized_prod, and only the movies in neither are run through the tower.
+# a movie already in the table keeps its stored embedding (add_new_movie_embedding never
+# overwrites it), so a popular movie is only ever embedded once
+import hashlib
+import json
+import numpy as np
+from collections import OrderedDict
+from numpy.typing import NDArray
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from db.utils.movies_sql_queries import get_movie_embeddings_by_movie_ids
+
+class MovieEmbeddingCache:
+    def __init__(self, max_size: int, model_version: str) -> None:
+        self.max_size = max_size
+        self.model_version = model_version
+        self._embeddings: OrderedDict[str, NDArray[np.float32]] = OrderedDict()
+
+        # metrics
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    # content address of a movie: imdb_id + every movie tower input + the model that embeds it
+    def key(self, imdb_id: str, tower_input: Dict[str, Any]) -> str:
+        content = json.dumps(
+            {"imdb_id": imdb_id, "model_version": self.model_version, **tower_input},
+            sort_keys=True
+        )
+
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[NDArray[np.float32]]:
+        embedding = self._embeddings.get(key)
+        if embedding is not None:
+            self._embeddings.move_to_end(key)
+
+        return embedding
+
+    def put(self, key: str, embedding: NDArray[np.float32]) -> None:
+        self._embeddings[key] = embedding
+        self._embeddings.move_to_end(key)
+
+        while len(self._embeddings) > self.max_size:
+            self._embeddings.popitem(last=False)
+
+    # embeddings for the movies in order, generate is only called with the tower inputs of the
+    # movies missing from both tiers and has to return their embeddings in the same order
+    async def get_or_generate(
+        self,
+        session: AsyncSession,
+        imdb_ids: List[str],
+        tower_inputs: List[Dict[str, Any]],
+        generate: Callable[[List[Dict[str, Any]]], Awaitable[NDArray[np.float32]]]
+    ) -> List[NDArray[np.float32]]:
+        keys = [self.key(imdb_id, tower_input) for imdb_id, tower_input in zip(imdb_ids, tower_inputs)]
+        embeddings = [self.get(key) for key in keys]
+
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        self.memory_hits += len(keys) - len(missing)
+
+        if missing:
+            stored = dict(await get_movie_embeddings_by_movie_ids(session, list({imdb_ids[i] for i in missing})))
+
+            for i in missing:
+                if imdb_ids[i] in stored:
+                    embeddings[i] = stored[imdb_ids[i]]
+                    self.put(keys[i], embeddings[i])
+                    self.db_hits += 1
+
+            missing = [i for i in missing if embeddings[i] is None]
+
+        if missing:
+            self.misses += len(missing)
+
+            # the same movie twice in one batch is only generated once
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], i)
+            generated = dict(zip(unique, await generate([tower_inputs[i] for i in unique.values()])))
+
+            for key, embedding in generated.items():
+                self.put(key, embedding)
+            for i in missing:
+                embeddings[i] = generated[keys[i]]
+
+        return embeddings
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = max(self.memory_hits + self.db_hits + self.misses, 1)
+
+        return {
+            "model_version": self.model_version,
+            "size": len(self._embeddings),
+            "max_size": self.max_size,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4),
+        }
@@ -0,0 +1,76 @@
+# on demand sampling profiler for the running api, a thread reads the stack of every other
+# thread (event loop, inference workers) with sys._current_frames at a fixed interval and
+# counts each distinct stack. the result is in the collapsed stack format ("frame;frame;frame
+# count" per line) that flamegraph.pl, speedscope and inferno read. sampling only costs the
+# profiled process while a profile is running and doesn't need a restart or py-spy in the image
+import asyncio
+import sys
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+# one profile at a time, two samplers would slow the process down twice and skew each other
+_profile_lock = threading.Lock()
+
+class SamplingProfiler:
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+
+        while not self._stop.wait(self.interval_seconds):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+
+                # root first, the thread name groups the stacks by thread in a flame graph
+                frames.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def stats(self) -> Dict[str, int]:
+        return {"samples": self.samples, "stacks": len(self.stacks)}
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+# samples the process for seconds and returns the profiler, raises ProfilerBusyError while
+# another profile is running. the event loop keeps serving (and is sampled) meanwhile
+async def profile(seconds: float, interval_seconds: float) -> SamplingProfiler:
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("a profile is already running")
+
+    try:
+        profiler = SamplingProfiler(interval_seconds)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+        return profiler
+    finally:
+        _profile_lock.release()
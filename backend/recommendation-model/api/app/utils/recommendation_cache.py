@@ -0,0 +1,286 @@
+# per user cache of the recommendation feed, the whole reranked candidate list is kept so a
+# revisit of the home page and every "show more" page is answered without the candidate query
+# and the reranker as long as nothing about the user changed. entries are dropped by the same
+# events that mark the user's stats stale (rating, watchlist removal, new genre selection),
+# stamped with the models that produced them and expire after a ttl so catalogue changes (new
+# movies, rating stats of other users, a rebuilt cold start index) still show up
+#
+# a not seen dismissal doesn't drop the feed, the movie is recorded next to it and skipped
+# when a page is read. the feed itself never changes so a cursor (position in the feed) keeps
+# pointing at the same movie while the user dismisses movies on the pages before it
+#
+# get() also returns a generation that invalidate() moves past, a request stores its result
+# with the generation it read before computing so a result computed from the old data can't
+# be cached after an invalidation that happened while it was running
+#
+# the in process LRU is per replica, the redis backend (uv sync --extra redis) is shared
+# between replicas so an invalidation on one is seen by every other
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Set, Tuple
+from utils.env_config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# the ranked recommendations of a user and the movies dismissed since they were ranked
+class RecommendationFeed:
+    def __init__(self, recommendations: List[Dict[str, Any]], dismissed: Optional[Set[str]] = None) -> None:
+        self.recommendations = recommendations
+        self.dismissed = dismissed or set()
+
+    # up to limit recommendations from position cursor on, skipping the dismissed movies, and
+    # the cursor of the next page (None once the feed is exhausted)
+    def page(self, cursor: int, limit: int) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        page = []
+        position = cursor
+        while position < len(self.recommendations) and len(page) < limit:
+            recommendation = self.recommendations[position]
+            if recommendation["movie_id"] not in self.dismissed:
+                page.append(recommendation)
+            position += 1
+
+        # the rest of the feed may all be dismissed, the next page is empty then
+        next_cursor = position if position < len(self.recommendations) else None
+
+        return page, next_cursor
+
+# the backends implement get/put/invalidate/dismiss, one missing fails when it's created
+class RecommendationCache(ABC):
+    def __init__(self, ttl_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+
+        # metrics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.dismissals = 0
+        self.errors = 0
+
+    # the cached feed (None on a miss) and the generation to store a fresh feed with
+    @abstractmethod
+    async def get(self, user_id: str, version: str) -> Tuple[Optional[RecommendationFeed], int]:
+        ...
+
+    @abstractmethod
+    async def put(self, user_id: str, version: str, generation: int, recommendations: List[Dict[str, Any]]) -> None:
+        ...
+
+    @abstractmethod
+    async def invalidate(self, user_id: str) -> None:
+        ...
+
+    # hides movie_id from the user's feed without dropping it
+    @abstractmethod
+    async def dismiss(self, user_id: str, movie_id: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = max(self.hits + self.misses, 1)
+
+        return {
+            "backend": type(self).__name__,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "dismissals": self.dismissals,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4),
+        }
+
+# the generation is a clock shared by every user that invalidate() and dismiss() advance, the
+# users' last changes are kept in an LRU as long as the entries. a feed is stored only when the
+# user didn't change after its get(), once a change falls out of the LRU every feed read
+# before it is turned away instead. a dismissal updates the stored feed in place and, through
+# the clock, keeps a feed ranked before it from replacing it
+class InMemoryRecommendationCache(RecommendationCache):
+    def __init__(self, max_size: int, ttl_seconds: int) -> None:
+        super().__init__(ttl_seconds)
+        self.max_size = max_size
+        # user_id -> (version, expires_at, feed)
+        self._entries: OrderedDict[str, Tuple[str, float, RecommendationFeed]] = OrderedDict()
+        self._clock = 0
+        self._changed: OrderedDict[str, int] = OrderedDict()
+        self._forgotten = 0
+
+    async def get(self, user_id: str, version: str) -> Tuple[Optional[RecommendationFeed], int]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry_version, expires_at, feed = entry
+            if entry_version == version and expires_at > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return feed, self._clock
+            del self._entries[user_id]
+
+        self.misses += 1
+        return None, self._clock
+
+    async def put(self, user_id: str, version: str, generation: int, recommendations: List[Dict[str, Any]]) -> None:
+        if self._forgotten > generation or self._changed.get(user_id, 0) > generation:
+            return
+
+        self._entries[user_id] = (version, time.monotonic() + self.ttl_seconds, RecommendationFeed(recommendations))
+        self._entries.move_to_end(user_id)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _advance(self, user_id: str) -> None:
+        self._clock += 1
+        self._changed[user_id] = self._clock
+        self._changed.move_to_end(user_id)
+        while len(self._changed) > self.max_size:
+            _, clock = self._changed.popitem(last=False)
+            self._forgotten = clock
+
+    async def invalidate(self, user_id: str) -> None:
+        self._entries.pop(user_id, None)
+        self._advance(user_id)
+        self.invalidations += 1
+
+    async def dismiss(self, user_id: str, movie_id: str) -> None:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry[2].dismissed.add(movie_id)
+        self._advance(user_id)
+        self.dismissals += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "size": len(self._entries), "max_size": self.max_size}
+
+# the feed is json under recs:{user_id}, the generation a counter under recs:gen:{user_id} and
+# the dismissed movies a set under recs:dismissed:{user_id} that outlives the feeds stored
+# while it grows, all three are read in one round trip. a failing redis is logged and treated
+# as a miss so the route still answers from the database
+class RedisRecommendationCache(RecommendationCache):
+    def __init__(self, client, ttl_seconds: int, key_prefix: str = "recs") -> None:
+        super().__init__(ttl_seconds)
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def _entry_key(self, user_id: str) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    def _generation_key(self, user_id: str) -> str:
+        return f"{self.key_prefix}:gen:{user_id}"
+
+    def _dismissed_key(self, user_id: str) -> str:
+        return f"{self.key_prefix}:dismissed:{user_id}"
+
+    async def get(self, user_id: str, version: str) -> Tuple[Optional[RecommendationFeed], int]:
+        try:
+            async with self.client.pipeline(transaction=False) as pipeline:
+                pipeline.get(self._entry_key(user_id))
+                pipeline.get(self._generation_key(user_id))
+                pipeline.smembers(self._dismissed_key(user_id))
+                entry, generation, dismissed = await pipeline.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Recommendation cache read failed, computing recommendations: {e}")
+            # -1 never matches a stored generation so nothing is cached from this request
+            return None, -1
+
+        generation = int(generation or 0)
+        if entry is not None:
+            entry = json.loads(entry)
+            if entry["version"] == version and entry["generation"] == generation:
+                self.hits += 1
+                return RecommendationFeed(entry["recommendations"], {movie_id.decode() for movie_id in dismissed}), generation
+
+        self.misses += 1
+        return None, generation
+
+    async def put(self, user_id: str, version: str, generation: int, recommendations: List[Dict[str, Any]]) -> None:
+        if generation < 0:
+            return
+
+        entry = json.dumps({
+            "version": version,
+            "generation": generation,
+            "recommendations": jsonable_encoder(recommendations),
+        })
+
+        try:
+            # the generation is checked on read, an entry written after an invalidation
+            # carries the old generation and is never served
+            await self.client.set(self._entry_key(user_id), entry, ex=self.ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Recommendation cache write failed: {e}")
+
+    async def invalidate(self, user_id: str) -> None:
+        try:
+            # the generation outlives the entries so an entry can't be stored under a reused one
+            async with self.client.pipeline(transaction=True) as pipeline:
+                pipeline.incr(self._generation_key(user_id))
+                pipeline.expire(self._generation_key(user_id), self.ttl_seconds * 2)
+                pipeline.delete(self._entry_key(user_id), self._dismissed_key(user_id))
+                await pipeline.execute()
+        except Exception as e:
+            # the change is already committed, the cached entry expires with the ttl
+            self.errors += 1
+            logger.error(f"Recommendation cache invalidation failed for user {user_id}: {e}")
+            return
+
+        self.invalidations += 1
+
+    async def dismiss(self, user_id: str, movie_id: str) -> None:
+        try:
+            # also filters a feed ranked before the dismissal that is stored after it
+            async with self.client.pipeline(transaction=True) as pipeline:
+                pipeline.sadd(self._dismissed_key(user_id), movie_id)
+                pipeline.expire(self._dismissed_key(user_id), self.ttl_seconds * 2)
+                await pipeline.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Recommendation cache dismissal failed for user {user_id}: {e}")
+            return
+
+        self.dismissals += 1
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+# cache from the settings, None when it is turned off
+def create_recommendation_cache() -> Optional[RecommendationCache]:
+    if settings.recommendation_cache_backend == "none":
+        return None
+
+    if settings.recommendation_cache_backend == "redis":
+        if not settings.redis_url:
+            raise ValueError("RECOMMENDATION_CACHE_BACKEND=redis needs REDIS_URL")
+
+        # optional dependency, only imported when the redis backend is configured
+        import redis.asyncio as redis
+
+        client = redis.Redis.from_url(settings.redis_url, socket_timeout=settings.redis_timeout_seconds)
+        return RedisRecommendationCache(client, settings.recommendation_cache_ttl_seconds)
+
+    return InMemoryRecommendationCache(settings.recommendation_cache_size, settings.recommendation_cache_ttl_seconds)
+
+# drops the user's cached recommendations after a change to their ratings, watchlist or
+# genres. the change is committed first, a request that reads the user after the
+# invalidation sees it and a request that read them before can't store its result anymore
+async def invalidate_recommendations(session: AsyncSession, cache: Optional[RecommendationCache], user_id: str) -> None:
+    if cache is None:
+        return
+
+    await session.commit()
+    await cache.invalidate(user_id)
+
+# hides a dismissed movie from the user's cached feed, committed first like an invalidation
+async def dismiss_recommendation(session: AsyncSession, cache: Optional[RecommendationCache], user_id: str, movie_id: str) -> None:
+    if cache is None:
+        return
+
+    await session.commit()
+    await cache.dismiss(user_id, movie_id)
@@ -0,0 +1,88 @@
+# startup of the model dependent app state, split out of the lifespan so it can run either
+# before the app accepts traffic or in the background while the database only routes are
+# already served (settings.lazy_model_loading). every phase is timed and logged so the ECS
+# cold start time can be tracked, /api/ready reports the same timings
+import asyncio
+import time
+from contextlib import contextmanager
+from fastapi import FastAPI
+from typing import Dict, List, Optional
+from utils.env_config import settings
+from utils.download_model_files import download_recommendation_model_files
+from utils.candidate_engine_loader import load_candidate_engine, refresh_candidate_engine
+from utils.cold_start_index_loader import load_cold_start_index, refresh_cold_start_index
+from utils.model_registry import ModelRegistry, load_model_set, refresh_models
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StartupState:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+        # refresh loops started once the models are loaded, cancelled on shutdown
+        self.background_tasks: List[asyncio.Task] = []
+
+    # times a startup phase, phases running in parallel threads each get their own entry
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.phases[name] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"Startup phase {name} took {self.phases[name]:.0f} ms")
+
+    def mark_ready(self) -> None:
+        self.phases["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        self.ready = True
+        logger.info(f"Startup complete in {self.phases['total']:.0f} ms: {self.phases}")
+
+    def status(self) -> dict:
+        return {
+            "status": "ready" if self.ready else ("failed" if self.error else "loading"),
+            "phases": self.phases,
+            "error": self.error,
+        }
+
+# downloads the model files and loads the first version of every model into app.state
+async def load_models(app: FastAPI) -> None:
+    startup: StartupState = app.state.startup
+
+    with startup.phase("download"):
+        await asyncio.to_thread(download_recommendation_model_files)
+
+    app.state.models = await load_model_set(app, 1, startup.phase)
+    app.state.model_registry = ModelRegistry(app)
+    logger.info("Models loaded successfully")
+
+    # optional in memory candidate engine, requests fall back to sql while it is None
+    if settings.candidate_engine_enabled:
+        with startup.phase("candidate_engine"):
+            app.state.candidate_engine = await load_candidate_engine()
+        startup.background_tasks.append(asyncio.create_task(refresh_candidate_engine(app)))
+
+    # precomputed cold start recommendations, cold start requests use the hnsw query while it
+    # is None so a failed build doesn't keep the api from starting
+    if settings.cold_start_index_enabled:
+        with startup.phase("cold_start_index"):
+            try:
+                app.state.cold_start_index = await load_cold_start_index(app.state.models.cold_start_user_tower)
+            except Exception as e:
+                logger.error(f"Failed to build cold start index, using the database query: {e}")
+        startup.background_tasks.append(asyncio.create_task(refresh_cold_start_index(app)))
+
+    # poll s3 for new model versions and swap them in without a restart
+    if settings.model_reload_poll_seconds > 0:
+        startup.background_tasks.append(asyncio.create_task(refresh_models(app)))
+
+    startup.mark_ready()
+
+# background version for lazy model loading, a failure is reported by /api/ready instead of
+# stopping the app since the database only routes are already being served
+async def load_models_in_background(app: FastAPI) -> None:
+    try:
+        await load_models(app)
+    except Exception as e:
+        app.state.startup.error = str(e)
+        logger.error(f"❌ Failed to load models: {e}")
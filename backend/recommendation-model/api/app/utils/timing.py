@@ -0,0 +1,141 @@
+# per request stage timing, records how long each stage of a request took and how many
+# statements (database round trips) it sent so slow requests can be broken down in the logs
+#
+# spans are the named blocks inside a stage (a query helper, a model call, serialization),
+# every span is observed in the cinesense_stage_duration_seconds histogram and added to the
+# RequestTrace of the request running it, which middleware/metrics.py sends back as a
+# Server-Timing header when asked to
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+from utils.metrics import STAGE_ERRORS, STAGE_SECONDS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# timer of the request currently running on this task, picked up by the engine event
+# listener in db/config/conn.py to count round trips
+_current_timer: ContextVar[Optional["StageTimer"]] = ContextVar("current_stage_timer", default=None)
+
+# spans of the request currently running on this task, set by the metrics middleware and
+# carried to the inference threads by InferenceExecutor
+_current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_request_trace", default=None)
+
+# total time per span name of one request, spans also end on the inference threads
+# so additions are locked
+class RequestTrace:
+    def __init__(self) -> None:
+        self.spans: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    # Server-Timing header value, e.g. db.get_recommendation_context;dur=2.41, metric names
+    # are http tokens so the span names only use letters, digits, dots and underscores
+    def server_timing(self, total_ms: Optional[float] = None) -> str:
+        with self._lock:
+            entries = [f"{name};dur={ms:.2f}" for name, ms in self.spans.items()]
+        if total_ms is not None:
+            entries.append(f"total;dur={total_ms:.2f}")
+
+        return ", ".join(entries)
+
+@contextmanager
+def request_trace() -> Iterator[RequestTrace]:
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def _observe(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, name)
+    trace = _current_trace.get()
+    if trace:
+        trace.add(name, seconds * 1000)
+
+# times a block as a named span. a class rather than a @contextmanager generator, it wraps
+# every query helper and model call so the generator's overhead would add up
+class span:
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        if exc_type is not None and issubclass(exc_type, Exception):
+            STAGE_ERRORS.inc(self.name)
+        _observe(self.name, time.perf_counter() - self._start)
+        return False
+
+# times every call of a sync or async function as a span, e.g. @traced("db.get_user_watchlist")
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+class StageTimer:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.stages: Dict[str, float] = {}
+        self.round_trips = 0
+        self._start = time.perf_counter()
+        self._token = _current_timer.set(self)
+
+    # times a block, repeated stage names are added together. stages are spans as well so
+    # they also show up in the histograms and the Server-Timing header
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            with span(name):
+                yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    # logs the stage breakdown and stops counting round trips for this request
+    def finish(self) -> None:
+        _current_timer.reset(self._token)
+
+        stages = " ".join(f"{name}={ms:.1f}ms" for name, ms in self.stages.items())
+        logger.info(f"{self.name} total={self.total_ms():.1f}ms round_trips={self.round_trips} {stages}")
+
+# called for every statement sent to the database
+def record_round_trip() -> None:
+    timer = _current_timer.get()
+    if timer:
+        timer.round_trips += 1
+
+# adds time spent outside a stage block (e.g. waiting for a pooled connection) to the
+# request's StageTimer, if one is running, and to the span histograms
+def record_stage(name: str, ms: float) -> None:
+    _observe(name, ms / 1000)
+
+    timer = _current_timer.get()
+    if timer:
+        timer.stages[name] = timer.stages.get(name, 0.0) + ms
@@ -0,0 +1,62 @@
+# in process cache for the amount of users with at least one positive rating, the
+# recommendation route only compares it against the cold start threshold so it doesn't need
+# to be exact, refreshed in the background instead of running COUNT(DISTINCT) per request
+import asyncio
+import time
+from typing import Optional
+from fastapi import FastAPI
+from db.config.conn import async_session
+from db.utils.user_sql_queries import get_user_with_ratings_count
+import logging
+
+logger = logging.getLogger(__name__)
+
+class UserCountCache:
+    def __init__(self, ttl_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.count: Optional[int] = None
+        self.refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def is_expired(self) -> bool:
+        return self.count is None or time.monotonic() - self.refreshed_at > self.ttl_seconds
+
+    async def refresh(self) -> int:
+        async with async_session() as session:
+            count = await get_user_with_ratings_count(session)
+
+        self.count = count
+        self.refreshed_at = time.monotonic()
+
+        return count
+
+    # returns the cached count, only queries the database when the background refresh
+    # hasn't kept the value fresh (or on the first call), one request refreshes at a time
+    async def get(self) -> int:
+        if not self.is_expired():
+            return self.count
+
+        async with self._lock:
+            if self.is_expired():
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    # serve the previous count rather than failing the request
+                    if self.count is None:
+                        raise
+                    logger.error(f"Failed to refresh user count, using cached value: {e}")
+
+        return self.count
+
+# count the users right away, then refresh the cached count before it expires so requests
+# never wait on the count query. a failed count is logged and retried on the next round
+async def refresh_user_count(app: FastAPI) -> None:
+    cache: UserCountCache = app.state.user_count_cache
+
+    while True:
+        try:
+            await cache.refresh()
+        except Exception as e:
+            logger.error(f"Failed to refresh user count: {e}")
+
+        await asyncio.sleep(max(cache.ttl_seconds / 2, 1))
@@ -0,0 +1,135 @@
+# Benchmark for the in memory CandidateEngine, times candidate generation (top 50 similar
+# users -> 300 most frequent unseen movies) against a plain python version of the sql path
+# and the cost of the incremental updates applied by the rating routes
+#
+# pass --db to also time the sql path (similar users + candidate movies query) against the
+# database configured in the environment, using real user ids from user_embeddings
+#
+# run from the api/ directory:
+#   uv run python benchmarks/candidate_engine_benchmark.py [--db]
+import sys
+import time
+import asyncio
+import numpy as np
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.candidate_engine import CandidateEngine  # noqa: E402
+
+NUM_USERS = [1_000, 10_000, 50_000]
+NUM_MOVIES = 20_000
+RATINGS_PER_USER = 60
+EMBEDDING_DIM = 512
+SIMILAR_USERS = 50
+CANDIDATES = 300
+REPEATS = 20
+
+def time_ms(fn, repeats: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+def make_rows(rng: np.random.Generator, num_users: int):
+    embeddings = rng.standard_normal((num_users, EMBEDDING_DIM)).astype(np.float32)
+    user_embedding_rows = [(f"u{i}", embeddings[i]) for i in range(num_users)]
+
+    # skewed popularity so neighbour movie counts have real ties and repeats
+    popularity = 1 / np.arange(1, NUM_MOVIES + 1)
+    popularity /= popularity.sum()
+    rating_rows = [
+        (f"u{i}", f"m{movie}")
+        for i in range(num_users)
+        for movie in rng.choice(NUM_MOVIES, size=RATINGS_PER_USER, replace=False, p=popularity)
+    ]
+
+    return user_embedding_rows, rating_rows
+
+# python version of the sql path: cosine top k users, then count their rated movies
+def reference_candidates(user_embedding_rows, ratings_by_user, user_id, exclude):
+    user_ids = [row[0] for row in user_embedding_rows]
+    embeddings = np.stack([row[1] for row in user_embedding_rows])
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    user_idx = user_ids.index(user_id)
+    similarities = embeddings @ embeddings[user_idx]
+    similarities[user_idx] = -np.inf
+    similar = np.argsort(-similarities)[:SIMILAR_USERS]
+
+    counts = Counter(movie for i in similar for movie in ratings_by_user[user_ids[i]] if movie not in exclude)
+
+    return counts.most_common(CANDIDATES)
+
+async def time_sql_path(repeats: int):
+    from db.config.conn import async_session
+    from db.utils.user_sql_queries import get_all_user_embeddings, get_all_positive_ratings
+    from db.utils.movies_sql_queries import get_candidate_movies_metadata
+    from db.utils.recommendation_sql_queries import get_collaborative_candidates
+
+    async with async_session() as session:
+        user_embedding_rows = await get_all_user_embeddings(session)
+        rating_rows = await get_all_positive_ratings(session)
+        engine = CandidateEngine.build(user_embedding_rows, rating_rows)
+        user_ids = [row[0] for row in user_embedding_rows][:repeats]
+
+        sql_timings, engine_timings = [], []
+        for user_id in user_ids:
+            start = time.perf_counter()
+            await get_collaborative_candidates(session, user_id, [], SIMILAR_USERS, CANDIDATES)
+            sql_timings.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            movie_ids = engine.candidate_movie_ids(user_id, [], SIMILAR_USERS, CANDIDATES)
+            await get_candidate_movies_metadata(session, movie_ids)
+            engine_timings.append((time.perf_counter() - start) * 1000)
+
+    print(f"\ndatabase: {len(user_embedding_rows)} users, {len(rating_rows)} positive ratings")
+    print(f"  sql path    p50 {np.median(sql_timings):8.2f} ms | p99 {np.percentile(sql_timings, 99):8.2f} ms")
+    print(f"  engine path p50 {np.median(engine_timings):8.2f} ms | p99 {np.percentile(engine_timings, 99):8.2f} ms")
+
+def main():
+    rng = np.random.default_rng(42)
+
+    print(f"{'users':>7} | {'build s':>7} | {'query p50 ms':>12} | {'query p99 ms':>12} | {'update us':>9}")
+    print("-" * 62)
+
+    for num_users in NUM_USERS:
+        user_embedding_rows, rating_rows = make_rows(rng, num_users)
+
+        start = time.perf_counter()
+        engine = CandidateEngine.build(user_embedding_rows, rating_rows)
+        build_s = time.perf_counter() - start
+
+        # the engine has to pick the same movie frequencies as the sql path, ties can come back
+        # in a different order so only the counts are compared
+        ratings_by_user = {}
+        for user_id, movie_id in rating_rows:
+            ratings_by_user.setdefault(user_id, []).append(movie_id)
+        exclude = set(ratings_by_user["u0"])
+        reference = reference_candidates(user_embedding_rows, ratings_by_user, "u0", exclude)
+        engine_ids = engine.candidate_movie_ids("u0", list(exclude), SIMILAR_USERS, CANDIDATES)
+        engine_counts = Counter(movie for uid, _ in engine.similar_users("u0", SIMILAR_USERS) for movie in ratings_by_user[uid])
+        assert [count for _, count in reference] == [engine_counts[movie_id] for movie_id in engine_ids], "candidate frequencies differ"
+
+        user_ids = rng.choice(num_users, size=REPEATS)
+        query_iter = iter(user_ids.tolist() * 2)
+        query_p50, query_p99 = time_ms(lambda: engine.candidate_movie_ids(f"u{next(query_iter)}", [], SIMILAR_USERS, CANDIDATES), REPEATS)
+
+        update_count = 1000
+        start = time.perf_counter()
+        for i in range(update_count):
+            engine.add_rating(f"u{i % num_users}", f"m{rng.integers(NUM_MOVIES)}")
+        update_us = (time.perf_counter() - start) * 1e6 / update_count
+
+        print(f"{num_users:>7} | {build_s:>7.2f} | {query_p50:>12.2f} | {query_p99:>12.2f} | {update_us:>9.1f}")
+
+    if "--db" in sys.argv:
+        asyncio.run(time_sql_path(REPEATS))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Benchmark for the precomputed ColdStartIndex, compares the cold start hnsw query
+# (get_cold_start_recommendations, genre filtered hnsw scan + ORDER BY RANDOM() over the
+# catalogue) against the index lookup + one metadata query by id, for cold start users with
+# random genre triples
+#
+# also reports the build time on a synthetic catalogue and the overlap of the hnsw query's
+# genre matched movies with the exact ranking from the index, the genre filter is applied
+# after the hnsw scan so the query can come back with fewer movies than asked for
+#
+# uses the user tower and genre mlb from the settings (LOCAL_MODEL_DIR in .env) and the
+# database configured in the environment, the throwaway users are rolled back at the end
+#
+# run from the api/ directory:
+#   uv run python benchmarks/cold_start_index_benchmark.py
+import sys
+import time
+import asyncio
+import numpy as np
+from pathlib import Path
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from db.config.conn import async_session, engine  # noqa: E402
+from db.utils.movies_sql_queries import get_cold_start_recommendations, get_cold_start_movies_metadata  # noqa: E402
+from db.utils.user_sql_queries import new_user_genre_embedding  # noqa: E402
+from model.utils.cold_start_index import ColdStartIndex  # noqa: E402
+from model.utils.cold_start_user_tower import ColdStartUserTower  # noqa: E402
+from utils.cold_start_index_loader import load_cold_start_index  # noqa: E402
+from utils.load_model_files import load_recommendation_models  # noqa: E402
+
+USERS = 50
+SYNTHETIC_MOVIES = [10_000, 50_000]
+
+def percentiles(timings) -> str:
+    return f"p50 {np.median(timings):8.2f} ms | p99 {np.percentile(timings, 99):8.2f} ms"
+
+def synthetic_build(user_tower: ColdStartUserTower, num_movies: int) -> float:
+    rng = np.random.default_rng(42)
+    genres = list(user_tower.genre_mlb.classes_)
+    embeddings = rng.standard_normal((num_movies, user_tower.embedding_dim)).astype(np.float32)
+    movie_rows = [
+        (f"m{i}", list(rng.choice(genres, size=int(rng.integers(1, 4)), replace=False)), embeddings[i])
+        for i in range(num_movies)
+    ]
+
+    start = time.perf_counter()
+    ColdStartIndex.build(movie_rows, genres, *user_tower.precomputed_embeddings(3))
+
+    return time.perf_counter() - start
+
+async def main():
+    user_tower_path, _, genre_mlb, _ = load_recommendation_models()
+    user_tower = ColdStartUserTower(user_tower_path, genre_mlb)
+    rng = np.random.default_rng(42)
+
+    for num_movies in SYNTHETIC_MOVIES:
+        print(f"build on {num_movies} synthetic movies: {synthetic_build(user_tower, num_movies):.2f}s")
+
+    cold_start_index = await load_cold_start_index(user_tower)
+
+    async with async_session() as session:
+        user_ids, user_genres = [], []
+        for i in range(USERS):
+            user_id = f"benchmark_cold_start_{i}"
+            genres = list(rng.choice(genre_mlb.classes_, size=3, replace=False))
+            await session.execute(text("""
+                INSERT INTO user_login (user_id, username, email, password)
+                VALUES (:user_id, :user_id, :user_id, '')
+            """), {"user_id": user_id})
+            await new_user_genre_embedding(session, user_id, user_tower.embedding(genres), genres)
+            user_ids.append(user_id)
+            user_genres.append(genres)
+
+        sql_timings, index_timings, overlaps, sql_counts = [], [], [], []
+        for user_id, genres in zip(user_ids, user_genres):
+            genre_embedding = user_tower.embedding(genres)
+
+            start = time.perf_counter()
+            sql_movies = await get_cold_start_recommendations(session, user_id, genre_embedding, genres)
+            sql_timings.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            movie_ids = cold_start_index.recommendations(genres, genre_embedding, set())
+            assert movie_ids is not None, "index couldn't answer for a fresh cold start user"
+            index_movies = await get_cold_start_movies_metadata(session, movie_ids)
+            index_timings.append((time.perf_counter() - start) * 1000)
+
+            assert [movie["movie_id"] for movie in index_movies] == movie_ids
+            sql_counts.append(len(sql_movies))
+            sql_matched = {movie["movie_id"] for movie in sql_movies if set(movie["genres"]) & set(genres)}
+            overlaps.append(len(sql_matched & set(movie_ids[:8])) / 8)
+
+        await session.rollback()
+
+    await engine.dispose()
+
+    print(f"\n{USERS} cold start users")
+    print(f"  hnsw query    {percentiles(sql_timings)}")
+    print(f"  index lookup  {percentiles(index_timings)}")
+    print(f"  hnsw genre matches found in the exact top 8: {np.mean(overlaps):.1%}")
+    print(f"  movies returned by the hnsw query: avg {np.mean(sql_counts):.1f} of 10, the index always returns 10")
+
+if __name__ == "__main__":
+    engine.echo = False
+    asyncio.run(main())
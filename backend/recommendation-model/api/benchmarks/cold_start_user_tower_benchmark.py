@@ -0,0 +1,56 @@
+# Benchmark for the precomputed ColdStartUserTower embeddings, times building the table of
+# every genre selection at startup and a signup embedding as a table lookup against the
+# mlb transform + forward pass it used to run per call, and checks every row of the table
+# against the forward pass
+#
+# uses the user tower and genre mlb from the settings (LOCAL_MODEL_DIR in .env)
+#
+# run from the api/ directory:
+#   uv run python benchmarks/cold_start_user_tower_benchmark.py
+import sys
+import time
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.cold_start_user_tower import ColdStartUserTower  # noqa: E402
+from utils.load_model_files import load_recommendation_models  # noqa: E402
+
+REPEATS = 2000
+
+def time_us(fn, inputs) -> tuple[float, float]:
+    timings = []
+    for genres in inputs:
+        start = time.perf_counter()
+        fn(genres)
+        timings.append((time.perf_counter() - start) * 1e6)
+
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+def main():
+    user_tower_path, _, genre_mlb, _ = load_recommendation_models()
+
+    start = time.perf_counter()
+    user_tower = ColdStartUserTower(user_tower_path, genre_mlb)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # every precomputed row has to match the per call forward pass
+    keys = list(user_tower.genre_set_index)
+    forward = np.concatenate([user_tower._forward([list(key)]) for key in keys])
+    assert np.allclose(forward, user_tower.genre_set_embeddings, atol=1e-6), "precomputed embeddings differ from the forward pass"
+
+    rng = np.random.default_rng(42)
+    signups = [list(rng.permutation(list(keys[i]))) for i in rng.choice(len(keys), size=REPEATS)]
+
+    forward_p50, forward_p99 = time_us(lambda genres: user_tower._forward([genres])[0], signups)
+    lookup_p50, lookup_p99 = time_us(user_tower.embedding, signups)
+
+    print(f"{len(keys)} genre selections precomputed, tower load + table {build_ms:.1f} ms, {user_tower.genre_set_embeddings.nbytes / 1e6:.1f} MB")
+    print(f"{'signup':>8} | {'p50 us':>8} | {'p99 us':>8}")
+    print("-" * 30)
+    print(f"{'forward':>8} | {forward_p50:>8.1f} | {forward_p99:>8.1f}")
+    print(f"{'lookup':>8} | {lookup_p50:>8.1f} | {lookup_p99:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Load test for the database engine settings, concurrent clients run the database part of a
+# personalized recommendation (get_recommendation_context + get_collaborative_candidates, the
+# reranker is left out) against the database configured in the environment, once for every
+# engine configuration, and report throughput, request latency and the pool checkout waits
+#
+# "before" is how db/config/conn.py used to create the engine (echo on, sqlalchemy's default
+# pool of 5 + 10 overflow), the other rows change one setting at a time starting from the
+# current defaults in utils/env_config.py. the echo output is formatted as it would be but
+# written to /dev/null
+#
+# run from the api/ directory:
+#   uv run python benchmarks/db_pool_load_benchmark.py [--clients 32] [--seconds 10] [--light]
+import os
+import sys
+import time
+import asyncio
+import logging
+import numpy as np
+from pathlib import Path
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from db.config.conn import create_engine  # noqa: E402
+from db.utils.recommendation_sql_queries import get_recommendation_context, get_collaborative_candidates  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+
+USERS = 50
+# only the context query, the hnsw candidate query is mostly database cpu and hides the
+# engine's own overhead
+LIGHT = "--light" in sys.argv
+CONFIGS = [
+    ("before", {"echo": True, "pool_size": 5, "max_overflow": 10, "pool_pre_ping": True, "statement_cache_size": 100}),
+    ("current", {}),
+    ("echo on", {"echo": True}),
+    ("no pre ping", {"pool_pre_ping": False}),
+    ("no stmt cache", {"statement_cache_size": 0}),
+    ("pool 5 + 0", {"pool_size": 5, "max_overflow": 0}),
+]
+
+async def recommendation_queries(session: AsyncSession, user_id: str) -> None:
+    context = await get_recommendation_context(session, user_id)
+    if LIGHT:
+        return
+
+    excluded_movie_ids = list(context.rated_movie_ids) + list(context.not_seen_movie_ids)
+    await get_collaborative_candidates(session, user_id, excluded_movie_ids, similar_user_count=50, limit=300)
+
+async def load(overrides: dict, user_ids, clients: int, seconds: float):
+    engine = create_engine(**overrides)
+    # echo logs to stdout, keep the formatting cost but not the output
+    for handler in logging.getLogger("sqlalchemy.engine.Engine").handlers:
+        handler.setStream(open(os.devnull, "w"))
+    session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    # open the connections up front so every configuration starts with a warm pool
+    async def warm_up(user_id):
+        async with session_factory() as session:
+            await recommendation_queries(session, user_id)
+    await asyncio.gather(*(warm_up(user_ids[i % len(user_ids)]) for i in range(clients)))
+
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(offset: int):
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            async with session_factory() as session:
+                await recommendation_queries(session, user_ids[i % len(user_ids)])
+            latencies.append((time.perf_counter() - start) * 1000)
+            i += clients
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(offset) for offset in range(clients)))
+    elapsed = time.perf_counter() - start
+
+    pool_stats = engine.pool.stats()
+    await engine.dispose()
+
+    return len(latencies) / elapsed, np.array(latencies), pool_stats
+
+async def main():
+    clients = int(sys.argv[sys.argv.index("--clients") + 1]) if "--clients" in sys.argv else 32
+    seconds = float(sys.argv[sys.argv.index("--seconds") + 1]) if "--seconds" in sys.argv else 10.0
+
+    engine = create_engine()
+    async with engine.connect() as conn:
+        result = await conn.execute(text("""
+            SELECT user_id
+            FROM user_watchlist
+            WHERE user_rating > 0
+            GROUP BY user_id
+            HAVING COUNT(*) >= 10
+            LIMIT :limit
+        """), {"limit": USERS})
+        user_ids = [row.user_id for row in result]
+    await engine.dispose()
+
+    workload = "context query" if LIGHT else "context + candidate queries"
+    print(f"{clients} clients for {seconds:.0f}s per configuration, {len(user_ids)} users, {workload}")
+    print(f"current defaults: pool {settings.db_pool_size} + {settings.db_max_overflow}, pre ping {settings.db_pool_pre_ping}, statement cache {settings.db_statement_cache_size}\n")
+    print(f"{'config':>14} | {'req/s':>7} | {'p50 ms':>7} | {'p99 ms':>7} | {'wait p50':>8} | {'wait p99':>8}")
+    print("-" * 68)
+    for name, overrides in CONFIGS:
+        throughput, latencies, pool_stats = await load(overrides, user_ids, clients, seconds)
+        print(
+            f"{name:>14} | {throughput:>7.0f} | {np.percentile(latencies, 50):>7.2f} | {np.percentile(latencies, 99):>7.2f} | "
+            f"{pool_stats['p50_wait_ms']:>8.3f} | {pool_stats['p99_wait_ms']:>8.3f}"
+        )
+    print("\nwait = pool checkout wait of the last 1000 checkouts")
+
+if __name__ == "__main__":
+    asyncio.run(main())
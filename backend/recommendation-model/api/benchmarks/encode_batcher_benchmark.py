@@ -0,0 +1,104 @@
+# Benchmark for the EncodeBatcher, fires single movie embedding requests (what
+# POST /movie/rate/{imdb_id} does per call) at different concurrency levels and compares
+# every request encoding its own sentences on the inference executor against the requests
+# sharing batched encodes through the EncodeBatcher
+#
+# uses the sentence transformer and movie tower files from the settings (HF_MODEL_NAME and
+# LOCAL_MODEL_DIR in .env), no database needed
+#
+# run from the api/ directory:
+#   uv run python benchmarks/encode_batcher_benchmark.py
+import sys
+import time
+import asyncio
+import joblib
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.movie_tower import MovieTower  # noqa: E402
+from routes.movies import _generate_movie_embeddings  # noqa: E402
+from utils.encode_batcher import EncodeBatcher  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+from utils.inference_executor import InferenceExecutor  # noqa: E402
+from utils.load_model_files import load_sentence_transformer_model  # noqa: E402
+
+CONCURRENCY = [1, 8, 32, 64]
+REQUESTS = 256
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Romance", "Thriller", "Animation", "Crime", "Fantasy"]
+WORDS = "the a of and to in lost city night last love war story secret house dark river king journey".split()
+
+def make_movies(rng: np.random.Generator, count: int) -> list:
+    return [
+        {
+            "title": " ".join(rng.choice(WORDS, size=int(rng.integers(1, 6)))).title(),
+            "genres": list(rng.choice(GENRES, size=int(rng.integers(1, 4)), replace=False)),
+            "year": int(rng.integers(1950, 2025)),
+            "actors": [f"Actor {a}" for a in rng.integers(0, 500, size=5)],
+            "director": [f"Director {rng.integers(0, 100)}"],
+            "overview": " ".join(rng.choice(WORDS, size=int(rng.integers(20, 80)))),
+        }
+        for _ in range(count)
+    ]
+
+async def batched_embedding(movie_tower: MovieTower, encode_batcher: EncodeBatcher, movie: dict):
+    return (await _generate_movie_embeddings(movie_tower, encode_batcher, [movie]))[0]
+
+async def fire(embed, movies: list, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def request(movie):
+        async with semaphore:
+            start = time.perf_counter()
+            embedding = await embed(movie)
+            latencies.append((time.perf_counter() - start) * 1000)
+            return embedding
+
+    start = time.perf_counter()
+    embeddings = await asyncio.gather(*[request(movie) for movie in movies])
+    elapsed = time.perf_counter() - start
+
+    return np.stack(embeddings), len(movies) / elapsed, float(np.median(latencies)), float(np.percentile(latencies, 99))
+
+async def main():
+    rng = np.random.default_rng(42)
+    movies = make_movies(rng, REQUESTS)
+
+    movie_tower = MovieTower(
+        settings.movie_tower_model_path,
+        joblib.load(settings.genre_mlb_path),
+        load_sentence_transformer_model()
+    )
+    expected = movie_tower.generate_movie_embeddings_batch(movies)
+
+    print(f"workers: {settings.inference_max_workers}, max wait: {settings.encode_batch_max_wait_ms} ms, max batch: {settings.encode_batch_max_size} sentences")
+    print(f"{'concurrency':>11} | {'mode':>9} | {'movies/s':>8} | {'p50 ms':>8} | {'p99 ms':>8} | batch sizes")
+    print("-" * 90)
+
+    for concurrency in CONCURRENCY:
+        # queue sized so neither mode sheds requests
+        inference_executor = InferenceExecutor(settings.inference_max_workers, REQUESTS)
+        encode_batcher = EncodeBatcher(
+            movie_tower.sentence_transformer_encoder,
+            inference_executor,
+            settings.encode_batch_max_wait_ms,
+            settings.encode_batch_max_size
+        )
+
+        modes = [
+            ("per call", lambda movie: inference_executor.run(movie_tower.generate_new_movie_embedding, **movie)),
+            ("batched", lambda movie: batched_embedding(movie_tower, encode_batcher, movie)),
+        ]
+        for mode, embed in modes:
+            embeddings, throughput, p50, p99 = await fire(embed, movies, concurrency)
+            assert np.allclose(embeddings, expected, atol=1e-4), f"{mode} embeddings differ from the batch method"
+
+            histogram = encode_batcher.stats()["batch_size_histogram"] if mode == "batched" else ""
+            print(f"{concurrency:>11} | {mode:>9} | {throughput:>8.1f} | {p50:>8.2f} | {p99:>8.2f} | {histogram}")
+
+        inference_executor.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+# Concurrency benchmark for the InferenceExecutor, measures the latency of the light endpoints
+# (/api/health and the watchlist read) while batches of movie embeddings are generated
+# through POST /api/movie/rate/batch, with the model calls inline on the event loop
+# (0 workers, how the routes used to run them) and on the inference thread pool
+#
+# requests go through the real app over an in process ASGI transport, the lifespan isn't run
+# so the models are loaded here and every request's database session is rolled back
+#
+# uses the sentence transformer and movie tower files from the settings (HF_MODEL_NAME and
+# LOCAL_MODEL_DIR in .env) and a user with ratings from the database in the environment
+#
+# run from the api/ directory:
+#   uv run python benchmarks/inference_concurrency_benchmark.py [--workers 2]
+import sys
+import time
+import asyncio
+import httpx
+import numpy as np
+from contextlib import nullcontext
+from pathlib import Path
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from main import app  # noqa: E402
+from db.config.conn import async_session, engine, get_session  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+from utils.inference_executor import InferenceExecutor  # noqa: E402
+from utils.model_registry import load_model_set  # noqa: E402
+
+EMBEDDING_CLIENTS = 4
+MOVIES_PER_BATCH = 32
+LOAD_SECONDS = 10
+POLL_INTERVAL = 0.01
+
+# every request's changes are thrown away so the benchmark leaves the database as it was
+async def rollback_session():
+    async with async_session() as session:
+        try:
+            yield session
+        finally:
+            await session.rollback()
+
+def make_batch(user_id: str, client: int, batch: int) -> dict:
+    return {
+        "user_id": user_id,
+        "movies": [
+            {
+                "imdb_id": f"benchmark_{client}_{batch}_{i}",
+                "title": f"Benchmark Movie {i}",
+                "genres": ["Drama", "Thriller"],
+                "release_date": "2001-01-01",
+                "summary": "a detective returns to the city he grew up in to find a missing friend " * 4,
+                "actors": [f"Actor {a}" for a in range(i, i + 5)],
+                "director": [f"Director {i}"],
+                "language": "en",
+                "poster_path": "",
+                "rating": 4.0,
+                "tmdb_vote_avg": 7.0,
+                "tmdb_vote_count": 100,
+                "tmdb_popularity": 3.0,
+            }
+            for i in range(MOVIES_PER_BATCH)
+        ]
+    }
+
+async def embedding_load(client: httpx.AsyncClient, user_id: str, client_id: int, stop: asyncio.Event) -> int:
+    batches = 0
+    while not stop.is_set():
+        response = await client.post("/api/movie/rate/batch", json=make_batch(user_id, client_id, batches))
+        assert response.status_code in (200, 503), response.text
+        batches += 1
+
+    return batches
+
+# latency is timed from when the request was due, so time spent waiting on a blocked event
+# loop before the request could even be sent is counted too
+async def poll(client: httpx.AsyncClient, path: str, stop: asyncio.Event) -> list:
+    timings = []
+    while not stop.is_set():
+        due = time.perf_counter() + POLL_INTERVAL
+        await asyncio.sleep(POLL_INTERVAL)
+        response = await client.get(path)
+        timings.append((time.perf_counter() - due) * 1000)
+        assert response.status_code == 200, response.text
+
+    return timings
+
+async def run(client: httpx.AsyncClient, user_id: str, light_paths: list, with_load: bool):
+    stop = asyncio.Event()
+    pollers = [asyncio.create_task(poll(client, path, stop)) for path in light_paths]
+    loaders = [asyncio.create_task(embedding_load(client, user_id, i, stop)) for i in range(EMBEDDING_CLIENTS)] if with_load else []
+
+    await asyncio.sleep(LOAD_SECONDS)
+    stop.set()
+
+    return [await task for task in pollers], sum([await task for task in loaders])
+
+async def main():
+    workers = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else settings.inference_max_workers
+
+    # benchmark movie ids are unique so every batch still runs the movie tower
+    app.state.inference_executor = InferenceExecutor(workers, settings.inference_max_queue)
+    app.state.models = await load_model_set(app, 1, lambda name: nullcontext())
+    app.state.candidate_engine = None
+    app.dependency_overrides[get_session] = rollback_session
+
+    async with async_session() as session:
+        user_id = (await session.execute(text("SELECT user_id FROM user_watchlist GROUP BY user_id LIMIT 1"))).scalar()
+    assert user_id, "need a user with a watchlist in the database"
+
+    light_paths = ["/api/health", f"/api/user/watchlist/get/{user_id}"]
+    transport = httpx.ASGITransport(app=app)
+
+    print(f"{EMBEDDING_CLIENTS} clients posting batches of {MOVIES_PER_BATCH} movies for {LOAD_SECONDS}s\n")
+    print(f"{'mode':>14} | {'endpoint':>16} | {'p50 ms':>8} | {'p99 ms':>8} | {'max ms':>8} | {'batches':>7}")
+    print("-" * 76)
+
+    for mode, max_workers, with_load in [("idle", workers, False), ("inline", 0, True), (f"pool x{workers}", workers, True)]:
+        app.state.inference_executor = InferenceExecutor(max_workers, settings.inference_max_queue)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            timings, batches = await run(client, user_id, light_paths, with_load)
+
+        for path, path_timings in zip(["health", "watchlist"], timings):
+            print(f"{mode:>14} | {path:>16} | {np.median(path_timings):>8.2f} | {np.percentile(path_timings, 99):>8.2f} | {max(path_timings):>8.2f} | {batches:>7}")
+
+        stats = app.state.inference_executor.stats()
+        if with_load and max_workers:
+            print(f"{'':>14} | max queue depth {stats['max_queue_depth']}, avg wait {stats['avg_wait_ms']} ms, rejected {stats['rejected']}")
+        app.state.inference_executor.shutdown()
+
+    await engine.dispose()
+
+if __name__ == "__main__":
+    engine.echo = False
+    asyncio.run(main())
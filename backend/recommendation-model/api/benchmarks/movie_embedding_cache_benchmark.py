@@ -0,0 +1,120 @@
+# Benchmark for the MovieEmbeddingCache, times getting the embedding of a rated movie the
+# three ways POST /movie/rate/{imdb_id} can now get it: running the movie tower (new movie),
+# reading the stored embedding (movie already in movie_embedding_personalized_prod) and the
+# in process LRU (movie rated recently), then replays a skewed stream of ratings to show the
+# hit rate for popular movies
+#
+# uses the sentence transformer and movie tower files from the settings (HF_MODEL_NAME and
+# LOCAL_MODEL_DIR in .env) and the movies stored in the database in the environment, nothing
+# is written
+#
+# run from the api/ directory:
+#   uv run python benchmarks/movie_embedding_cache_benchmark.py
+import sys
+import time
+import asyncio
+import joblib
+import numpy as np
+from pathlib import Path
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from db.config.conn import async_session, engine  # noqa: E402
+from model.utils.movie_tower import MovieTower  # noqa: E402
+from routes.movies import _generate_movie_embeddings  # noqa: E402
+from utils.encode_batcher import EncodeBatcher  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+from utils.inference_executor import InferenceExecutor  # noqa: E402
+from utils.load_model_files import load_sentence_transformer_model  # noqa: E402
+from utils.movie_embedding_cache import MovieEmbeddingCache  # noqa: E402
+
+REPEATS = 20
+STREAM_RATINGS = 2000
+
+def tower_input(movie_id: str) -> dict:
+    return {
+        "title": f"Movie {movie_id}",
+        "genres": ["Drama"],
+        "year": 2001,
+        "actors": ["Actor A", "Actor B"],
+        "director": ["Director C"],
+        "overview": "a detective returns to the city he grew up in to find a missing friend",
+    }
+
+async def time_ms(fn) -> tuple[float, float]:
+    timings = []
+    for i in range(REPEATS):
+        start = time.perf_counter()
+        await fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+async def main():
+    movie_tower = MovieTower(
+        settings.movie_tower_model_path,
+        joblib.load(settings.genre_mlb_path),
+        load_sentence_transformer_model()
+    )
+    inference_executor = InferenceExecutor(settings.inference_max_workers, settings.inference_max_queue)
+    encode_batcher = EncodeBatcher(
+        movie_tower.sentence_transformer_encoder,
+        inference_executor,
+        settings.encode_batch_max_wait_ms,
+        settings.encode_batch_max_size
+    )
+
+    def generate(tower_inputs):
+        return _generate_movie_embeddings(movie_tower, encode_batcher, tower_inputs)
+
+    async with async_session() as session:
+        stored_ids = [row.movie_id for row in await session.execute(text("SELECT movie_id FROM movie_embedding_personalized_prod"))]
+        assert len(stored_ids) >= REPEATS, "need stored movie embeddings in the database"
+
+        # every lookup goes to a tier of its own: unknown ids run the tower, stored ids are read
+        # from the table by a cache that has never seen them, and the last cache is warm
+        tower_cache = MovieEmbeddingCache(settings.movie_embedding_cache_size, movie_tower.model_version)
+        db_cache = MovieEmbeddingCache(settings.movie_embedding_cache_size, movie_tower.model_version)
+        memory_cache = MovieEmbeddingCache(settings.movie_embedding_cache_size, movie_tower.model_version)
+        for movie_id in stored_ids[:REPEATS]:
+            await memory_cache.get_or_generate(session, [movie_id], [tower_input(movie_id)], generate)
+
+        tiers = [
+            ("movie tower", tower_cache, lambda i: f"benchmark_unknown_{i}", "misses"),
+            ("database", db_cache, lambda i: stored_ids[i], "db_hits"),
+            ("memory lru", memory_cache, lambda i: stored_ids[i], "memory_hits"),
+        ]
+
+        print(f"{'tier':>12} | {'p50 ms':>8} | {'p99 ms':>8}")
+        print("-" * 34)
+        for name, cache, movie_id_for, counter in tiers:
+            async def lookup(i):
+                movie_id = movie_id_for(i)
+                await cache.get_or_generate(session, [movie_id], [tower_input(movie_id)], generate)
+
+            p50, p99 = await time_ms(lookup)
+            assert cache.stats()[counter] >= REPEATS, f"{name} lookups didn't hit the {counter} tier"
+            print(f"{name:>12} | {p50:>8.3f} | {p99:>8.3f}")
+
+        # zipf-like rating stream over the stored movies plus a share of brand new ones
+        rng = np.random.default_rng(42)
+        popularity = 1 / np.arange(1, len(stored_ids) + 1)
+        popularity /= popularity.sum()
+        stream_cache = MovieEmbeddingCache(settings.movie_embedding_cache_size, movie_tower.model_version)
+
+        start = time.perf_counter()
+        for i in range(STREAM_RATINGS):
+            movie_id = f"benchmark_new_{i}" if rng.random() < 0.05 else stored_ids[rng.choice(len(stored_ids), p=popularity)]
+            await stream_cache.get_or_generate(session, [movie_id], [tower_input(movie_id)], generate)
+        elapsed = time.perf_counter() - start
+
+        print(f"\n{STREAM_RATINGS} skewed ratings in {elapsed:.1f}s: {stream_cache.stats()}")
+        await session.rollback()
+
+    inference_executor.shutdown()
+    await engine.dispose()
+
+if __name__ == "__main__":
+    engine.echo = False
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+# Benchmark for the movie tower backends, compares the eager nn.Linear layers with the single
+# graph head exported by training (TorchScript and ONNX Runtime) and the int8 quantized
+# sentence transformer: cpu latency of the tower layers alone and of the whole embedding
+# (sentence transformer + layers) for one movie and a batch, and the peak RSS of each variant
+#
+# the head is exported from the movie_tower.pth in LOCAL_MODEL_DIR with training's
+# export_movie_tower_head into a temporary directory, every variant runs in its own process so
+# the RSS numbers don't include the other variants. the onnx variant needs the onnx extra
+# (uv sync --extra onnx) and the export needs onnx installed
+#
+# run from the api/ directory:
+#   uv run python benchmarks/movie_tower_backend_benchmark.py
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+import importlib.util
+import joblib
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.movie_tower import MovieTower  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+
+TRAINING_MOVIE_TOWER = Path(__file__).parent.parent.parent / "training" / "model" / "movie_tower.py"
+VARIANTS = [
+    ("eager", "eager", False),
+    ("torchscript", "torchscript", False),
+    ("onnx", "onnx", False),
+    ("eager + int8 st", "eager", True),
+]
+BATCH_SIZES = [1, 32]
+REPEATS = 30
+
+def movies(count: int) -> list:
+    genres = list(joblib.load(settings.genre_mlb_path).classes_)
+    return [
+        {
+            "title": f"Movie {i}",
+            "genres": [genres[i % len(genres)], genres[(i * 7) % len(genres)]],
+            "year": 1950 + i % 70,
+            "actors": ["Actor A", f"Actor {i}"],
+            "director": [f"Director {i % 13}"],
+            "overview": f"a detective returns to the city he grew up in to find missing friend number {i}",
+        }
+        for i in range(count)
+    ]
+
+def time_ms(fn) -> tuple[float, float]:
+    fn()
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# runs in the child process, prints the results as json
+def run_variant(backend: str, int8: bool, head_dir: str, output_path: str) -> None:
+    from utils.load_model_files import load_sentence_transformer_model
+
+    settings.sentence_transformer_int8 = int8
+    head_name = {"torchscript": settings.movie_tower_head_torchscript_name, "onnx": settings.movie_tower_head_onnx_name}.get(backend)
+    movie_tower = MovieTower(
+        settings.movie_tower_model_path,
+        joblib.load(settings.genre_mlb_path),
+        load_sentence_transformer_model(),
+        backend=backend,
+        head_path=str(Path(head_dir) / head_name) if head_name else None
+    )
+    loaded_rss = peak_rss_mb()
+
+    results = {"loaded_rss_mb": loaded_rss}
+    for batch_size in BATCH_SIZES:
+        batch = movies(batch_size)
+        titles, metadata_sentences = movie_tower.movie_sentences(batch)
+        title_features = movie_tower.sentence_transformer_encoder.encode(titles, convert_to_numpy=True)
+        metadata_features = movie_tower.sentence_transformer_encoder.encode(metadata_sentences, convert_to_numpy=True)
+
+        results[f"layers_{batch_size}"] = time_ms(lambda: movie_tower.project_movie_embeddings(batch, title_features, metadata_features))
+        results[f"full_{batch_size}"] = time_ms(lambda: movie_tower.generate_movie_embeddings_batch(batch))
+
+    np.save(output_path, movie_tower.generate_movie_embeddings_batch(movies(64)))
+    results["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(results))
+
+def export_head(head_dir: str) -> None:
+    spec = importlib.util.spec_from_file_location("training_movie_tower", TRAINING_MOVIE_TOWER)
+    training_movie_tower = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(training_movie_tower)
+
+    # the api tower has the same layers as the trained one, only the weights are needed
+    eager = MovieTower(settings.movie_tower_model_path, joblib.load(settings.genre_mlb_path), None)
+    training_movie_tower.export_movie_tower_head(
+        eager,
+        str(Path(head_dir) / settings.movie_tower_head_torchscript_name),
+        str(Path(head_dir) / settings.movie_tower_head_onnx_name)
+    )
+
+def main():
+    with tempfile.TemporaryDirectory() as head_dir:
+        export_head(head_dir)
+
+        rows = []
+        for name, backend, int8 in VARIANTS:
+            output_path = str(Path(head_dir) / f"{name}.npy")
+            child = subprocess.run(
+                [sys.executable, __file__, "--variant", backend, str(int8), head_dir, output_path],
+                capture_output=True,
+                text=True
+            )
+            if child.returncode != 0:
+                print(f"{name} failed: {child.stderr.strip().splitlines()[-1]}")
+                continue
+            rows.append((name, json.loads(child.stdout.strip().splitlines()[-1]), np.load(output_path)))
+
+    reference = rows[0][2]
+    print(f"\n{'variant':>16} | {'layers x1':>9} | {'layers x32':>10} | {'full x1':>8} | {'full x32':>8} | {'rss MB':>7} | {'min cos':>8}")
+    print("-" * 86)
+    for name, results, embeddings in rows:
+        cosine = float(np.min(np.sum(embeddings * reference, axis=1)))
+        print(
+            f"{name:>16} | {results['layers_1'][0]:>9.3f} | {results['layers_32'][0]:>10.3f} | "
+            f"{results['full_1'][0]:>8.2f} | {results['full_32'][0]:>8.2f} | {results['peak_rss_mb']:>7.0f} | {cosine:>8.5f}"
+        )
+    print("\np50 ms, full = sentence transformer + layers, min cos = lowest cosine similarity to the eager embeddings")
+
+if __name__ == "__main__":
+    if "--variant" in sys.argv:
+        backend, int8, head_dir, output_path = sys.argv[sys.argv.index("--variant") + 1:]
+        run_variant(backend, int8 == "True", head_dir, output_path)
+    else:
+        main()
@@ -0,0 +1,72 @@
+# Benchmark for MovieTower.generate_movie_embeddings_batch, compares movies/sec of one tower
+# call per movie against one batched call at different batch sizes on CPU
+#
+# uses the sentence transformer and movie tower files from the settings (HF_MODEL_NAME and
+# LOCAL_MODEL_DIR in .env)
+#
+# run from the api/ directory:
+#   uv run python benchmarks/movie_tower_batch_benchmark.py
+import sys
+import time
+import joblib
+import numpy as np
+import torch
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.movie_tower import MovieTower  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+from utils.load_model_files import load_sentence_transformer_model  # noqa: E402
+
+BATCH_SIZES = [1, 8, 32, 128]
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Romance", "Thriller", "Animation", "Crime", "Fantasy"]
+WORDS = "the a of and to in lost city night last love war story secret house dark river king journey".split()
+
+def make_movies(rng: np.random.Generator, count: int) -> list:
+    return [
+        {
+            "title": " ".join(rng.choice(WORDS, size=int(rng.integers(1, 6)))).title(),
+            "genres": list(rng.choice(GENRES, size=int(rng.integers(1, 4)), replace=False)),
+            "year": int(rng.integers(1950, 2025)),
+            "actors": [f"Actor {a}" for a in rng.integers(0, 500, size=5)],
+            "director": [f"Director {rng.integers(0, 100)}"],
+            "overview": " ".join(rng.choice(WORDS, size=int(rng.integers(20, 80)))),
+        }
+        for _ in range(count)
+    ]
+
+def main():
+    rng = np.random.default_rng(42)
+
+    movie_tower = MovieTower(
+        settings.movie_tower_model_path,
+        joblib.load(settings.genre_mlb_path),
+        load_sentence_transformer_model()
+    )
+
+    print(f"torch threads: {torch.get_num_threads()}")
+    print(f"{'batch':>6} | {'single movies/s':>15} | {'batched movies/s':>16} | {'speedup':>7}")
+    print("-" * 54)
+
+    for batch_size in BATCH_SIZES:
+        movies = make_movies(rng, batch_size)
+
+        # warm up both paths
+        movie_tower.generate_movie_embeddings_batch(movies[:1])
+
+        start = time.perf_counter()
+        single = np.stack([movie_tower.generate_new_movie_embedding(**movie) for movie in movies])
+        single_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched = movie_tower.generate_movie_embeddings_batch(movies)
+        batched_s = time.perf_counter() - start
+
+        # padding the batch must not change the embeddings beyond float noise
+        assert np.allclose(single, batched, atol=1e-4), "batched embeddings differ from single"
+
+        print(f"{batch_size:>6} | {batch_size / single_s:>15.1f} | {batch_size / batched_s:>16.1f} | {single_s / batched_s:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Benchmark for the personalized recommendation request, runs the route against the database
+# configured in the environment and reports the per stage timings and database round trips
+# recorded by StageTimer, for fresh users and for users whose embedding is stale
+#
+# the previous route sent one statement per lookup (user count, rated ids, stale check, not
+# seen ids, similar users, candidates, plus 4 more when stale), the estimated column adds the
+# given network round trip time per statement to show what that costs against RDS
+#
+# run from the api/ directory:
+#   uv run python benchmarks/recommendation_round_trip_benchmark.py [--rtt-ms 1.5]
+import sys
+import asyncio
+import numpy as np
+from pathlib import Path
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from db.config.conn import async_session, engine  # noqa: E402
+from model.utils.reranker_model import Reranker  # noqa: E402
+from routes.recommendations import _get_recommendations  # noqa: E402
+from utils.timing import StageTimer  # noqa: E402
+from utils.user_count_cache import UserCountCache  # noqa: E402
+from utils.inference_executor import InferenceExecutor  # noqa: E402
+
+RERANKER_MODEL_PATH = Path(__file__).parent.parent / "app" / "model" / "files_small" / "reranker-model.txt"
+USERS = 20
+LEGACY_ROUND_TRIPS = {"fresh": 6, "stale": 10}
+
+async def run(reranker: Reranker, user_count_cache: UserCountCache, user_ids, stale: bool):
+    timers = []
+    for user_id in user_ids:
+        async with async_session() as session:
+            await session.execute(
+                text("UPDATE user_rating_stats SET is_stale = :stale WHERE user_id = :user_id"),
+                {"user_id": user_id, "stale": stale}
+            )
+
+            timer = StageTimer(f"benchmark user={user_id}")
+            await _get_recommendations(user_id, session, reranker, None, None, user_count_cache, InferenceExecutor(0, 0), timer)
+            timer.finish()
+            timers.append(timer)
+
+            # keep the benchmark from changing the stored embeddings and stats
+            await session.rollback()
+
+    return timers
+
+def summarize(label: str, timers, rtt_ms: float):
+    stages = {name for timer in timers for name in timer.stages}
+    round_trips = int(np.median([timer.round_trips for timer in timers]))
+    total = float(np.median([sum(timer.stages.values()) for timer in timers]))
+    legacy = LEGACY_ROUND_TRIPS[label]
+
+    print(f"\n{label} users ({len(timers)} requests)")
+    for name in sorted(stages, key=list(timers[0].stages).index):
+        print(f"  {name:>12} p50 {np.median([timer.stages.get(name, 0.0) for timer in timers]):8.2f} ms")
+    print(f"  round trips: {legacy} -> {round_trips}")
+    print(f"  estimated at {rtt_ms} ms rtt: {total + legacy * rtt_ms:.1f} ms -> {total + round_trips * rtt_ms:.1f} ms")
+
+async def main():
+    rtt_ms = float(sys.argv[sys.argv.index("--rtt-ms") + 1]) if "--rtt-ms" in sys.argv else 1.5
+    reranker = Reranker(str(RERANKER_MODEL_PATH))
+    user_count_cache = UserCountCache(ttl_seconds=3600)
+    await user_count_cache.refresh()
+
+    async with async_session() as session:
+        result = await session.execute(text("""
+            SELECT user_id
+            FROM user_watchlist
+            WHERE user_rating > 0
+            GROUP BY user_id
+            HAVING COUNT(*) >= 10
+            LIMIT :limit
+        """), {"limit": USERS})
+        user_ids = [row.user_id for row in result]
+
+    for label, stale in [("fresh", False), ("stale", True)]:
+        summarize(label, await run(reranker, user_count_cache, user_ids, stale), rtt_ms)
+
+    await engine.dispose()
+
+if __name__ == "__main__":
+    engine.echo = False
+    asyncio.run(main())
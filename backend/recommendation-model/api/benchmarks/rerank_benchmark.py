@@ -0,0 +1,124 @@
+# Benchmark for Reranker.rerank_movies, compares the vectorized feature builder against the
+# previous per candidate loop at different candidate pool sizes
+#
+# run from the api/ directory:
+#   uv run python benchmarks/rerank_benchmark.py
+import sys
+import time
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.reranker_model import Reranker  # noqa: E402
+
+RERANKER_MODEL_PATH = Path(__file__).parent.parent / "app" / "model" / "files_small" / "reranker-model.txt"
+CANDIDATE_COUNTS = [300, 1000, 5000]
+REPEATS = 20
+
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Romance", "Thriller", "Animation", "Crime", "Fantasy"]
+
+def make_user_metadata(rng: np.random.Generator) -> dict:
+    return {
+        "embedding": rng.standard_normal(512).astype(np.float32),
+        "avg_rating": 3.8,
+        "rating_log": 4.2,
+        "top_3_genres": GENRES[:3],
+        "top_50_actors": [f"actor_{i}" for i in range(50)],
+        "top_10_directors": [f"director_{i}" for i in range(10)],
+    }
+
+def make_candidates(rng: np.random.Generator, count: int) -> list:
+    return [
+        {
+            "movie_id": str(i),
+            "movie_emb": rng.standard_normal(512).astype(np.float32),
+            "title": f"movie {i}",
+            "genres": list(rng.choice(GENRES, size=3, replace=False)),
+            "release_date": int(rng.integers(1950, 2025)),
+            "actors": [f"actor_{a}" for a in rng.integers(0, 500, size=10)],
+            "directors": [f"director_{rng.integers(0, 100)}"],
+            "movie_rating_log": float(rng.uniform(0.7, 5.8)),
+            "movie_avg_rating": float(rng.uniform(0.5, 5)),
+            "tmdb_vote_avg": float(rng.uniform(0, 9)),
+            "tmdb_vote_log": float(rng.uniform(0, 10)),
+            "tmdb_popularity": float(rng.uniform(0, 140)),
+        }
+        for i in range(count)
+    ]
+
+# previous per candidate implementation, kept here as the baseline
+def legacy_rerank_movies(reranker: Reranker, user_metadata, candidate_movies):
+    def overlap(user_features, movie_features):
+        user_set = set(user_features) if user_features else set()
+        return np.array([len(user_set & set(m)) for m in movie_features], dtype=np.float32)
+
+    genre_overlap = overlap(user_metadata['top_3_genres'], [c['genres'] for c in candidate_movies])
+    actor_overlap = overlap(user_metadata['top_50_actors'], [c['actors'] for c in candidate_movies])
+    director_overlap = overlap(user_metadata['top_10_directors'], [c['directors'] for c in candidate_movies])
+
+    user_emb = user_metadata['embedding']
+
+    features = []
+    for i, candidate in enumerate(candidate_movies):
+        movie_emb = candidate['movie_emb']
+        collab_score = np.dot(user_emb, movie_emb) / (np.linalg.norm(user_emb) * np.linalg.norm(movie_emb) + 1e-8)
+        recency_score = (1 - ((2025 - candidate['release_date']) / 50))
+        features.append([
+            collab_score,
+            candidate['movie_rating_log'],
+            candidate['movie_avg_rating'],
+            candidate['tmdb_vote_avg'],
+            candidate['tmdb_vote_log'],
+            candidate['tmdb_popularity'],
+            recency_score,
+            recency_score * user_metadata['avg_rating'],
+            user_metadata['rating_log'],
+            user_metadata['avg_rating'],
+            genre_overlap[i],
+            actor_overlap[i],
+            director_overlap[i],
+        ])
+
+    X = np.array(features, dtype=np.float32)
+    scores = reranker.model.predict(X)
+    top_10 = sorted(zip(candidate_movies, scores), key=lambda x: x[1], reverse=True)[:10]
+
+    return X, [movie['movie_id'] for movie, _ in top_10]
+
+def time_ms(fn, repeats: int) -> tuple[float, float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+def main():
+    rng = np.random.default_rng(42)
+    reranker = Reranker(str(RERANKER_MODEL_PATH))
+    user_metadata = make_user_metadata(rng)
+
+    print(f"{'candidates':>10} | {'loop p50 ms':>11} | {'loop p99 ms':>11} | {'vec p50 ms':>10} | {'vec p99 ms':>10} | {'speedup':>7}")
+    print("-" * 75)
+
+    for count in CANDIDATE_COUNTS:
+        candidates = make_candidates(rng, count)
+        user_emb = user_metadata['embedding']
+        movie_embs = reranker._candidate_embedding_matrix(candidates)
+
+        # both paths have to produce the same features and the same top 10
+        legacy_X, legacy_top = legacy_rerank_movies(reranker, user_metadata, candidates)
+        vectorized_X = reranker._build_feature_matrix(user_metadata, candidates, user_emb, movie_embs)
+        vectorized_top = [movie['movie_id'] for movie in reranker.rerank_movies(user_metadata, candidates)]
+        assert np.allclose(legacy_X, vectorized_X, atol=1e-5), "feature matrices differ"
+        assert legacy_top == vectorized_top, "top 10 differs"
+
+        loop_p50, loop_p99 = time_ms(lambda: legacy_rerank_movies(reranker, user_metadata, candidates), REPEATS)
+        vec_p50, vec_p99 = time_ms(lambda: reranker.rerank_movies(user_metadata, candidates), REPEATS)
+
+        print(f"{count:>10} | {loop_p50:>11.2f} | {loop_p99:>11.2f} | {vec_p50:>10.2f} | {vec_p99:>10.2f} | {loop_p50 / vec_p50:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
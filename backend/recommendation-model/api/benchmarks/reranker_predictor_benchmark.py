@@ -0,0 +1,77 @@
+# Benchmark for the reranker predict call, compares lightgbm's Booster.predict (default
+# threads, num_threads=1 and predict_disable_shape_check) with the trees compiled by
+# model/utils/tree_predictor.py on 100/300/1000 candidate feature matrices, and checks that
+# every variant returns the same scores as the booster
+#
+# the reranker is loaded from LOCAL_MODEL_DIR, the compiled library goes into a temporary
+# directory. the feature matrices are random with some missing and zero values so every
+# missing value branch of the trees is exercised
+#
+# run from the api/ directory:
+#   uv run python benchmarks/reranker_predictor_benchmark.py
+import sys
+import time
+import tempfile
+import numpy as np
+import lightgbm as lgb
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.tree_predictor import CompiledTreePredictor  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+
+ROW_COUNTS = [100, 300, 1000]
+REPEATS = 300
+
+def feature_matrix(rows: int, num_features: int) -> np.ndarray:
+    rng = np.random.default_rng(rows)
+    X = rng.normal(size=(rows, num_features)).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan
+    X[rng.random(X.shape) < 0.05] = 0
+
+    return X
+
+def time_ms(fn) -> tuple[float, float]:
+    for _ in range(10):
+        fn()
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+def main():
+    booster = lgb.Booster(model_file=settings.reranker_model_path)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        predictor = CompiledTreePredictor.from_booster(booster, cache_dir)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        variants = [
+            ("lightgbm", lambda X: booster.predict(X)),
+            ("lightgbm 1 thread", lambda X: booster.predict(X, num_threads=1)),
+            ("lightgbm no check", lambda X: booster.predict(X, num_threads=1, predict_disable_shape_check=True)),
+            ("compiled", predictor.predict),
+        ]
+
+        print(f"{predictor.num_trees} trees, {predictor.num_features} features, compiled in {compile_ms:.0f} ms\n")
+        print(f"{'variant':>18} | " + " | ".join(f"{f'{rows} rows':>16}" for rows in ROW_COUNTS) + f" | {'max diff':>8}")
+        print("-" * (24 + 19 * len(ROW_COUNTS) + 8))
+
+        matrices = [feature_matrix(rows, predictor.num_features) for rows in ROW_COUNTS]
+        references = [booster.predict(X) for X in matrices]
+        for name, predict in variants:
+            max_diff = max(float(np.max(np.abs(predict(X) - reference))) for X, reference in zip(matrices, references))
+            assert max_diff == 0.0, f"{name} scores differ from the booster by {max_diff}"
+
+            timings = [time_ms(lambda: predict(X)) for X in matrices]
+            print(f"{name:>18} | " + " | ".join(f"{p50:>7.3f} / {p99:>6.3f}" for p50, p99 in timings) + f" | {max_diff:>8.1e}")
+
+    print("\np50 / p99 ms per predict call, max diff = largest score difference to Booster.predict")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# Benchmark for the model loading at startup, times loading the sentence transformer, movie
+# tower, cold start user tower and reranker one after another (the old lifespan) against the
+# parallel threads in utils/startup.py, and prints the per phase timings /api/ready reports
+#
+# the s3 download is skipped (the files in LOCAL_MODEL_DIR are used as they are), the
+# candidate engine and cold start index are left out since they only depend on the database
+#
+# run from the api/ directory:
+#   uv run python benchmarks/startup_benchmark.py
+import sys
+import time
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from model.utils.cold_start_user_tower import ColdStartUserTower  # noqa: E402
+from model.utils.movie_tower import MovieTower  # noqa: E402
+from model.utils.reranker_model import Reranker  # noqa: E402
+from utils import startup as startup_module  # noqa: E402
+from utils.env_config import settings  # noqa: E402
+from utils.inference_executor import InferenceExecutor  # noqa: E402
+from utils.load_model_files import load_sentence_transformer_model, load_recommendation_models  # noqa: E402
+from utils.startup import StartupState, load_models  # noqa: E402
+
+REPEATS = 3
+
+def serial_load() -> float:
+    start = time.perf_counter()
+    user_tower_path, movie_tower_path, genre_mlb, reranker_model_path = load_recommendation_models()
+    MovieTower(movie_tower_path, genre_mlb, load_sentence_transformer_model())
+    ColdStartUserTower(user_tower_path, genre_mlb)
+    Reranker(reranker_model_path)
+
+    return (time.perf_counter() - start) * 1000
+
+async def parallel_load() -> StartupState:
+    app = SimpleNamespace(state=SimpleNamespace(
+        startup=StartupState(),
+        inference_executor=InferenceExecutor(settings.inference_max_workers, settings.inference_max_queue),
+    ))
+    await load_models(app)
+    app.state.inference_executor.shutdown()
+
+    return app.state.startup
+
+async def main():
+    # only the loading is timed, not the s3 download or the database built state
+    startup_module.download_recommendation_model_files = lambda: None
+    settings.candidate_engine_enabled = False
+    settings.cold_start_index_enabled = False
+
+    # warm the os file cache and the torch imports so neither side pays for them
+    serial_load()
+
+    serial = [serial_load() for _ in range(REPEATS)]
+    phases = [await parallel_load() for _ in range(REPEATS)]
+    parallel = [state.phases["total"] for state in phases]
+
+    print(f"{'loading':>9} | {'best ms':>8} | {'worst ms':>8}")
+    print("-" * 32)
+    print(f"{'serial':>9} | {min(serial):>8.0f} | {max(serial):>8.0f}")
+    print(f"{'parallel':>9} | {min(parallel):>8.0f} | {max(parallel):>8.0f}")
+    print(f"\nphases of the last parallel load (ms): {phases[-1].phases}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+# Load test for the cold start user count gate, compares the per request
+# COUNT(DISTINCT user_id) query against reading the UserCountCache
+#
+# the count query runs against a TEMP copy of the user_watchlist shape filled with
+# WATCHLIST_ROWS generated ratings, so the database configured in the environment is only
+# used as a server and none of its tables are touched
+#
+# run from the api/ directory:
+#   uv run python benchmarks/user_count_benchmark.py [--rows 1000000]
+import sys
+import time
+import asyncio
+import numpy as np
+from pathlib import Path
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from db.config.conn import async_session, engine  # noqa: E402
+from utils.user_count_cache import UserCountCache  # noqa: E402
+
+WATCHLIST_ROWS = 1_000_000
+USERS = 50_000
+MOVIES = 20_000
+REPEATS = 20
+
+def percentiles(timings) -> tuple[float, float]:
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+async def main():
+    rows = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else WATCHLIST_ROWS
+
+    async with async_session() as session:
+        await session.execute(text("""
+            CREATE TEMP TABLE user_watchlist_load (
+                user_id TEXT NOT NULL,
+                movie_id TEXT NOT NULL,
+                user_rating REAL,
+                PRIMARY KEY (user_id, movie_id)
+            ) ON COMMIT DROP
+        """))
+        await session.execute(text("""
+            INSERT INTO user_watchlist_load (user_id, movie_id, user_rating)
+            SELECT 'u' || (i % :users), 'm' || (i / :users), (i % 11) / 2.0
+            FROM generate_series(0, :rows - 1) AS i
+        """), {"users": USERS, "rows": rows})
+        await session.execute(text("ANALYZE user_watchlist_load"))
+
+        count_query = text("""
+            SELECT COUNT(DISTINCT user_id)
+            FROM user_watchlist_load
+            WHERE user_rating > 0
+        """)
+
+        query_timings = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            count = (await session.execute(count_query)).scalar()
+            query_timings.append((time.perf_counter() - start) * 1000)
+
+        # cache filled from the same table, then read the way the route reads it
+        cache = UserCountCache(ttl_seconds=3600)
+        cache.count = count
+        cache.refreshed_at = time.monotonic()
+
+        cache_timings = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            assert await cache.get() == count
+            cache_timings.append((time.perf_counter() - start) * 1000)
+
+        await session.rollback()
+
+    await engine.dispose()
+
+    query_p50, query_p99 = percentiles(query_timings)
+    cache_p50, cache_p99 = percentiles(cache_timings)
+
+    print(f"watchlist rows: {rows}, users with ratings: {count}")
+    print(f"{'gate':>16} | {'p50 ms':>9} | {'p99 ms':>9}")
+    print("-" * 40)
+    print(f"{'COUNT(DISTINCT)':>16} | {query_p50:>9.3f} | {query_p99:>9.3f}")
+    print(f"{'UserCountCache':>16} | {cache_p50:>9.4f} | {cache_p99:>9.4f}")
+
+if __name__ == "__main__":
+    engine.echo = False
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+# Benchmark for the incremental user updates, times applying one rating as a delta
+# (apply_user_rating_delta) against the full rebuild from the rating history
+# (refresh_user_embedding_and_stats) for users with a growing amount of ratings
+#
+# every history size also checks that a run of add/update/remove deltas ends in the same
+# embedding, rating stats and counters as the full rebuild
+#
+# runs inside one transaction against the database configured in the environment with a
+# throwaway user, everything is rolled back at the end
+#
+# run from the api/ directory:
+#   uv run python benchmarks/user_rating_delta_benchmark.py
+import sys
+import time
+import asyncio
+import numpy as np
+from pathlib import Path
+from sqlalchemy import text
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from db.config.conn import async_session, engine  # noqa: E402
+from db.utils.movies_sql_queries import add_new_movie_rating  # noqa: E402
+from db.utils.user_sql_queries import apply_user_rating_delta, delete_from_watchlist  # noqa: E402
+from db.utils.recommendation_sql_queries import refresh_user_embedding_and_stats  # noqa: E402
+
+HISTORY_SIZES = [50, 500, 1500]
+USER_ID = "benchmark_delta_user"
+REPEATS = 20
+
+async def user_state(session):
+    result = await session.execute(text("""
+        SELECT ue.embedding, ue.embedding_count, urs.rating_count, urs.avg_rating, urs.top_50_actors, urs.top_10_directors
+        FROM user_embeddings ue
+        JOIN user_rating_stats urs ON ue.user_id = urs.user_id
+        WHERE ue.user_id = :user_id
+    """), {"user_id": USER_ID})
+    row = result.first()
+
+    counts = await session.execute(text("""
+        SELECT feature_type, feature, count
+        FROM user_feature_counts
+        WHERE user_id = :user_id
+        AND count > 0
+    """), {"user_id": USER_ID})
+
+    return row, {(r.feature_type, r.feature): r.count for r in counts}
+
+async def rate(session, movie_id: str, rating: float):
+    _, previous_rating = await add_new_movie_rating(session, USER_ID, movie_id, rating)
+    await apply_user_rating_delta(session, USER_ID, movie_id, previous_rating, rating)
+
+async def remove(session, movie_id: str):
+    previous_rating = await delete_from_watchlist(session, USER_ID, movie_id)
+    await apply_user_rating_delta(session, USER_ID, movie_id, previous_rating, 0.0)
+
+def timed(timings):
+    return float(np.median(timings)), float(np.percentile(timings, 99))
+
+async def main():
+    rng = np.random.default_rng(42)
+
+    async with async_session() as session:
+        movie_ids = [row.movie_id for row in await session.execute(text("SELECT movie_id FROM movie_embedding_personalized_prod"))]
+        rng.shuffle(movie_ids)
+        assert len(movie_ids) >= max(HISTORY_SIZES) + REPEATS, "not enough movies for the largest history size"
+
+        await session.execute(text("""
+            INSERT INTO user_login (user_id, username, email, password)
+            VALUES (:user_id, :user_id, :user_id, '')
+        """), {"user_id": USER_ID})
+        await session.execute(text("INSERT INTO user_rating_stats (user_id) VALUES (:user_id)"), {"user_id": USER_ID})
+
+        print(f"{'ratings':>8} | {'rebuild p50 ms':>14} | {'rebuild p99 ms':>14} | {'delta p50 ms':>12} | {'delta p99 ms':>12}")
+        print("-" * 72)
+
+        rated = 0
+        for history_size in HISTORY_SIZES:
+            # grow the history, rated through the delta path so it is exercised at every size
+            for movie_id in movie_ids[rated:history_size]:
+                await rate(session, movie_id, float(rng.integers(1, 11)) / 2)
+            rated = history_size
+
+            # a few updates and removals on top so every delta case is covered
+            await rate(session, movie_ids[0], 0.0)
+            await rate(session, movie_ids[0], 4.5)
+            await rate(session, movie_ids[1], 2.0)
+            await remove(session, movie_ids[2])
+            await rate(session, movie_ids[2], 3.0)
+
+            delta_row, delta_counts = await user_state(session)
+            await refresh_user_embedding_and_stats(session, USER_ID)
+            rebuild_row, rebuild_counts = await user_state(session)
+
+            cosine = float(np.dot(delta_row.embedding, rebuild_row.embedding))
+            assert cosine > 0.9999, f"embedding differs from rebuild, cosine {cosine}"
+            assert delta_row.embedding_count == rebuild_row.embedding_count
+            assert delta_row.rating_count == rebuild_row.rating_count
+            assert abs(delta_row.avg_rating - rebuild_row.avg_rating) < 1e-3
+            assert delta_counts == rebuild_counts, "feature counters differ from rebuild"
+            # ties can be picked in a different order, so the counts of the top features are compared
+            for column, feature_type in [("top_50_actors", "actor"), ("top_10_directors", "director")]:
+                assert [rebuild_counts[(feature_type, f)] for f in getattr(delta_row, column)] == \
+                    [rebuild_counts[(feature_type, f)] for f in getattr(rebuild_row, column)], f"{column} differs from rebuild"
+
+            rebuild_timings, delta_timings = [], []
+            for i in range(REPEATS):
+                start = time.perf_counter()
+                await refresh_user_embedding_and_stats(session, USER_ID)
+                rebuild_timings.append((time.perf_counter() - start) * 1000)
+
+                # rate an unrated movie then take it back out so the history size stays put
+                movie_id = movie_ids[history_size + i]
+                start = time.perf_counter()
+                await rate(session, movie_id, 4.0)
+                delta_timings.append((time.perf_counter() - start) * 1000)
+                await remove(session, movie_id)
+
+            rebuild_p50, rebuild_p99 = timed(rebuild_timings)
+            delta_p50, delta_p99 = timed(delta_timings)
+            print(f"{history_size:>8} | {rebuild_p50:>14.2f} | {rebuild_p99:>14.2f} | {delta_p50:>12.2f} | {delta_p99:>12.2f}")
+
+        await session.rollback()
+
+    await engine.dispose()
+
+if __name__ == "__main__":
+    engine.echo = False
+    asyncio.run(main())
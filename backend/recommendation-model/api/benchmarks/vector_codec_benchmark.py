@@ -0,0 +1,68 @@
+# Benchmark for the binary pgvector codec, compares wire bytes and client side decode time
+# of the vectors moved for one personalized recommendation request against the text format
+#
+# one request reads the user embedding, 300 candidate movie embeddings and, when the user
+# is stale, every rated movie embedding (RATED_MOVIES below)
+#
+# run from the api/ directory:
+#   uv run python benchmarks/vector_codec_benchmark.py
+import sys
+import time
+import numpy as np
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+from db.config.vector_codec import decode_vector, encode_vector  # noqa: E402
+
+EMBEDDING_DIM = 512
+CANDIDATE_MOVIES = 300
+RATED_MOVIES = 200
+REPEATS = 20
+
+# pgvector's vector_out writes each float4 with its shortest round trip repr
+def pgvector_text(emb: np.ndarray) -> str:
+    return "[" + ",".join(np.format_float_positional(x, unique=True, trim="-") for x in emb) + "]"
+
+# text decode the api used before the codec
+def decode_text(value: str) -> np.ndarray:
+    return np.fromstring(value.strip('[]'), sep=',', dtype=np.float32)
+
+def time_ms(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings))
+
+def main():
+    rng = np.random.default_rng(42)
+    num_vectors = 1 + CANDIDATE_MOVIES + RATED_MOVIES
+
+    embeddings = rng.standard_normal((num_vectors, EMBEDDING_DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    text_values = [pgvector_text(emb) for emb in embeddings]
+    binary_values = [encode_vector(emb) for emb in embeddings]
+
+    # binary round trip has to be lossless
+    for emb, value in zip(embeddings, binary_values):
+        assert np.array_equal(decode_vector(value), emb)
+
+    text_bytes = sum(len(value.encode()) for value in text_values)
+    binary_bytes = sum(len(value) for value in binary_values)
+
+    text_ms = time_ms(lambda: [decode_text(value) for value in text_values], REPEATS)
+    binary_ms = time_ms(lambda: [decode_vector(value) for value in binary_values], REPEATS)
+
+    print(f"vectors per request: {num_vectors} (1 user + {CANDIDATE_MOVIES} candidates + {RATED_MOVIES} rated)")
+    print(f"{'format':>8} | {'wire KB':>9} | {'bytes/vector':>12} | {'decode ms':>9}")
+    print("-" * 48)
+    print(f"{'text':>8} | {text_bytes / 1024:>9.1f} | {text_bytes / num_vectors:>12.0f} | {text_ms:>9.2f}")
+    print(f"{'binary':>8} | {binary_bytes / 1024:>9.1f} | {binary_bytes / num_vectors:>12.0f} | {binary_ms:>9.2f}")
+    print(f"\nwire bytes: {text_bytes / binary_bytes:.1f}x smaller, decode: {text_ms / binary_ms:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
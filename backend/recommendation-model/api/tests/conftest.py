@@ -0,0 +1,10 @@
+# the app imports its modules from app/ (PYTHONPATH=/app in the image) and reads the database
+# settings at import time, neither is needed by the unit tests
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "app"))
+
+for name in ("DB_USERNAME", "DB_PASSWORD", "DB_HOST", "DB_PORT", "DB_NAME"):
+    os.environ.setdefault(name, "test")
@@ -0,0 +1,188 @@
+# Checks the incremental user updates (add_new_movie_rating + apply_user_rating_delta) end in
+# the same embedding, rating stats and counters as the full rebuild, and that concurrent
+# ratings of the same movie replace each other's rating. Runs against the database configured
+# in the environment, skipped when it can't be reached. The single session tests are rolled
+# back, the concurrent ones commit their throwaway user and movies and delete them after
+import asyncio
+import numpy as np
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# db.config.conn builds the app's engine when it's imported, which fails on the placeholder
+# settings conftest sets when no database is configured
+try:
+    from db.config.conn import create_engine
+    from db.utils.movies_sql_queries import add_new_movie_rating
+    from db.utils.user_sql_queries import apply_user_rating_delta, delete_from_watchlist
+    from db.utils.recommendation_sql_queries import refresh_user_embedding_and_stats
+except ValueError as e:
+    pytest.skip(f"database settings not usable: {e}", allow_module_level=True)
+
+USER_ID = "test_rating_delta_user"
+DIM = 512
+MOVIES = {
+    "test_delta_a": (["Drama", "Crime"], ["Actor 1", "Actor 2"], ["Director 1"]),
+    "test_delta_b": (["Drama"], ["Actor 2", "Actor 3"], ["Director 2"]),
+    "test_delta_c": (["Comedy", "Crime"], ["Actor 1"], ["Director 1", "Director 2"]),
+}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def database():
+    async def check():
+        engine = create_engine(pool_size=1, max_overflow=0)
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1 FROM user_watchlist LIMIT 1"))
+        finally:
+            await engine.dispose()
+
+    try:
+        run(check())
+    except (OSError, DBAPIError) as e:
+        pytest.skip(f"database not reachable: {e}")
+
+
+async def create_user_and_movies(session):
+    rng = np.random.default_rng(0)
+    await session.execute(text("""
+        INSERT INTO user_login (user_id, username, email, password)
+        VALUES (:user_id, :user_id, :user_id, '')
+    """), {"user_id": USER_ID})
+    await session.execute(text("INSERT INTO user_rating_stats (user_id) VALUES (:user_id)"), {"user_id": USER_ID})
+
+    for movie_id, (genres, actors, director) in MOVIES.items():
+        await session.execute(text("""
+            INSERT INTO movie_metadata (movie_id, movie_name, genres, release_date, summary, actors, director)
+            VALUES (:movie_id, :movie_id, :genres, 2000, '', :actors, :director)
+        """), {"movie_id": movie_id, "genres": genres, "actors": actors, "director": director})
+        await session.execute(text("""
+            INSERT INTO movie_embedding_personalized_prod (movie_id, embedding)
+            VALUES (:movie_id, :embedding)
+        """), {"movie_id": movie_id, "embedding": rng.normal(size=DIM).astype(np.float32)})
+
+
+async def delete_user_and_movies(session):
+    await session.execute(text("DELETE FROM user_login WHERE user_id = :user_id"), {"user_id": USER_ID})
+    await session.execute(text("DELETE FROM movie_metadata WHERE movie_id = ANY(:movie_ids)"), {"movie_ids": list(MOVIES)})
+    await session.commit()
+
+
+async def rate(session, movie_id, rating):
+    _, previous_rating = await add_new_movie_rating(session, USER_ID, movie_id, rating)
+    await apply_user_rating_delta(session, USER_ID, movie_id, previous_rating, rating)
+
+
+async def remove(session, movie_id):
+    previous_rating = await delete_from_watchlist(session, USER_ID, movie_id)
+    await apply_user_rating_delta(session, USER_ID, movie_id, previous_rating, 0.0)
+
+
+async def user_state(session):
+    result = await session.execute(text("""
+        SELECT ue.embedding, ue.embedding_count, urs.rating_count, urs.rating_sum, urs.avg_rating,
+            urs.top_50_actors, urs.top_10_directors
+        FROM user_embeddings ue
+        JOIN user_rating_stats urs ON ue.user_id = urs.user_id
+        WHERE ue.user_id = :user_id
+    """), {"user_id": USER_ID})
+    row = result.first()
+
+    counts = await session.execute(text("""
+        SELECT feature_type, feature, count
+        FROM user_feature_counts
+        WHERE user_id = :user_id
+        AND count > 0
+    """), {"user_id": USER_ID})
+
+    return row, {(r.feature_type, r.feature): r.count for r in counts}
+
+
+# the user state the deltas left matches a rebuild from the rating history
+async def assert_matches_rebuild(session):
+    delta_row, delta_counts = await user_state(session)
+    await refresh_user_embedding_and_stats(session, USER_ID)
+    rebuild_row, rebuild_counts = await user_state(session)
+
+    assert float(np.dot(delta_row.embedding, rebuild_row.embedding)) > 0.9999
+    assert delta_row.embedding_count == rebuild_row.embedding_count
+    assert delta_row.rating_count == rebuild_row.rating_count
+    assert delta_row.avg_rating == pytest.approx(rebuild_row.avg_rating, abs=1e-3)
+    assert delta_counts == rebuild_counts
+    # ties can be picked in a different order, so the counts of the top features are compared
+    for column, feature_type in [("top_50_actors", "actor"), ("top_10_directors", "director")]:
+        assert [rebuild_counts[(feature_type, f)] for f in getattr(delta_row, column)] == \
+            [rebuild_counts[(feature_type, f)] for f in getattr(rebuild_row, column)]
+
+    return rebuild_row
+
+
+@pytest.mark.parametrize("steps", [
+    [("rate", "test_delta_a", 4.0), ("rate", "test_delta_b", 3.0), ("rate", "test_delta_c", 5.0)],
+    [("rate", "test_delta_a", 4.0), ("rate", "test_delta_b", 3.0), ("rate", "test_delta_a", 2.5)],
+    [("rate", "test_delta_a", 4.0), ("rate", "test_delta_b", 3.0), ("rate", "test_delta_b", 0.0), ("rate", "test_delta_b", 3.5)],
+    [("rate", "test_delta_a", 4.0), ("rate", "test_delta_b", 3.0), ("rate", "test_delta_c", 5.0), ("remove", "test_delta_c", None)],
+], ids=["add", "re-rate", "re-rate to unrated and back", "delete"])
+def test_delta_matches_rebuild(steps):
+    async def check():
+        engine = create_engine(pool_size=1, max_overflow=0)
+        try:
+            async with AsyncSession(engine) as session:
+                await create_user_and_movies(session)
+                for action, movie_id, rating in steps:
+                    if action == "rate":
+                        await rate(session, movie_id, rating)
+                    else:
+                        await remove(session, movie_id)
+                    await assert_matches_rebuild(session)
+                await session.rollback()
+        finally:
+            await engine.dispose()
+
+    run(check())
+
+
+# a rating that waits on another one for the same movie replaces the rating that one wrote,
+# whether the movie was rated before (the row is locked) or not (the insert conflicts)
+@pytest.mark.parametrize("existing_rating", [2.0, None], ids=["re-rate", "first rating"])
+def test_concurrent_ratings_replace_each_other(existing_rating):
+    async def check():
+        engine = create_engine(pool_size=2, max_overflow=0)
+        try:
+            async with AsyncSession(engine) as first, AsyncSession(engine) as second:
+                await create_user_and_movies(first)
+                await rate(first, "test_delta_b", 3.0)
+                if existing_rating is not None:
+                    await rate(first, "test_delta_a", existing_rating)
+                await first.commit()
+
+                try:
+                    await rate(first, "test_delta_a", 4.0)
+
+                    # the second rating waits for the first transaction
+                    waiting = asyncio.create_task(add_new_movie_rating(second, USER_ID, "test_delta_a", 5.0))
+                    await asyncio.sleep(0.5)
+                    assert not waiting.done()
+                    await first.commit()
+
+                    _, previous_rating = await waiting
+                    assert previous_rating == 4.0
+                    await apply_user_rating_delta(second, USER_ID, "test_delta_a", previous_rating, 5.0)
+                    await second.commit()
+
+                    rebuild_row = await assert_matches_rebuild(second)
+                    assert rebuild_row.rating_sum == pytest.approx(8.0)
+                finally:
+                    await first.rollback()
+                    await second.rollback()
+                    await delete_user_and_movies(first)
+        finally:
+            await engine.dispose()
+
+    run(check())
@@ -0,0 +1,125 @@
+# Checks the S3 model download cache against moto's in memory S3
+import json
+import boto3
+import pytest
+from moto import mock_aws
+from utils import download_model_files
+from utils.download_model_files import download_recommendation_model_files, MANIFEST_NAME
+from utils.env_config import settings
+
+BUCKET = "cinesense-test-models"
+PREFIX = "models/test/v1/"
+
+
+@pytest.fixture
+def s3_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "production", True)
+    monkeypatch.setattr(settings, "s3_bucket_name", BUCKET)
+    monkeypatch.setattr(settings, "s3_model_prefix", PREFIX)
+    monkeypatch.setattr(settings, "model_cache_dir", str(tmp_path))
+
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        for model_file in model_files():
+            upload(client, model_file, f"{model_file} weights".encode())
+
+        yield client
+
+
+def model_files() -> list[str]:
+    return [
+        settings.user_tower_model_name,
+        settings.movie_tower_model_name,
+        settings.reranker_model_name,
+        settings.genre_mlb_name,
+    ]
+
+
+def upload(client, model_file: str, body: bytes) -> None:
+    client.put_object(
+        Bucket=BUCKET,
+        Key=f"{PREFIX}{model_file}",
+        Body=body,
+        ChecksumAlgorithm="SHA256",
+    )
+
+
+# records the headers of the GetObject calls (one per ranged GET) made through the client
+def count_gets(client) -> list:
+    gets = []
+    client.meta.events.register("before-call.s3.GetObject", lambda params, **kwargs: gets.append(params["headers"]))
+    return gets
+
+
+def test_cold_start_downloads_every_file(s3_client) -> None:
+    results = download_recommendation_model_files(s3_client)
+
+    assert results == {model_file: "downloaded" for model_file in model_files()}
+    for model_file in model_files():
+        assert (settings.model_cache_path / model_file).read_bytes() == f"{model_file} weights".encode()
+
+    manifest = json.loads((settings.model_cache_path / MANIFEST_NAME).read_text())
+    assert set(manifest) == set(model_files())
+    assert not list(settings.model_cache_path.glob("*.partial"))
+
+
+def test_warm_restart_skips_downloads(s3_client) -> None:
+    download_recommendation_model_files(s3_client)
+    gets = count_gets(s3_client)
+
+    results = download_recommendation_model_files(s3_client)
+
+    assert results == {model_file: "cached" for model_file in model_files()}
+    assert gets == []
+
+
+def test_only_changed_files_are_downloaded(s3_client) -> None:
+    download_recommendation_model_files(s3_client)
+    upload(s3_client, settings.reranker_model_name, b"retrained reranker")
+    gets = count_gets(s3_client)
+
+    results = download_recommendation_model_files(s3_client)
+
+    assert results[settings.reranker_model_name] == "downloaded"
+    assert [result for result in results.values() if result == "cached"] == ["cached"] * 3
+    assert len(gets) == 1
+    assert (settings.model_cache_path / settings.reranker_model_name).read_bytes() == b"retrained reranker"
+
+
+def test_corrupted_cached_file_is_downloaded_again(s3_client) -> None:
+    download_recommendation_model_files(s3_client)
+    (settings.model_cache_path / settings.user_tower_model_name).write_bytes(b"truncat")
+
+    results = download_recommendation_model_files(s3_client)
+
+    assert results[settings.user_tower_model_name] == "downloaded"
+    assert (settings.model_cache_path / settings.user_tower_model_name).read_bytes() == f"{settings.user_tower_model_name} weights".encode()
+
+
+def test_large_files_use_parallel_ranged_gets(s3_client, monkeypatch) -> None:
+    monkeypatch.setattr(settings, "model_download_multipart_threshold_mb", 1)
+    monkeypatch.setattr(settings, "model_download_multipart_chunksize_mb", 1)
+    download_recommendation_model_files(s3_client)
+    body = bytes(range(256)) * 4096 * 3  # 3 MB
+    upload(s3_client, settings.movie_tower_model_name, body)
+    gets = count_gets(s3_client)
+
+    download_recommendation_model_files(s3_client)
+
+    assert sorted(headers["Range"] for headers in gets) == [
+        "bytes=0-1048575", "bytes=1048576-2097151", "bytes=2097152-"
+    ]
+    assert (settings.model_cache_path / settings.movie_tower_model_name).read_bytes() == body
+
+
+def test_failed_verification_keeps_the_cached_file(s3_client, monkeypatch) -> None:
+    download_recommendation_model_files(s3_client)
+    upload(s3_client, settings.genre_mlb_name, b"new genre mlb")
+    monkeypatch.setattr(download_model_files, "file_sha256", lambda path: "0" * 64)
+
+    with pytest.raises(ValueError):
+        download_recommendation_model_files(s3_client)
+
+    assert (settings.model_cache_path / settings.genre_mlb_name).read_bytes() == f"{settings.genre_mlb_name} weights".encode()
+    assert not list(settings.model_cache_path.glob("*.partial"))
@@ -0,0 +1,114 @@
+# Checks the prometheus text rendering, span timing into a request trace (across the inference
+# executor threads too) and the sampling profiler
+import asyncio
+import threading
+import pytest
+from utils.inference_executor import InferenceExecutor
+from utils.metrics import Counter, Histogram, stats_gauges
+from utils.profiler import ProfilerBusyError, profile
+from utils.timing import request_trace, span, traced
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "test", ("stage",), buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 5.0):
+        histogram.observe(value, 'a"b')
+
+    lines = list(histogram.collect())
+
+    assert lines[:2] == ["# HELP test_seconds test", "# TYPE test_seconds histogram"]
+    assert lines[2:] == [
+        'test_seconds_bucket{stage="a\\"b",le="0.01"} 1',
+        'test_seconds_bucket{stage="a\\"b",le="0.1"} 3',
+        'test_seconds_bucket{stage="a\\"b",le="+Inf"} 4',
+        'test_seconds_sum{stage="a\\"b"} 5.105',
+        'test_seconds_count{stage="a\\"b"} 4',
+    ]
+
+
+def test_counter_and_stats_gauges():
+    counter = Counter("test_total", "test", ("stage",))
+    counter.inc("a")
+    counter.inc("a", amount=2)
+
+    assert list(counter.collect())[-1] == 'test_total{stage="a"} 3.0'
+    # strings and bools of a stats dict aren't gauges
+    assert list(stats_gauges("cache", {"hits": 3, "backend": "memory", "enabled": True})) == [
+        "# TYPE cinesense_cache_hits gauge",
+        "cinesense_cache_hits 3.0",
+    ]
+
+
+def test_spans_add_up_in_request_trace():
+    @traced("sleep")
+    async def sleep():
+        await asyncio.sleep(0.01)
+
+    async def request():
+        with request_trace() as trace:
+            await sleep()
+            await sleep()
+            with span("block"):
+                pass
+        return trace
+
+    trace = run(request())
+
+    assert trace.spans["sleep"] >= 20
+    assert set(trace.spans) == {"sleep", "block"}
+    assert trace.server_timing(25.0).endswith("total;dur=25.00")
+
+
+def test_spans_on_inference_threads_reach_request_trace():
+    executor = InferenceExecutor(max_workers=2, max_queue=4)
+
+    @traced("model.call")
+    def model_call():
+        return threading.current_thread().name
+
+    async def request():
+        with request_trace() as trace:
+            thread_name = await executor.run(model_call)
+        return trace, thread_name
+
+    try:
+        trace, thread_name = run(request())
+    finally:
+        executor.shutdown()
+
+    assert thread_name.startswith("inference")
+    assert "model.call" in trace.spans
+
+
+def test_profiler_samples_busy_thread_and_runs_one_at_a_time():
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_loop, name="busy-worker")
+    worker.start()
+
+    async def profile_twice():
+        first = asyncio.create_task(profile(0.3, 0.005))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ProfilerBusyError):
+            await profile(0.1, 0.005)
+        return await first
+
+    try:
+        profiler = run(profile_twice())
+    finally:
+        stop.set()
+        worker.join()
+
+    assert profiler.samples > 10
+    busy_stacks = [line for line in profiler.collapsed().splitlines() if line.startswith("busy-worker;")]
+    assert any("busy_loop" in line for line in busy_stacks)
+    # the sampler doesn't sample itself
+    assert not any(line.startswith("sampling-profiler") for line in profiler.collapsed().splitlines())
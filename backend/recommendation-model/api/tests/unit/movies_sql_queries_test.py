@@ -0,0 +1,32 @@
+# Checks add_new_movie_rating gives up with a 409 instead of returning no previous rating when
+# every attempt to insert or update the watchlist row found nothing to change
+import asyncio
+import pytest
+from fastapi import HTTPException
+from db.utils.movies_sql_queries import add_new_movie_rating
+
+
+# session whose statements never return a row, counts how often the rating statement ran
+class EmptySession:
+    def __init__(self):
+        self.executes = 0
+
+    async def execute(self, query, params):
+        self.executes += 1
+        return self
+
+    def first(self):
+        return None
+
+    async def flush(self):
+        pass
+
+
+def test_rating_without_row_after_retries_is_a_conflict():
+    session = EmptySession()
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(add_new_movie_rating(session, "u1", "tt0000001", 4.0))
+
+    assert e.value.status_code == 409
+    assert session.executes == 3
@@ -0,0 +1,190 @@
+# Checks the feed paging and both recommendation cache backends, redis against fakeredis'
+# in process server
+import asyncio
+import fakeredis
+import pytest
+from utils import recommendation_cache as recommendation_cache_module
+from utils.recommendation_cache import InMemoryRecommendationCache, RecommendationCache, RecommendationFeed, RedisRecommendationCache
+
+RECOMMENDATIONS = [{"movie_id": f"tt{i:07d}", "title": f"Movie {i}", "score": 1 - i / 100} for i in range(25)]
+
+
+@pytest.fixture(params=["memory", "redis"])
+def cache(request):
+    if request.param == "memory":
+        return InMemoryRecommendationCache(max_size=100, ttl_seconds=300)
+
+    return RedisRecommendationCache(fakeredis.FakeAsyncRedis(), ttl_seconds=300)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def ids(page):
+    return [recommendation["movie_id"] for recommendation in page]
+
+
+def test_feed_pages_follow_cursor():
+    feed = RecommendationFeed(RECOMMENDATIONS)
+
+    first, cursor = feed.page(0, 10)
+    second, cursor = feed.page(cursor, 10)
+    third, cursor = feed.page(cursor, 10)
+
+    assert ids(first + second + third) == ids(RECOMMENDATIONS)
+    assert len(third) == 5 and cursor is None
+
+
+def test_feed_skips_dismissed_without_moving_cursors():
+    feed = RecommendationFeed(RECOMMENDATIONS)
+    first, cursor = feed.page(0, 10)
+
+    # dismissing a movie on the first page doesn't shift the second page
+    feed.dismissed.add(first[3]["movie_id"])
+    second, _ = feed.page(cursor, 10)
+    assert ids(second) == ids(RECOMMENDATIONS[10:20])
+
+    # and a page that reaches a dismissed movie fills up past it
+    feed.dismissed.add(RECOMMENDATIONS[12]["movie_id"])
+    second, cursor = feed.page(10, 10)
+    assert ids(second) == ids(RECOMMENDATIONS[10:12] + RECOMMENDATIONS[13:21])
+    assert cursor == 21
+
+
+def test_miss_then_hit(cache):
+    cached, generation = run(cache.get("u1", "v1"))
+    assert cached is None
+
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    cached, _ = run(cache.get("u1", "v1"))
+    assert cached.recommendations == RECOMMENDATIONS
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_other_model_version_misses(cache):
+    _, generation = run(cache.get("u1", "v1"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    cached, _ = run(cache.get("u1", "v2"))
+    assert cached is None
+
+
+def test_invalidate_drops_entry(cache):
+    _, generation = run(cache.get("u1", "v1"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+    run(cache.put("u2", "v1", generation, RECOMMENDATIONS))
+
+    run(cache.invalidate("u1"))
+
+    assert run(cache.get("u1", "v1"))[0] is None
+    assert run(cache.get("u2", "v1"))[0].recommendations == RECOMMENDATIONS
+
+
+def test_result_computed_before_invalidation_isnt_stored(cache):
+    # a request reads the cache, the user rates a movie while it computes, then it stores
+    _, generation = run(cache.get("u1", "v1"))
+    run(cache.invalidate("u1"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    cached, generation = run(cache.get("u1", "v1"))
+    assert cached is None
+
+    # the next request computes from the new state and is stored
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+    assert run(cache.get("u1", "v1"))[0].recommendations == RECOMMENDATIONS
+
+
+def test_dismiss_filters_cached_feed(cache):
+    _, generation = run(cache.get("u1", "v1"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    run(cache.dismiss("u1", RECOMMENDATIONS[0]["movie_id"]))
+
+    feed, _ = run(cache.get("u1", "v1"))
+    page, _ = feed.page(0, 10)
+    assert ids(page) == ids(RECOMMENDATIONS[1:11])
+
+
+def test_feed_ranked_before_dismissal_never_shows_it(cache):
+    _, generation = run(cache.get("u1", "v1"))
+    run(cache.dismiss("u1", RECOMMENDATIONS[0]["movie_id"]))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    feed, _ = run(cache.get("u1", "v1"))
+    assert feed is None or RECOMMENDATIONS[0]["movie_id"] not in ids(feed.page(0, 10)[0])
+
+
+def test_backend_missing_a_method_fails_when_created():
+    class NoDismissCache(RecommendationCache):
+        async def get(self, user_id, version):
+            return None, 0
+
+        async def put(self, user_id, version, generation, recommendations):
+            pass
+
+        async def invalidate(self, user_id):
+            pass
+
+    with pytest.raises(TypeError, match="dismiss"):
+        NoDismissCache(ttl_seconds=60)
+
+
+def test_memory_entries_expire(monkeypatch):
+    cache = InMemoryRecommendationCache(max_size=100, ttl_seconds=60)
+    now = [1000.0]
+    monkeypatch.setattr(recommendation_cache_module.time, "monotonic", lambda: now[0])
+
+    _, generation = run(cache.get("u1", "v1"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    now[0] += 61
+    assert run(cache.get("u1", "v1"))[0] is None
+
+
+def test_memory_evicts_least_recently_used():
+    cache = InMemoryRecommendationCache(max_size=2, ttl_seconds=300)
+    for user_id in ["u1", "u2"]:
+        run(cache.put(user_id, "v1", 0, RECOMMENDATIONS))
+    run(cache.get("u1", "v1"))
+    run(cache.put("u3", "v1", 0, RECOMMENDATIONS))
+
+    assert run(cache.get("u1", "v1"))[0].recommendations == RECOMMENDATIONS
+    assert run(cache.get("u2", "v1"))[0] is None
+
+
+def test_memory_forgotten_invalidation_still_blocks_older_results():
+    cache = InMemoryRecommendationCache(max_size=1, ttl_seconds=300)
+    _, generation = run(cache.get("u1", "v1"))
+
+    # u1's invalidation is pushed out of the LRU by u2's
+    run(cache.invalidate("u1"))
+    run(cache.invalidate("u2"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    assert run(cache.get("u1", "v1"))[0] is None
+
+
+def test_redis_entries_expire():
+    client = fakeredis.FakeAsyncRedis()
+    cache = RedisRecommendationCache(client, ttl_seconds=60)
+
+    _, generation = run(cache.get("u1", "v1"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+
+    assert 0 < run(client.ttl("recs:u1")) <= 60
+
+
+def test_redis_down_is_a_miss():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = RedisRecommendationCache(fakeredis.FakeAsyncRedis(server=server), ttl_seconds=300)
+
+    cached, generation = run(cache.get("u1", "v1"))
+    run(cache.put("u1", "v1", generation, RECOMMENDATIONS))
+    run(cache.invalidate("u1"))
+
+    # the put is skipped, a failed read never stores
+    assert cached is None
+    assert cache.errors == 2
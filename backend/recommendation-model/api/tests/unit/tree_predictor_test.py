@@ -0,0 +1,56 @@
+# Checks the compiled reranker trees score exactly like lightgbm's Booster.predict
+import shutil
+import numpy as np
+import lightgbm as lgb
+import pytest
+from model.utils.tree_predictor import CompiledTreePredictor
+
+pytestmark = pytest.mark.skipif(shutil.which("cc") is None, reason="needs a c compiler")
+
+
+def features(rows: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, 6)).astype(np.float32)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    X[rng.random(X.shape) < 0.1] = 0
+
+    return X
+
+
+def train(params: dict, **dataset_args) -> lgb.Booster:
+    X = features(500, 0)
+    y = (np.nan_to_num(X[:, 0]) + np.nan_to_num(X[:, 1]) > 0).astype(int)
+    params = {"verbose": -1, "num_leaves": 15, "min_data_in_leaf": 5, **params}
+
+    return lgb.train(params, lgb.Dataset(X, y, **dataset_args), num_boost_round=20)
+
+
+@pytest.mark.parametrize("params,dataset_args", [
+    ({"objective": "lambdarank"}, {"group": [50] * 10}),
+    ({"objective": "binary"}, {}),
+    ({"objective": "regression", "zero_as_missing": True}, {}),
+    ({"objective": "regression", "use_missing": False}, {}),
+])
+def test_matches_booster(tmp_path, params, dataset_args):
+    booster = train(params, **dataset_args)
+    predictor = CompiledTreePredictor.from_booster(booster, str(tmp_path))
+
+    # the tree sums are exact, the binary sigmoid can differ in the last bit (numpy's exp)
+    X = features(300, 1)
+    np.testing.assert_allclose(predictor.predict(X), booster.predict(X), rtol=1e-14, atol=0)
+
+
+def test_reuses_compiled_library(tmp_path):
+    booster = train({"objective": "binary"})
+    first = CompiledTreePredictor.from_booster(booster, str(tmp_path))
+    second = CompiledTreePredictor.from_booster(booster, str(tmp_path))
+
+    assert first.library_path == second.library_path
+    assert len(list(tmp_path.glob("*.so"))) == 1
+
+
+def test_rejects_wrong_feature_count(tmp_path):
+    predictor = CompiledTreePredictor.from_booster(train({"objective": "binary"}), str(tmp_path))
+
+    with pytest.raises(ValueError):
+        predictor.predict(np.zeros((3, 5), dtype=np.float32))
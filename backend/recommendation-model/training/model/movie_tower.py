@@ -1,3 +1,4 @@
+import copy
 import torch.nn as nn
 import torch
 import numpy as np
@@ -71,4 +72,61 @@ class MovieTower(nn.Module):
         # tower is also 512 dimensions
         movie_emb = self.projector(combined_emb)
 
-        return movie_emb
\ No newline at end of file
+        return movie_emb
+
+
+# the movie tower without the per movie feature tensors: takes the title/genre/year/metadata
+# sentence features of any movie (how the api calls it for new movies) and returns the final
+# normalized embedding. exported as one TorchScript / ONNX graph for the api
+class MovieTowerHead(nn.Module):
+    def __init__(self, movie_tower: MovieTower) -> None:
+        super().__init__()
+        self.title_linear = movie_tower.title_linear
+        self.genre_linear = movie_tower.genre_linear
+        self.year_linear = movie_tower.year_linear
+        self.metadata_sentence_linear = movie_tower.metadata_sentence_linear
+        self.projector = movie_tower.projector
+
+    def forward(
+        self,
+        title_features: torch.Tensor,
+        genre_features: torch.Tensor,
+        year_features: torch.Tensor,
+        metadata_sentence_features: torch.Tensor
+    ) -> torch.Tensor:
+        title_emb = torch.nn.functional.normalize(torch.relu(self.title_linear(title_features)), p=2.0, dim=1)
+        genre_emb = torch.nn.functional.normalize(torch.relu(self.genre_linear(genre_features)), p=2.0, dim=1)
+        year_emb = torch.nn.functional.normalize(torch.relu(self.year_linear(year_features)), p=2.0, dim=1)
+        metadata_sentence_emb = torch.nn.functional.normalize(torch.relu(self.metadata_sentence_linear(metadata_sentence_features)), p=2.0, dim=1)
+
+        combined_emb = torch.cat([title_emb, genre_emb, year_emb, metadata_sentence_emb], dim=1)
+
+        return torch.nn.functional.normalize(self.projector(combined_emb), p=2.0, dim=1)
+
+# exports the head on cpu as a frozen TorchScript module and an ONNX graph with a dynamic
+# batch dimension, both are loaded by the api's MovieTower (MOVIE_TOWER_BACKEND)
+def export_movie_tower_head(movie_tower: MovieTower, torchscript_path: str, onnx_path: str) -> None:
+    head = copy.deepcopy(MovieTowerHead(movie_tower)).cpu().eval()
+
+    example_inputs = (
+        torch.zeros(2, head.title_linear.in_features),
+        torch.zeros(2, head.genre_linear.in_features),
+        torch.zeros(2, head.year_linear.in_features),
+        torch.zeros(2, head.metadata_sentence_linear.in_features),
+    )
+    input_names = ["title_features", "genre_features", "year_features", "metadata_sentence_features"]
+
+    with torch.no_grad():
+        # freezing inlines the weights so the linear + relu pairs can be fused at load time
+        scripted = torch.jit.freeze(torch.jit.script(head))
+        torch.jit.save(scripted, torchscript_path)
+
+        torch.onnx.export(
+            head,
+            example_inputs,
+            onnx_path,
+            input_names=input_names,
+            output_names=["movie_embedding"],
+            dynamic_axes={name: {0: "batch"} for name in input_names + ["movie_embedding"]},
+            dynamo=False
+        )
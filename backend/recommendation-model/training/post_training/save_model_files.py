@@ -4,6 +4,7 @@ import numpy as np
 import psycopg2
 import polars as pl
 from shared.path_config import path_helper
+from model.movie_tower import export_movie_tower_head
 
 class SaveModel:
     def __init__(self, user_tower, movie_tower, num_movies: int, large_dataset: bool = False, personalized: bool = True):
@@ -14,6 +15,8 @@ class SaveModel:
         self.user_tower_s3_path = paths.user_tower_model_path
         self.movie_tower_api_path = paths.movie_tower_model_api_path
         self.movie_tower_s3_path = paths.movie_tower_model_path
+        self.movie_tower_head_torchscript_api_path = paths.movie_tower_head_torchscript_api_path
+        self.movie_tower_head_onnx_api_path = paths.movie_tower_head_onnx_api_path
         self.movie_metadata_path = paths.movie_metadata_path
 
         if self.personalized:
@@ -50,6 +53,14 @@ class SaveModel:
             torch.save(movie_tower.state_dict(), self.movie_tower_api_path)
             #torch.save(movie_tower.state_dict(), self.movie_tower_s3_path)
 
+            # the projection head as a single inference graph, for the api's torchscript and
+            # onnx movie tower backends
+            export_movie_tower_head(
+                movie_tower,
+                self.movie_tower_head_torchscript_api_path,
+                self.movie_tower_head_onnx_api_path
+            )
+
     def _precompute_embeddings(self):
         with torch.no_grad(): # precompute all movie embeddings
             movie_indices = torch.arange(self.num_movies, dtype=torch.long, device="cuda")
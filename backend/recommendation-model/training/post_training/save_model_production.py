@@ -1,8 +1,10 @@
 import boto3
 import os
+import tempfile
 from datetime import datetime
 from utils.env_config import settings
-from shared.path_config import path_helper
+from shared.path_config import path_helper, movie_tower_head_torchscript_name, movie_tower_head_onnx_name
+from model.movie_tower import export_movie_tower_head
 import numpy as np
 import polars as pl
 from io import BytesIO
@@ -64,17 +66,35 @@ class SaveModelProd:
         print(f"Computed {len(movie_embeddings)} movie embeddings")
         return movie_embeddings
 
+    def _movie_embeddings_prefix(self) -> str:
+        if self.cold_start:
+            return self.s3_movie_embeddings_cold_start_prefix
+
+        return self.s3_movie_embeddings_collaborative_prefix
+
+    def _save_movie_ids_s3(self, metadata_df: pl.DataFrame):
+        """
+        Save the tmdbIds of the embedding rows, one per line in row order, next to the
+        embeddings so the database loader doesn't have to download the metadata CSV for them.
+        Uploaded before the .npy, whose upload triggers the load
+        """
+        buffer = BytesIO("\n".join(metadata_df["tmdbId"].cast(pl.Utf8).to_list()).encode())
+
+        s3_key = f"{self._movie_embeddings_prefix()}/movie_ids.txt"
+        self.s3_client.upload_fileobj(
+            buffer,
+            self.s3_bucket,
+            s3_key
+        )
+        print(f"Uploaded {len(metadata_df)} movie ids to s3://{self.s3_bucket}/{s3_key}")
+
     def _save_movie_embeddings_s3(self, embeddings: torch.tensor, file_name: str):
         """Save movie embeddings as .npy file to S3"""
         buffer = BytesIO()
         np.save(buffer, embeddings.cpu().numpy())
         buffer.seek(0)
 
-        if self.collaborative:
-            s3_key = f"{self.s3_movie_embeddings_collaborative_prefix}/{file_name}"
-        
-        if self.cold_start:
-            s3_key = f"{self.s3_movie_embeddings_cold_start_prefix}/{file_name}"
+        s3_key = f"{self._movie_embeddings_prefix()}/{file_name}"
 
         self.s3_client.upload_fileobj(
             buffer,
@@ -122,6 +142,23 @@ class SaveModelProd:
             print(f"Failed to upload {file_name}: {e}")
             raise
 
+    def _save_movie_tower_head_s3(self):
+        """Export the projection head of the movie tower being uploaded and upload it"""
+        if self.movie_tower is None:
+            raise ValueError("movie_tower required for the movie tower head export")
+
+        movie_tower = self.movie_tower._orig_mod if hasattr(self.movie_tower, '_orig_mod') else self.movie_tower
+
+        # exported here instead of uploaded from SaveModel's output, so the head always
+        # matches the movie_tower.pth of this upload
+        with tempfile.TemporaryDirectory() as export_dir:
+            torchscript_path = os.path.join(export_dir, movie_tower_head_torchscript_name)
+            onnx_path = os.path.join(export_dir, movie_tower_head_onnx_name)
+            export_movie_tower_head(movie_tower, torchscript_path, onnx_path)
+
+            self._save_model_file_s3(torchscript_path, movie_tower_head_torchscript_name)
+            self._save_model_file_s3(onnx_path, movie_tower_head_onnx_name)
+
     def _prepare_movie_metadata(self):
         """
         Prepare movie metadata DataFrames with Polars filtering.
@@ -175,6 +212,7 @@ class SaveModelProd:
         if self.collaborative:
             print("\n--- Saving Collaborative Filtering Artifacts ---")
             self._save_model_file_s3(movie_tower_file_path, "movie_tower.pth")
+            self._save_movie_tower_head_s3()
             self._save_model_file_s3(genre_mlb_path, "genre_mlb.joblib")
 
             # Precompute embeddings from movie tower
@@ -184,6 +222,7 @@ class SaveModelProd:
             metadata_df, rating_stats_df = self._prepare_movie_metadata()
 
             # Save to S3
+            self._save_movie_ids_s3(metadata_df)
             self._save_movie_embeddings_s3(embeddings, "movie_embeddings_collaborative.npy")
 
         if self.cold_start:
@@ -198,6 +237,7 @@ class SaveModelProd:
             metadata_df, rating_stats_df = self._prepare_movie_metadata()
 
             # Save to S3
+            self._save_movie_ids_s3(metadata_df)
             self._save_movie_embeddings_s3(embeddings, "movie_embeddings_coldstart.npy")
             self._save_dataframe_s3(metadata_df, "movie_metadata.csv")
             self._save_dataframe_s3(rating_stats_df, "movie_rating_stats.csv")
@@ -8,6 +8,8 @@ ENV_FILE = PROJECT_ROOT / ".env"
 
 user_tower_model_name: str = "user_tower.pth"
 movie_tower_model_name: str = "movie_tower.pth"
+movie_tower_head_torchscript_name: str = "movie_tower_head.pt"
+movie_tower_head_onnx_name: str = "movie_tower_head.onnx"
 reranker_model_name: str = "reranker-model.txt"
 genre_mlb_joblib: str = "genre_mlb.joblib"
 
@@ -93,6 +95,14 @@ class Paths(BaseSettings):
     def movie_tower_model_api_path(self) -> str:
         return str(self.api_model_dir / movie_tower_model_name)
 
+    @property
+    def movie_tower_head_torchscript_api_path(self) -> str:
+        return str(self.api_model_dir / movie_tower_head_torchscript_name)
+
+    @property
+    def movie_tower_head_onnx_api_path(self) -> str:
+        return str(self.api_model_dir / movie_tower_head_onnx_name)
+
     @property
     def reranker_model_api_path(self) -> str:
         return str(self.api_model_dir / reranker_model_name)
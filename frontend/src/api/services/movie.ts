@@ -53,13 +53,19 @@ export const MovieService = {
         }
     },
 
-    // get movie recommendations
-    getRecommendations: async({ user_id }: { user_id: string }) => {
+    // get a page of movie recommendations, starting at cursor (the first page without one)
+    // nextCursor is null on the last page
+    getRecommendations: async({ user_id, cursor }: { user_id: string, cursor?: string | null }) => {
         try {
-            const response = await recommendations_api.get(`recommendations/get/${user_id}`)
+            const response = await recommendations_api.get(`recommendations/get/${user_id}`, {
+                params: cursor ? { cursor: cursor } : undefined
+            })
 
             console.log(response)
-            return response.data
+            return {
+                recommendations: response.data,
+                nextCursor: response.headers['x-next-cursor'] ?? null
+            }
         } catch (error: unknown) {
             if (error instanceof AxiosError) {
                 console.error(error.response?.data || error.message);
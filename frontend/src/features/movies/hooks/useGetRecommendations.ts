@@ -1,10 +1,14 @@
 import { MovieService } from "@/api/services/movie";
 import { useQuery } from "@tanstack/react-query";
+import { useRef } from "react";
 
 const RECOMMENDATIONS_STORAGE_KEY = 'cached_recommendations'
 
 // custom hook for getting user movie recommendations
 export function useGetRecommendations(user_id: string) {
+    // cursor the next fetch starts at, null fetches the first page
+    const cursorRef = useRef<string | null>(null)
+
     const { data, isLoading, isError, refetch } = useQuery({
         queryKey: ['recommendations', user_id],
         queryFn: async () => {
@@ -15,7 +19,10 @@ export function useGetRecommendations(user_id: string) {
                     // return cached data if exists and was fetched in last 24 hours
                     const cacheAge = Date.now() - parsedCache.timestamp
                     if (cacheAge < 24 * 60 * 60 * 1000) {
-                        return parsedCache.data
+                        return {
+                            recommendations: parsedCache.data,
+                            nextCursor: parsedCache.nextCursor ?? null
+                        }
                     }
                 } catch (e) {
                     console.warn('Invalid cached recommendations, fetching fresh data');
@@ -24,11 +31,13 @@ export function useGetRecommendations(user_id: string) {
             }
 
             // fetch fresh data
-            const freshData = await MovieService.getRecommendations({ user_id })
+            const freshData = await MovieService.getRecommendations({ user_id, cursor: cursorRef.current })
+            cursorRef.current = null
 
             // store in localStorage
             localStorage.setItem(`${RECOMMENDATIONS_STORAGE_KEY}_${user_id}`, JSON.stringify({
-                data: freshData,
+                data: freshData.recommendations,
+                nextCursor: freshData.nextCursor,
                 timestamp: Date.now()
             }))
 
@@ -50,10 +59,18 @@ export function useGetRecommendations(user_id: string) {
         return await refetch()
     }
 
+    // next page of the same feed, only valid while the feed is unchanged (rating a movie
+    // drops it on the server), starts over once the feed runs out
+    const fetchNextRecommendations = async () => {
+        cursorRef.current = data?.nextCursor ?? null
+        return await refetchRecommendations()
+    }
+
     return {
-        recommendations: data,
+        recommendations: data?.recommendations,
         isAuthenticated: !!data && !isError,
         isLoading,
-        refetchRecommendations: refetchRecommendations
+        refetchRecommendations: refetchRecommendations,
+        fetchNextRecommendations: fetchNextRecommendations
     }
 }
\ No newline at end of file
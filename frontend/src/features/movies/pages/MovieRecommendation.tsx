@@ -22,7 +22,8 @@ const RecommendationPage = () => {
     const [ displayedMovie, setDisplayedMovie ] = useState<any>(null);
     const { user, isLoading: authLoading } = useAuth()
     const [ isRefetching, setIsRefetching ] = useState<boolean>(false)
-    const { recommendations = [], isLoading, refetchRecommendations } = useGetRecommendations(user?.user_id || '')
+    const { recommendations = [], isLoading, refetchRecommendations, fetchNextRecommendations } = useGetRecommendations(user?.user_id || '')
+    const [ ratedInBatch, setRatedInBatch ] = useState<boolean>(false)
     const { currentIndex, nextMovie, resetIndex } = useRecommendationIndex(user?.user_id)
     const { rateMovie, isLoading: isRating, isError: ratingError, isSuccess: ratingSuccess, reset } = useRateMovie()
 
@@ -52,6 +53,14 @@ const RecommendationPage = () => {
         }
     }, [isLoadingState, currentMovie, displayedMovie])
 
+    // a rating drops the user's feed on the server so the first page of the new one is the next
+    // batch, a batch that was only marked not seen continues the same feed from its cursor
+    async function loadNextBatch() {
+        const rated = ratedInBatch
+        setRatedInBatch(false)
+        return rated ? await refetchRecommendations() : await fetchNextRecommendations()
+    }
+
     // handle user rating movies
     async function handleMovieRated() {
         try {
@@ -62,10 +71,12 @@ const RecommendationPage = () => {
             if (currentIndex + 1 >= recommendations.length) {
                 setIsRefetching(true)
                 resetIndex() // reset to 0
+                setRatedInBatch(false)
                 await refetchRecommendations() // refetch new batch of 10 movies
                 setIsRefetching(false)
                 reset()
             } else {
+                setRatedInBatch(true)
                 nextMovie()
                 reset()
             }
@@ -174,7 +185,7 @@ const RecommendationPage = () => {
                                         recommendations={recommendations}
                                         setIsRefetching={setIsRefetching}
                                         resetIndex={resetIndex}
-                                        refetchRecommendations={refetchRecommendations}
+                                        refetchRecommendations={loadNextBatch}
                                         nextMovie={nextMovie} 
                                     />
                                     <RateMovieStars rating={rating} setRating={setRating} />
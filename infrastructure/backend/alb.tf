@@ -19,6 +19,8 @@ resource "aws_lb_target_group" "recommendation" {
     vpc_id                      = aws_vpc.main.id
     target_type                 = "ip"
 
+    # liveness only, with LAZY_MODEL_LOADING the task takes database only traffic before the
+    # models load and the model routes return 503 until /api/ready does
     health_check {
         path                    = "/api/health"
         healthy_threshold       = 2